@@ -0,0 +1,359 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from IPTables_Guide.model.headers import (
+    HeaderView,
+    PacketFields,
+    as_scapy,
+    scapy_fields,
+)
+from IPTables_Guide.model.predicates import (
+    Predicate,
+    Target,
+    compile_accept,
+    compile_action,
+    compile_condition,
+    compile_dnat,
+    compile_drop,
+    compile_snat,
+    compile_state,
+    parse_network,
+)
+from IPTables_Guide.model.prefix_trie import PrefixTrie
+from IPTables_Guide.model.parser_entries import (
+    check_destination_ip,
+    check_source_ip,
+    check_tcp,
+    check_tcp_dport,
+    check_tcp_src_port,
+    check_udp,
+    check_udp_dport,
+    check_udp_src_port,
+)
+
+PROTOCOL_CHECKS = {check_tcp: "tcp", check_udp: "udp"}
+# targets that take header views
+VIEW_TARGETS = [compile_accept, compile_drop, compile_snat, compile_dnat]
+# condition method -> (protocol, field)
+PORT_CHECKS = {
+    check_tcp_src_port: ("tcp", "sport"),
+    check_tcp_dport: ("tcp", "dport"),
+    check_udp_src_port: ("udp", "sport"),
+    check_udp_dport: ("udp", "dport"),
+}
+ADDRESS_CHECKS = {check_source_ip: "src", check_destination_ip: "dst"}
+
+
+def packet_fields(packet: Any) -> PacketFields:
+    if isinstance(packet, HeaderView):
+        return packet.fields
+    return scapy_fields(packet)
+
+
+class CompiledRule(NamedTuple):
+    index: int
+    # (prefix length, network as integer), None if not matched on
+    src: Optional[Tuple[int, int]]
+    dst: Optional[Tuple[int, int]]
+    protocol: Optional[str]
+    sport: Optional[int]
+    dport: Optional[int]
+    # conditions the index does not cover, in the order the rule checks
+    # them, and the indexes of the components they were compiled from
+    residual: List[Predicate]
+    residual_positions: List[int]
+    # None for rules without a target, they only count the packets they
+    # match, which go on to the next rule
+    target: Optional[Target]
+    # the target's component
+    action: Any
+
+    @property
+    def rewrites(self) -> bool:
+        """
+        Whether the target may change the packet
+        """
+        return self.action.get("compile_method") not in [compile_accept, compile_drop]
+
+    def residual_met(self, packet: Any) -> bool:
+        for predicate in self.residual:
+            if not predicate(as_scapy(packet)):
+                return False
+        return True
+
+    def run_target(self, packet: Any) -> Any:
+        """
+        ACCEPT/DROP work on header views too, SNAT/DNAT patch their bytes,
+        other targets get the scapy packet
+        """
+        if self.action.get("compile_method") in VIEW_TARGETS:
+            return self.target(packet)
+        return self.target(as_scapy(packet))
+
+
+class _Impossible(Exception):
+    """
+    The rule can not match any packet
+    """
+
+
+def _ipv4_prefix(value: str) -> Optional[Tuple[int, int]]:
+    """
+    None for networks the index does not handle (IPv6)
+    """
+    try:
+        network = parse_network(value)
+    except ValueError:
+        raise _Impossible()
+    if network.version != 4:
+        return None
+    return network.prefixlen, int(network.network_address)
+
+
+def compile_rule(index: int, rule: Any) -> Optional[CompiledRule]:
+    """
+    None if the rule never matches a packet: its conditions contradict
+    each other
+    """
+    fields: Dict[str, Any] = {
+        "src": None,
+        "dst": None,
+        "protocol": None,
+        "sport": None,
+        "dport": None,
+    }
+    residual = []
+    residual_positions = []
+    target = None
+    action = None
+
+    def constrain(field: str, value: Any) -> bool:
+        if fields[field] is None:
+            fields[field] = value
+            return True
+        if fields[field] != value and field == "protocol":
+            raise _Impossible()
+        return False
+
+    try:
+        for position, component in enumerate(rule.components):
+            kind = component.get("type")
+            if kind == "action":
+                target = compile_action(component)
+                action = component
+                continue
+            if kind != "condition":
+                continue
+            method = component.get("condition_method")
+            value = component.get("value", "")
+            if method in PROTOCOL_CHECKS:
+                constrain("protocol", PROTOCOL_CHECKS[method])
+                continue
+            if method in PORT_CHECKS:
+                protocol, field = PORT_CHECKS[method]
+                constrain("protocol", protocol)
+                try:
+                    port = int(value)
+                except ValueError:
+                    raise _Impossible()
+                if constrain(field, port):
+                    continue
+            elif method in ADDRESS_CHECKS:
+                prefix = _ipv4_prefix(value)
+                if prefix is not None and constrain(ADDRESS_CHECKS[method], prefix):
+                    continue
+            residual.append(compile_condition(component))
+            residual_positions.append(position)
+    except _Impossible:
+        return None
+    order = rule.condition_order
+    if order is not None:
+        checked = sorted(
+            zip(residual_positions, residual), key=lambda pair: order.index(pair[0])
+        )
+        residual_positions = [position for position, _ in checked]
+        residual = [predicate for _, predicate in checked]
+    return CompiledRule(
+        index,
+        fields["src"],
+        fields["dst"],
+        fields["protocol"],
+        fields["sport"],
+        fields["dport"],
+        residual,
+        residual_positions,
+        target,
+        action,
+    )
+
+
+class _ExactIndex:
+    """
+    Rules by the value they require in a field
+    """
+
+    def __init__(self):
+        # rules not matching on the field
+        self.any = 0
+        self.by_value: Dict[Any, int] = {}
+
+    def add(self, value: Any, bit: int) -> None:
+        if value is None:
+            self.any |= bit
+        else:
+            self.by_value[value] = self.by_value.get(value, 0) | bit
+
+    def match(self, value: Any) -> int:
+        return self.any | self.by_value.get(value, 0)
+
+
+class _PrefixIndex:
+    """
+    Rules by the network an address field has to be in
+    """
+
+    def __init__(self):
+        self.any = 0
+        self.trie = PrefixTrie()
+
+    def add(self, prefix: Optional[Tuple[int, int]], bit: int) -> None:
+        if prefix is None:
+            self.any |= bit
+        else:
+            self.trie.insert(prefix[0], prefix[1], bit)
+
+    def match(self, address: Optional[int]) -> int:
+        if address is None:
+            return self.any
+        return self.any | self.trie.lookup(address)
+
+
+class ChainClassifier:
+    """
+    First-match lookup over the rules of a chain
+
+    Every indexed field maps the packet's value to the bitset of rules
+    (bit i for the i-th rule) it satisfies, addresses through a prefix
+    trie, the other fields through a dictionary. The rules matching every
+    field are the intersection of these, the lowest set bit is the first
+    rule in chain order, so the result is the same as trying the rules
+    one by one.
+    """
+
+    def __init__(self, rules: List[Any]):
+        self.rules = rules
+        self._compiled: Dict[int, CompiledRule] = {}
+        self._protocol = _ExactIndex()
+        self._sport = _ExactIndex()
+        self._dport = _ExactIndex()
+        self._src = _PrefixIndex()
+        self._dst = _PrefixIndex()
+        for index, rule in enumerate(rules):
+            compiled = compile_rule(index, rule)
+            if compiled is None:
+                continue
+            bit = 1 << index
+            self._compiled[index] = compiled
+            self._protocol.add(compiled.protocol, bit)
+            self._sport.add(compiled.sport, bit)
+            self._dport.add(compiled.dport, bit)
+            self._src.add(compiled.src, bit)
+            self._dst.add(compiled.dst, bit)
+        self._src.trie.build()
+        self._dst.trie.build()
+
+    @property
+    def compiled_rules(self) -> List[CompiledRule]:
+        """
+        The rules that can match a packet, in chain order, those without a
+        target only count it
+        """
+        return list(self._compiled.values())
+
+    def inspected_fields(self) -> Optional[Tuple[str, ...]]:
+        """
+        The fields (of PacketFields, and "ct_state") the decisions of the
+        chain depend on, None if a condition looks at more than these
+        """
+        names = set()
+        for rule in self._compiled.values():
+            for name in PacketFields._fields:
+                if getattr(rule, name) is not None:
+                    names.add(name)
+            components = self.rules[rule.index].components
+            for position in rule.residual_positions:
+                component = components[position]
+                method = component.get("condition_method")
+                if component.get("compile_method") is compile_state:
+                    names.add("ct_state")
+                elif method in ADDRESS_CHECKS:
+                    names.add(ADDRESS_CHECKS[method])
+                else:
+                    return None
+        return tuple(
+            name for name in PacketFields._fields + ("ct_state",) if name in names
+        )
+
+    def candidates(self, fields: PacketFields) -> int:
+        """
+        Bitset of the rules whose indexed conditions the packet meets
+        """
+        return (
+            self._protocol.match(fields.protocol)
+            & self._dport.match(fields.dport)
+            & self._sport.match(fields.sport)
+            & self._src.match(fields.src)
+            & self._dst.match(fields.dst)
+        )
+
+    def first_match(
+        self,
+        packet: Any,
+        fields: PacketFields,
+        start: int = 0,
+        matched: Optional[List[int]] = None,
+    ) -> Optional[CompiledRule]:
+        """
+        The first rule with a target the packet matches, the rules without
+        one it matches on the way are added to matched, if given
+        """
+        candidates = self.candidates(fields) >> start << start
+        while candidates:
+            lowest = candidates & -candidates
+            rule = self._compiled[lowest.bit_length() - 1]
+            if rule.residual_met(packet):
+                if rule.target is not None:
+                    return rule
+                if matched is not None:
+                    matched.append(rule.index)
+            candidates ^= lowest
+        return None
+
+    def decide(
+        self, packet: Any, start: int = 0, matched: Optional[List[int]] = None
+    ) -> Tuple[Optional[CompiledRule], Optional[Any]]:
+        """
+        The first rule (from the start-th one) whose target returned
+        something and what it returned, (None, None) if the chain policy
+        applies
+
+        The other rules the packet matched on the way, the ones without a
+        target and the ones whose target gave up on it, are added to
+        matched, if given.
+        """
+        fields = packet_fields(packet)
+        while True:
+            rule = self.first_match(packet, fields, start, matched)
+            if rule is None:
+                return None, None
+            result = rule.run_target(packet)
+            if result:
+                return rule, result
+            if matched is not None:
+                matched.append(rule.index)
+            # the target may have rewritten the packet before giving up on it
+            packet = as_scapy(packet)
+            fields = packet_fields(packet)
+            start = rule.index + 1
+
+    def run_on_packet(self, packet: Any, start: int = 0) -> Optional[Any]:
+        return self.decide(packet, start)[1]
@@ -0,0 +1,176 @@
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from IPTables_Guide.model.components import Component
+from IPTables_Guide.model.rule_generator import (
+    ChainComponent,
+    CommandComponent,
+    IncrementalRuleParser,
+    RuleSpecification,
+    SignatureGrammar,
+    StartComponent,
+    TableComponent,
+)
+
+
+class CompletionEntry(NamedTuple):
+    text: str
+    explanation: str
+    # signature part offering it
+    part: int
+    template: int
+    # one of these templates has to be in the rule already (e.g. "-p tcp")
+    requires: FrozenSet[int]
+    # chains are only offered for their tables
+    tables: Optional[List[str]]
+
+
+def _prefix_entries(part) -> List[Any]:
+    if isinstance(part, StartComponent):
+        return list(part.start_strs.items())
+    if isinstance(part, TableComponent):
+        return list(part.possible_tables.items())
+    if isinstance(part, CommandComponent):
+        return list(part.possible_commands.items())
+    if isinstance(part, ChainComponent):
+        return list(part.possible_chains.items())
+    return []
+
+
+def _spec_entries(parser) -> List[Any]:
+    """
+    (text, template, required templates) for what a spec parser accepts
+    """
+    if hasattr(parser, "possible_options"):
+        starts = frozenset(id(template) for template in parser.start_string.values())
+        return [
+            (text, template, frozenset())
+            for text, template in parser.start_string.items()
+        ] + [(option["str_form"], option, starts) for option in parser.possible_options]
+    if hasattr(parser, "actions"):
+        return [
+            (text, template, frozenset())
+            for template in parser.actions.values()
+            for text in [template["str_form"]] + template["forms"]
+        ]
+    if hasattr(parser, "possible_states"):
+        return [
+            ("{} {}".format(parser.start_string, state), parser.repr_dict, frozenset())
+            for state in parser.possible_states
+        ]
+    if hasattr(parser, "start_strings"):
+        return [(text, parser.repr_dict, frozenset()) for text in parser.start_strings]
+    return []
+
+
+class CompletionIndex:
+    """
+    Ranked completions for the element being typed
+
+    Every string the signature components accept is indexed by all of its
+    prefixes up front, a lookup is a dictionary access filtered by the
+    parts the rule can continue with.
+    """
+
+    def __init__(self, grammar: SignatureGrammar, table: str = "", chain: str = ""):
+        self.parser = IncrementalRuleParser(grammar, table, chain)
+        self.entries: List[CompletionEntry] = []
+        self._signature_parts: List[List[int]] = []
+        self._signature_templates: List[Set[int]] = []
+        self._part_templates: Dict[int, Set[int]] = {}
+        self._prefix_parts: Set[int] = set()
+        for signature in grammar.signatures:
+            parts = []
+            for part in signature:
+                if id(part) not in self._part_templates:
+                    self._index_part(part)
+                parts.append(id(part))
+            self._signature_parts.append(parts)
+            self._signature_templates.append(
+                set().union(*[self._part_templates[part] for part in parts])
+            )
+        self._by_prefix: Dict[str, List[int]] = {}
+        for i, entry in enumerate(self.entries):
+            for end in range(len(entry.text) + 1):
+                self._by_prefix.setdefault(entry.text[:end], []).append(i)
+
+    def _index_part(self, part) -> None:
+        templates = set()
+        if isinstance(part, RuleSpecification):
+            for parser in part.possible_components:
+                for text, template, requires in _spec_entries(parser):
+                    templates.add(id(template))
+                    self._add_entry(text, template, part, requires)
+        else:
+            self._prefix_parts.add(id(part))
+            for text, template in _prefix_entries(part):
+                templates.add(id(template))
+                self._add_entry(text, template, part, frozenset())
+        self._part_templates[id(part)] = templates
+
+    def _add_entry(self, text: str, template, part, requires) -> None:
+        self.entries.append(
+            CompletionEntry(
+                text,
+                template.get("explanation", ""),
+                id(part),
+                id(template),
+                requires,
+                template.get("tables") if isinstance(part, ChainComponent) else None,
+            )
+        )
+
+    def _open_parts(self, used: Set[int]) -> Set[int]:
+        """
+        Parts the rule can continue with in the signatures it still fits
+        """
+        open_parts: Set[int] = set()
+        for parts, templates in zip(self._signature_parts, self._signature_templates):
+            if not used <= templates:
+                continue
+            last_used = -1
+            for i, part in enumerate(parts):
+                if self._part_templates[part] & used:
+                    last_used = i
+            for part in parts[last_used + 1 :]:
+                open_parts.add(part)
+                if part in self._prefix_parts:
+                    break
+            if last_used >= 0 and parts[last_used] not in self._prefix_parts:
+                open_parts.add(parts[last_used])
+        return open_parts
+
+    def complete(self, text: str, limit: Optional[int] = None) -> List[CompletionEntry]:
+        """
+        The completions of the element being typed, best first: the one
+        typed out in full, then the ones the query covers more of, then in
+        signature order
+        """
+        tokens = text.split(" ")
+        committed = " ".join(tokens[:-1])
+        rule, result = self.parser.parse(committed)
+        query = " ".join(result.remaining + tokens[-1:]) if committed else tokens[-1]
+        used = {
+            id(component.template)
+            if isinstance(component, Component)
+            else id(component)
+            for component in rule.components
+        }
+        open_parts = self._open_parts(used)
+        ranked: List[Tuple[Tuple[bool, int, int], CompletionEntry]] = []
+        seen: Set[str] = set()
+        for i in self._by_prefix.get(query, []):
+            entry = self.entries[i]
+            if (
+                entry.part not in open_parts
+                or entry.template in used
+                or entry.text in seen
+                or (entry.requires and not entry.requires & used)
+                or (entry.tables is not None and rule.table.lower() not in entry.tables)
+            ):
+                continue
+            seen.add(entry.text)
+            # entries are indexed in the order of the signature parts
+            rank = (entry.text != query, len(entry.text), i)
+            ranked.append((rank, entry))
+        ranked.sort(key=lambda item: item[0])
+        return [entry for _, entry in ranked[:limit]]
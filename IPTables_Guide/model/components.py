@@ -0,0 +1,69 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+
+class Component(Mapping):
+    """
+    Parsed element of a rule
+
+    Reads like the option table entry (template) it was parsed from, the
+    template with the explanation, str_form and condition/action method is
+    shared by every rule, an instance only stores the rule's own value and
+    str_form if the rule spelled the option differently.
+
+    Components are read-only so rules can share them, use with_value to
+    change the value.
+    """
+
+    __slots__ = ("template", "_value", "_str_form")
+
+    def __init__(
+        self,
+        template: Dict[str, Any],
+        value: Any = None,
+        str_form: Optional[str] = None,
+    ):
+        self.template = template
+        self._value = value
+        self._str_form = str_form
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "value" and self._value is not None:
+            return self._value
+        if key == "str_form":
+            if self._str_form is not None:
+                return self._str_form
+            if self._value is not None and "value" not in self.template:
+                return "{} {}".format(self.template["str_form"], self._value)
+        return self.template[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.template
+        if self._value is not None and "value" not in self.template:
+            yield "value"
+
+    def __len__(self) -> int:
+        return len(self.template) + (
+            self._value is not None and "value" not in self.template
+        )
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def with_value(self, value: Any) -> "Component":
+        return Component(self.template, value, self._str_form)
+
+    def copy(self) -> "Component":
+        return self
+
+
+def make_component(
+    template: Dict[str, Any], value: Any = None, str_form: Optional[str] = None
+) -> Component:
+    """
+    Keeps str_form only if it differs from the one derived from the template
+    """
+    component = Component(template, value)
+    if str_form is not None and str_form != component["str_form"]:
+        component = Component(template, value, str_form)
+    return component
@@ -0,0 +1,100 @@
+import math
+from typing import Any, Iterable, List, Optional
+
+from IPTables_Guide.model.headers import as_scapy
+from IPTables_Guide.model.predicates import condition_positions
+from IPTables_Guide.model.profiling import Profiler, RuleProfile, Timing
+
+# checks of a condition below which its measurements are left alone
+MIN_CALLS = 16
+
+
+def condition_rank(timing: Timing) -> float:
+    """
+    Expected cost of the condition per packet it rejects, checking the
+    conditions of a rule by increasing rank minimises the expected cost
+    of the rule when they are independent
+    """
+    rejected = 1 - timing.selectivity
+    if rejected <= 0:
+        return math.inf
+    return timing.mean_ns / rejected
+
+
+def choose_order(
+    rule: Any, profile: RuleProfile, min_calls: int = MIN_CALLS
+) -> Optional[List[int]]:
+    """
+    The order the rule should check its conditions in (see
+    Rule.condition_order), None if the measurements do not change it
+
+    Only the conditions checked at least min_calls times are moved, among
+    the places they take in the current order. The ranks assume each
+    condition was measured on all packets (see sample_conditions), in a
+    chain run the later conditions of a rule only see the packets the
+    earlier ones passed.
+    """
+    current = rule.condition_order
+    if current is None:
+        current = condition_positions(rule.components)
+    measured = [
+        position
+        for position in current
+        if position in profile.conditions
+        and profile.conditions[position].calls >= min_calls
+    ]
+    ranked = iter(
+        sorted(
+            measured, key=lambda position: condition_rank(profile.conditions[position])
+        )
+    )
+    moved = set(measured)
+    order = [next(ranked) if position in moved else position for position in current]
+    if order == current:
+        return None
+    return order
+
+
+def sample_conditions(
+    rules: List[Any],
+    packets: Iterable[Any],
+    profiler: Optional[Profiler] = None,
+) -> Profiler:
+    """
+    Checks every condition of every rule against every packet, profiled,
+    so rules the packets never reach in a chain run are measured too and
+    every condition of a rule on the same packets (see
+    Profiler.check_conditions), the targets are not run
+    """
+    if profiler is None:
+        profiler = Profiler()
+    for packet in packets:
+        packet = as_scapy(packet)
+        for index, rule in enumerate(rules):
+            profiler.check_conditions(rule, packet, index, exhaustive=True)
+    return profiler
+
+
+def optimize_condition_order(
+    rules: List[Any],
+    profiler: Profiler,
+    table: str,
+    chain: str,
+    min_calls: int = MIN_CALLS,
+) -> int:
+    """
+    Reorders the conditions of the rules of a chain by what the profiler
+    measured (see choose_order), returns how many rules changed
+    """
+    changed = 0
+    for index, rule in enumerate(rules):
+        profile = profiler.rules.get(
+            (table.upper(), chain.upper(), index, rule.raw_form)
+        )
+        if profile is None:
+            continue
+        order = choose_order(rule, profile, min_calls)
+        if order is not None:
+            rule.set_condition_order(order)
+            changed += 1
+    return changed
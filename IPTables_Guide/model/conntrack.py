@@ -0,0 +1,293 @@
+import heapq
+import itertools
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import scapy.all as all
+
+from IPTables_Guide.model.classifier import packet_fields
+from IPTables_Guide.model.headers import HeaderView, as_scapy
+from IPTables_Guide.model.predicates import compile_state, ip_to_int
+
+STATE_NEW = "NEW"
+STATE_ESTABLISHED = "ESTABLISHED"
+STATE_RELATED = "RELATED"
+STATE_INVALID = "INVALID"
+
+# seconds, netfilter's defaults
+DEFAULT_TIMEOUTS = {
+    "tcp_unreplied": 120,
+    "tcp_established": 432000,
+    "tcp_fin": 120,
+    "tcp_close": 10,
+    "udp_unreplied": 30,
+    "udp_replied": 120,
+    "generic": 600,
+}
+
+# netfilter's nf_conntrack_max on small machines
+DEFAULT_MAX_CONNECTIONS = 65536
+
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+ICMP_ERRORS = [3, 4, 5, 11, 12]
+
+# (address, port) of one end of a connection, ports are 0 for protocols
+# without them
+Endpoint = Tuple[int, int]
+# (protocol or None, source, destination) of one direction
+FlowTuple = Tuple[Optional[str], Endpoint, Endpoint]
+
+
+class Connection:
+    __slots__ = (
+        "original",
+        "reply",
+        "nat",
+        "replied",
+        "fins",
+        "reset",
+        "expires",
+        "scheduled",
+        "entry",
+    )
+
+    def __init__(self, original: FlowTuple):
+        # the packet that opened the connection, and what its replies look
+        # like, the reverse of the original unless NAT changed it
+        self.original = original
+        self.reply: FlowTuple = (original[0], original[2], original[1])
+        # nat hook -> (source, destination) the binding rewrites the
+        # original direction to, None if the nat chain left it alone
+        self.nat: Dict[str, Optional[Tuple[Endpoint, Endpoint]]] = {}
+        self.replied = False
+        # directions a FIN was seen in
+        self.fins = 0
+        self.reset = False
+        self.expires = 0.0
+        # expiry and order number of the connection's live heap entry
+        self.scheduled: Optional[float] = None
+        self.entry: Optional[int] = None
+
+
+def packet_time(packet: Any) -> float:
+    if isinstance(packet, HeaderView):
+        return packet.time
+    return float(packet.time)
+
+
+def set_state(packet: Any, state: Optional[str]) -> None:
+    packet.ct_state = state
+    if isinstance(packet, HeaderView) and packet.dissected:
+        packet.packet.ct_state = state
+
+
+def uses_state(rules: Iterable[Any]) -> bool:
+    """
+    Whether any of the rules has a --state condition
+    """
+    for rule in rules:
+        for component in rule.components:
+            if component.get("compile_method") is compile_state:
+                return True
+    return False
+
+
+class ConnectionTracker:
+    """
+    Follows the TCP/UDP flows (and, per address pair, any other IPv4
+    traffic) of a capture, and stamps every packet with its --state
+
+    Connections are found by the 5-tuple of either direction, the reply
+    one as NAT left it (see translate), and expire by the
+    capture's timestamps, with per protocol timeouts. A heap orders the
+    connections by when they were last known to expire: refreshing a
+    connection only moves its expiry, its heap entry is pushed back when it
+    comes up early. Only a shorter timeout (a FIN, a RST) pushes a new
+    entry, the old one is skipped when it comes up. When max_connections
+    are tracked the one that expires first is dropped to make room.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        timeouts: Optional[Dict[str, float]] = None,
+    ):
+        self.max_connections = max_connections
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        # both tuples of every connection
+        self._connections: Dict[FlowTuple, Connection] = {}
+        self._count = 0
+        self._expiries: List[Tuple[float, int, Connection]] = []
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _schedule(self, connection: Connection) -> None:
+        connection.scheduled = connection.expires
+        connection.entry = next(self._order)
+        heapq.heappush(
+            self._expiries, (connection.expires, connection.entry, connection)
+        )
+
+    def _pop_expired(self, now: Optional[float]) -> bool:
+        """
+        Forgets the connection that expires first, if it did by now (or
+        unconditionally for None), False if none did
+        """
+        while self._expiries:
+            expires, entry, connection = self._expiries[0]
+            if now is not None and expires > now:
+                return False
+            heapq.heappop(self._expiries)
+            if entry != connection.entry:
+                # replaced by a later entry
+                continue
+            if connection.expires > expires and (
+                now is None or connection.expires > now
+            ):
+                # refreshed since it was scheduled
+                self._schedule(connection)
+                continue
+            self._forget(connection)
+            return True
+        return False
+
+    def _forget(self, connection: Connection) -> None:
+        for flow in [connection.original, connection.reply]:
+            if self._connections.get(flow) is connection:
+                del self._connections[flow]
+        self._count -= 1
+
+    def translate(
+        self, connection: Connection, source: Endpoint, destination: Endpoint
+    ) -> None:
+        """
+        NAT rewrote the original direction of the connection to source ->
+        destination, its replies come back the other way
+        """
+        if self._connections.get(connection.reply) is connection:
+            del self._connections[connection.reply]
+        connection.reply = (connection.original[0], destination, source)
+        self._connections.setdefault(connection.reply, connection)
+
+    def expire(self, now: float) -> None:
+        while self._pop_expired(now):
+            pass
+
+    def _timeout(self, protocol: Optional[str], connection: Connection) -> float:
+        if protocol == "tcp":
+            if connection.reset:
+                return self.timeouts["tcp_close"]
+            if connection.fins:
+                return self.timeouts["tcp_fin"]
+            if connection.replied:
+                return self.timeouts["tcp_established"]
+            return self.timeouts["tcp_unreplied"]
+        if protocol == "udp":
+            if connection.replied:
+                return self.timeouts["udp_replied"]
+            return self.timeouts["udp_unreplied"]
+        return self.timeouts["generic"]
+
+    def _related(self, packet: Any) -> Optional[str]:
+        """
+        The state of an ICMP error, None for other packets
+        """
+        packet = as_scapy(packet)
+        icmp = packet.getlayer(all.ICMP)
+        if icmp is None or icmp.type not in ICMP_ERRORS:
+            return None
+        inner = packet.getlayer(all.IPerror)
+        if inner is None:
+            return STATE_INVALID
+        protocol = None
+        ports = (0, 0)
+        for name, layer in [("tcp", all.TCPerror), ("udp", all.UDPerror)]:
+            header = packet.getlayer(layer)
+            if header is not None:
+                protocol = name
+                ports = (header.sport, header.dport)
+        flow = (
+            protocol,
+            (ip_to_int(inner.src), ports[0]),
+            (ip_to_int(inner.dst), ports[1]),
+        )
+        if flow in self._connections:
+            return STATE_RELATED
+        return STATE_INVALID
+
+    def track(self, packet: Any) -> Optional[str]:
+        """
+        Updates the connection of the packet and stamps it with its state,
+        None for packets without an IPv4 header
+        """
+        return self.follow(packet)[0]
+
+    def follow(self, packet: Any) -> Tuple[Optional[str], Optional[Connection], bool]:
+        """
+        track, also telling the connection of the packet (None for
+        untracked packets) and whether the packet is a reply
+        """
+        fields = packet_fields(packet)
+        if fields.src is None:
+            set_state(packet, None)
+            return None, None, False
+        now = packet_time(packet)
+        self.expire(now)
+        protocol = fields.protocol
+        flags = 0
+        if protocol is None:
+            state = self._related(packet)
+            if state is not None:
+                set_state(packet, state)
+                return state, None, False
+        elif protocol == "tcp":
+            if isinstance(packet, HeaderView):
+                flags = packet.tcp_flags
+            else:
+                flags = int(packet[all.TCP].flags)
+        flow = (
+            protocol,
+            (fields.src, fields.sport or 0),
+            (fields.dst, fields.dport or 0),
+        )
+        connection = self._connections.get(flow)
+        reply = False
+        if connection is None:
+            if flags & TCP_RST:
+                set_state(packet, STATE_INVALID)
+                return STATE_INVALID, None, False
+            if self._count >= self.max_connections:
+                self._pop_expired(None)
+            connection = Connection(flow)
+            self._connections[connection.original] = connection
+            self._connections.setdefault(connection.reply, connection)
+            self._count += 1
+            state = STATE_NEW
+        elif flow == connection.original:
+            state = STATE_ESTABLISHED if connection.replied else STATE_NEW
+        else:
+            reply = True
+            connection.replied = True
+            state = STATE_ESTABLISHED
+        if flags & TCP_RST:
+            connection.reset = True
+        if flags & TCP_FIN:
+            connection.fins |= 2 if reply else 1
+        connection.expires = now + self._timeout(protocol, connection)
+        if connection.scheduled is None or connection.expires < connection.scheduled:
+            self._schedule(connection)
+        set_state(packet, state)
+        return state, connection, reply
+
+    def track_all(self, packets: Iterable[Any]) -> Iterator[Any]:
+        """
+        The packets, each tracked as it is taken
+        """
+        for packet in packets:
+            self.track(packet)
+            yield packet
@@ -0,0 +1,200 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from IPTables_Guide.model.classifier import ChainClassifier
+from IPTables_Guide.model.conntrack import ConnectionTracker
+from IPTables_Guide.model.headers import (
+    LINKTYPE_ETHERNET,
+    HeaderView,
+    as_scapy,
+    packet_length,
+)
+from IPTables_Guide.model.packets import Packet
+from IPTables_Guide.model.vectorized import (
+    VERDICT_ACCEPT,
+    VERDICT_POLICY,
+    evaluate_stream,
+)
+
+
+@dataclass
+class ChainStatistics:
+    """
+    What a run did in a chain, counted locally and added to the rule
+    counters once the run is over (see RuleSystem.apply_statistics)
+    """
+
+    packets: int = 0
+    bytes: int = 0
+    passed: int = 0
+    # packets and bytes each rule matched, by the rule's index in the chain,
+    # like iptables -v every rule on a packet's path is counted, not only
+    # the one that decided it
+    rule_packets: Dict[int, int] = field(default_factory=dict)
+    rule_bytes: Dict[int, int] = field(default_factory=dict)
+    # packets and bytes the chain policy decided
+    policy_packets: int = 0
+    policy_bytes: int = 0
+    # lookups of the verdict cache, if the run had one (see verdict_cache)
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    def count(
+        self,
+        rule_index: int,
+        passed: bool,
+        length: int = 0,
+        matched: Iterable[int] = (),
+    ) -> None:
+        """
+        Counts a packet the rule_index-th rule decided (the policy if
+        negative), matched are the other rules it matched before
+        """
+        self.packets += 1
+        self.bytes += length
+        self.passed += passed
+        if rule_index < 0:
+            self.policy_packets += 1
+            self.policy_bytes += length
+        else:
+            self._count_rule(rule_index, length)
+        for index in matched:
+            self._count_rule(index, length)
+
+    def _count_rule(self, index: int, length: int) -> None:
+        self.rule_packets[index] = self.rule_packets.get(index, 0) + 1
+        self.rule_bytes[index] = self.rule_bytes.get(index, 0) + length
+
+    def merge(self, other: "ChainStatistics") -> None:
+        self.packets += other.packets
+        self.bytes += other.bytes
+        self.passed += other.passed
+        self.policy_packets += other.policy_packets
+        self.policy_bytes += other.policy_bytes
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        for index, packets in other.rule_packets.items():
+            self.rule_packets[index] = self.rule_packets.get(index, 0) + packets
+        for index, length in other.rule_bytes.items():
+            self.rule_bytes[index] = self.rule_bytes.get(index, 0) + length
+
+
+class Verdict(NamedTuple):
+    """
+    What a chain decided for one packet
+    """
+
+    # ACCEPT or DROP
+    verdict: str
+    # index of the deciding rule in the chain, None for the policy
+    rule_index: Optional[int]
+    # the packet as the targets left it, None if it was dropped
+    packet: Optional[Any]
+
+
+def verdict(rule_index: Optional[int], packet: Optional[Any]) -> Verdict:
+    return Verdict("DROP" if packet is None else "ACCEPT", rule_index, packet)
+
+
+def input_packet(packet: Any, linktype: int = LINKTYPE_ETHERNET) -> Any:
+    """
+    A packet the chains evaluate: raw frames of the linktype become header
+    views, model Packets their scapy packet, scapy packets and header
+    views are taken as they are
+    """
+    if isinstance(packet, (bytes, bytearray, memoryview)):
+        return HeaderView(bytes(packet), linktype)
+    if isinstance(packet, Packet):
+        return packet.get_scapy_packet()
+    return packet
+
+
+def output_packet(packet: Optional[Any], given: Any) -> Optional[Any]:
+    """
+    The packet a chain left, as the type the packet was given as (see
+    input_packet): bytes for raw frames, a model Packet for model Packets,
+    header views stay header views and scapy packets scapy packets
+    """
+    if packet is None or isinstance(given, HeaderView):
+        return packet
+    if isinstance(given, (bytes, bytearray, memoryview)):
+        if isinstance(packet, HeaderView):
+            return bytes(packet.packet) if packet.rewritten else packet.data
+        return bytes(packet)
+    packet = as_scapy(packet)
+    if isinstance(given, Packet):
+        return given if packet is given.get_scapy_packet() else Packet(packet)
+    return packet
+
+
+def evaluate_capture(
+    classifier: ChainClassifier,
+    packets: Iterable[Any],
+    policy_accepts: bool,
+    statistics: Optional[ChainStatistics] = None,
+    vectorized: bool = False,
+    tracker: Optional[ConnectionTracker] = None,
+) -> Iterator[Any]:
+    """
+    The packets that make it through the chain, as the targets left them,
+    in capture order: header views stay header views, to be written as
+    they were read unless a target rewrote them (see capture_record)
+
+    See decide_capture for the arguments.
+    """
+    for result in decide_capture(
+        classifier, packets, policy_accepts, statistics, vectorized, tracker
+    ):
+        if result.packet is not None:
+            yield result.packet
+
+
+def decide_capture(
+    classifier: ChainClassifier,
+    packets: Iterable[Any],
+    policy_accepts: bool,
+    statistics: Optional[ChainStatistics] = None,
+    vectorized: bool = False,
+    tracker: Optional[ConnectionTracker] = None,
+) -> Iterator[Verdict]:
+    """
+    The verdict of the chain on every packet, in capture order
+
+    vectorized evaluates the chain rule by rule over header columns of
+    chunks of the capture, worth it for large captures. The tracker, if
+    given, stamps the packets with their --state first.
+    """
+    if statistics is None:
+        statistics = ChainStatistics()
+    if tracker is not None:
+        packets = tracker.track_all(packets)
+    if vectorized:
+        for packet, rule_index, decision, result, matched in evaluate_stream(
+            classifier, packets
+        ):
+            passed = decision == VERDICT_ACCEPT or (
+                decision == VERDICT_POLICY and policy_accepts
+            )
+            statistics.count(rule_index, passed, packet_length(packet), matched)
+            if not passed:
+                result = None
+            elif not result:
+                result = packet
+            yield verdict(None if rule_index < 0 else rule_index, result)
+        return
+    for packet in packets:
+        length = packet_length(packet)
+        matched: List[int] = []
+        rule, result = classifier.decide(packet, 0, matched)
+        if rule is None:
+            statistics.count(-1, policy_accepts, length, matched)
+            yield verdict(None, packet if policy_accepts else None)
+            continue
+        passed = result != "DROP"
+        statistics.count(rule.index, passed, length, matched)
+        yield verdict(rule.index, result if passed else None)
@@ -0,0 +1,259 @@
+import struct
+from decimal import Decimal
+from typing import Any, NamedTuple, Optional, Tuple
+
+import scapy.all as all
+from scapy.utils import EDecimal
+
+from IPTables_Guide.model.mutation import HeaderPatch
+from IPTables_Guide.model.predicates import ip_to_int
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_IPV4 = 228
+ETHERTYPE_IPV4 = 0x0800
+
+PROTOCOL_TCP = 6
+PROTOCOL_UDP = 17
+
+_ETHER_TYPE = struct.Struct("!H")
+# version/ihl, total length, fragment field, protocol, source, destination
+_IPV4 = struct.Struct("!B x H 2x H x B 2x I I")
+_PORTS = struct.Struct("!HH")
+
+
+class PacketFields(NamedTuple):
+    """
+    Header fields rules are matched on, None if the packet has no such field
+    """
+
+    protocol: Optional[str]
+    src: Optional[int]
+    dst: Optional[int]
+    sport: Optional[int]
+    dport: Optional[int]
+
+
+def scapy_fields(packet: Any) -> PacketFields:
+    src = dst = None
+    if packet.haslayer(all.IP):
+        ip = packet[all.IP]
+        src = ip_to_int(ip.src)
+        dst = ip_to_int(ip.dst)
+    for protocol, layer in [("tcp", all.TCP), ("udp", all.UDP)]:
+        if packet.haslayer(layer):
+            header = packet[layer]
+            return PacketFields(protocol, src, dst, header.sport, header.dport)
+    return PacketFields(None, src, dst, None, None)
+
+
+def scapy_rewritten(packet: Any) -> bool:
+    """
+    Whether a field of a dissected scapy packet was set since, scapy drops
+    the raw bytes a layer was dissected from when one of its fields is
+    """
+    for layer in packet.iterpayloads():
+        if layer.raw_packet_cache is None:
+            return True
+    return False
+
+
+def scapy_length(packet: Any) -> int:
+    ip = packet.getlayer(all.IP)
+    if ip is not None and ip.len is not None:
+        return ip.len
+    return len(packet)
+
+
+class HeaderView:
+    """
+    The L3/L4 header fields of a captured frame, decoded without scapy
+
+    The scapy packet is only dissected when something asks for it (a
+    target rewriting the packet, a condition the fields do not cover),
+    see as_scapy.
+    """
+
+    __slots__ = (
+        "data",
+        "linktype",
+        "fields",
+        "tcp_flags",
+        "length",
+        "sec",
+        "usec",
+        "wirelen",
+        "nano",
+        "ct_state",
+        "_packet",
+    )
+
+    def __init__(
+        self,
+        data: bytes,
+        linktype: int,
+        sec: int = 0,
+        usec: int = 0,
+        wirelen: Optional[int] = None,
+        nano: bool = False,
+    ):
+        self.data = data
+        self.linktype = linktype
+        self.sec = sec
+        self.usec = usec
+        self.wirelen = len(data) if wirelen is None else wirelen
+        self.nano = nano
+        # set by the connection tracker, see conntrack
+        self.ct_state: Optional[str] = None
+        self._packet = None
+        self.tcp_flags = 0
+        self.length = len(data)
+        fields = self._decode()
+        if fields is None:
+            # framing the decoder does not handle, let scapy decide
+            fields = scapy_fields(self.packet)
+            if fields.protocol == "tcp":
+                self.tcp_flags = int(self.packet[all.TCP].flags)
+            self.length = scapy_length(self.packet)
+        self.fields = fields
+
+    def _decode(self) -> Optional[PacketFields]:
+        """
+        None if scapy has to dissect the frame to tell its fields
+        """
+        data = memoryview(self.data)
+        offset = 0
+        if self.linktype == LINKTYPE_ETHERNET:
+            if len(data) < 14:
+                return None
+            if _ETHER_TYPE.unpack_from(data, 12)[0] != ETHERTYPE_IPV4:
+                # VLAN tags, 802.3 frames, ...
+                return None
+            offset = 14
+        elif self.linktype not in [LINKTYPE_RAW, LINKTYPE_IPV4]:
+            return None
+        if len(data) - offset < 20:
+            return None
+        version_ihl, total_length, fragment, protocol, src, dst = _IPV4.unpack_from(
+            data, offset
+        )
+        header_length = (version_ihl & 0x0F) * 4
+        if version_ihl >> 4 != 4 or header_length < 20:
+            return None
+        if total_length < header_length or len(data) - offset < header_length:
+            return None
+        self.length = total_length
+        fields = PacketFields(None, src, dst, None, None)
+        if protocol not in [PROTOCOL_TCP, PROTOCOL_UDP]:
+            if protocol in [4, 41, 47]:
+                # tunnels, scapy finds the inner headers too
+                return None
+            return fields
+        if fragment & 0x1FFF:
+            # later fragments carry no L4 header
+            return fields
+        payload = data[offset + header_length : offset + total_length]
+        if not len(payload):
+            return fields
+        if len(payload) < (20 if protocol == PROTOCOL_TCP else 8):
+            return None
+        sport, dport = _PORTS.unpack_from(payload)
+        if protocol == PROTOCOL_TCP:
+            self.tcp_flags = (payload[12] & 0x01) << 8 | payload[13]
+            return fields._replace(protocol="tcp", sport=sport, dport=dport)
+        return fields._replace(protocol="udp", sport=sport, dport=dport)
+
+    @property
+    def time(self) -> float:
+        return self.sec + self.usec / (1000000000 if self.nano else 1000000)
+
+    @property
+    def dissected(self) -> bool:
+        """
+        Whether the scapy packet exists, targets may have rewritten it since
+        """
+        return self._packet is not None
+
+    def set_endpoints(
+        self,
+        source: Optional[Tuple[int, int]],
+        destination: Optional[Tuple[int, int]],
+    ) -> bool:
+        """
+        Rewrites the (address, port) ends of the packet in its bytes, ports
+        of 0 are left alone, the checksums are adjusted (see HeaderPatch)
+
+        False, with the packet unchanged, if the bytes can not be patched:
+        the packet was dissected (a target may hold the scapy packet), is
+        not IPv4, or has no ports to set. Targets rewrite the scapy packet
+        then.
+        """
+        if self._packet is not None or self.fields.src is None:
+            return False
+        ports = [
+            endpoint[1] for endpoint in [source, destination] if endpoint is not None
+        ]
+        if self.fields.protocol is None and [port for port in ports if port]:
+            return False
+        buffer = bytearray(self.data)
+        patch = HeaderPatch(buffer, 14 if self.linktype == LINKTYPE_ETHERNET else 0)
+        fields = self.fields
+        for field, port_field, endpoint in [
+            ("src", "sport", source),
+            ("dst", "dport", destination),
+        ]:
+            if endpoint is None:
+                continue
+            address, port = endpoint
+            patch.set_address(field, address)
+            fields = fields._replace(**{field: address})
+            if port:
+                if not patch.has_ports:
+                    return False
+                patch.set_port(port_field, port)
+                fields = fields._replace(**{port_field: port})
+        self.data = bytes(buffer)
+        self.fields = fields
+        return True
+
+    @property
+    def rewritten(self) -> bool:
+        """
+        Whether a target changed the packet, data no longer holds it then
+        """
+        return self._packet is not None and scapy_rewritten(self._packet)
+
+    @property
+    def packet(self) -> Any:
+        """
+        The frame dissected by scapy, the same object on every access
+        """
+        if self._packet is None:
+            layer = all.conf.l2types.num2layer.get(self.linktype, all.conf.raw_layer)
+            try:
+                packet = layer(self.data)
+            except Exception:
+                packet = all.conf.raw_layer(self.data)
+            power = Decimal(10) ** Decimal(-9 if self.nano else -6)
+            packet.time = EDecimal(self.sec + power * self.usec)
+            packet.wirelen = self.wirelen
+            if self.ct_state is not None:
+                packet.ct_state = self.ct_state
+            self._packet = packet
+        return self._packet
+
+
+def packet_length(packet: Any) -> int:
+    """
+    Bytes iptables counts for the packet: the IP datagram, the whole frame
+    for other packets
+    """
+    if isinstance(packet, HeaderView):
+        return packet.length
+    return scapy_length(packet)
+
+
+def as_scapy(packet: Any) -> Any:
+    if isinstance(packet, HeaderView):
+        return packet.packet
+    return packet
@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+# match modules iptables-save prints for the implicit matches of -p / --state
+IMPLICIT_MATCHES = ["tcp", "udp", "state"]
+
+# (chain, policy, (packets, bytes) of the policy)
+SaveChain = Tuple[str, str, Tuple[int, int]]
+# (iptables command of the rule, (packets, bytes))
+SaveRule = Tuple[str, Tuple[int, int]]
+
+
+@dataclass
+class SaveLine:
+    """
+    One meaningful line of iptables-save output
+
+    kind is "table" (*table), "chain" (:CHAIN POLICY [pkts:bytes]),
+    "rule" (-A CHAIN ...) or "commit"
+    """
+
+    line_number: int
+    kind: str
+    table: str
+    chain: str = ""
+    value: str = ""
+    counters: Optional[Tuple[int, int]] = None
+
+
+@dataclass
+class LineError:
+    line_number: int
+    line: str
+    message: str
+
+
+def parse_counters(text: str) -> Optional[Tuple[int, int]]:
+    if len(text) < 5 or text[0] != "[" or text[-1] != "]":
+        return None
+    parts = text[1:-1].split(":")
+    if len(parts) != 2 or not parts[0].isdigit() or not parts[1].isdigit():
+        return None
+    return int(parts[0]), int(parts[1])
+
+
+def format_counters(packets: int, bytes: int) -> str:
+    return "[{}:{}]".format(packets, bytes)
+
+
+def rule_specification(str_form: str) -> Optional[str]:
+    """
+    "-A CHAIN ..." from the iptables command of a rule, None if it has no
+    append or insert command
+    """
+    tokens = str_form.split()
+    for i, token in enumerate(tokens[:-1]):
+        if token in ["-A", "--append", "-I", "--insert"]:
+            rest = tokens[i + 2 :]
+            if token in ["-I", "--insert"] and rest and rest[0].isdigit():
+                rest = rest[1:]
+            return " ".join(["-A", tokens[i + 1]] + rest)
+    return None
+
+
+def write_iptables_save(
+    tables: Iterable[Tuple[str, List[SaveChain], List[SaveRule]]]
+) -> Iterator[str]:
+    """
+    iptables-save -c output line by line, from (table, chains, rules)
+    """
+    for table, chains, rules in tables:
+        yield "*{}".format(table.lower())
+        for chain, policy, counters in chains:
+            yield ":{} {} {}".format(chain, policy, format_counters(*counters))
+        for str_form, counters in rules:
+            specification = rule_specification(str_form)
+            if specification is not None:
+                yield "{} {}".format(format_counters(*counters), specification)
+        yield "COMMIT"
+
+
+def strip_implicit_matches(tokens: List[str]) -> List[str]:
+    stripped = []
+    i = 0
+    while i < len(tokens):
+        if (
+            tokens[i] == "-m"
+            and i + 1 < len(tokens)
+            and tokens[i + 1] in IMPLICIT_MATCHES
+        ):
+            i += 2
+            continue
+        stripped.append(tokens[i])
+        i += 1
+    return stripped
+
+
+def read_iptables_save(
+    lines: Iterable[str],
+) -> Iterator[Union[SaveLine, LineError]]:
+    """
+    Reads iptables-save output line by line, lines are never collected,
+    so the input can be an open file of any size
+    """
+    table = ""
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line[0] == "#":
+            continue
+        if line[0] == "*":
+            if table:
+                yield LineError(line_number, line, "missing COMMIT before table")
+            table = line[1:]
+            yield SaveLine(line_number, "table", table)
+            continue
+        if not table:
+            yield LineError(line_number, line, "line outside of a table")
+            continue
+        if line == "COMMIT":
+            yield SaveLine(line_number, "commit", table)
+            table = ""
+            continue
+        tokens = line.split()
+        if line[0] == ":":
+            counters = parse_counters(tokens[2]) if len(tokens) == 3 else None
+            if len(tokens) != 3 or len(tokens[0]) < 2 or counters is None:
+                yield LineError(line_number, line, "invalid chain definition")
+                continue
+            yield SaveLine(
+                line_number, "chain", table, tokens[0][1:], tokens[1], counters
+            )
+            continue
+        counters = None
+        if tokens[0][0] == "[":
+            counters = parse_counters(tokens[0])
+            if counters is None:
+                yield LineError(line_number, line, "invalid counters")
+                continue
+            tokens = tokens[1:]
+        if len(tokens) < 2 or tokens[0] not in ["-A", "--append"]:
+            yield LineError(line_number, line, "unsupported command")
+            continue
+        yield SaveLine(
+            line_number,
+            "rule",
+            table,
+            tokens[1],
+            " ".join(["-A"] + strip_implicit_matches(tokens[1:])),
+            counters,
+        )
+    if table:
+        yield LineError(line_number + 1, "", "missing COMMIT at end of input")
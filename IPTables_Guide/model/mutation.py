@@ -0,0 +1,103 @@
+import struct
+from typing import Optional
+
+PROTOCOL_TCP = 6
+PROTOCOL_UDP = 17
+
+_WORD = struct.Struct("!H")
+
+# offset of the checksum in the transport header
+_CHECKSUM_OFFSETS = {PROTOCOL_TCP: 16, PROTOCOL_UDP: 6}
+
+
+def checksum_adjust(checksum: int, old: int, new: int) -> int:
+    """
+    The internet checksum after a 16 bit word it covers changed from old
+    to new, RFC 1624 eqn. 3: HC' = ~(~HC + ~m + m')
+    """
+    value = (~checksum & 0xFFFF) + (~old & 0xFFFF) + new
+    value = (value & 0xFFFF) + (value >> 16)
+    value = (value & 0xFFFF) + (value >> 16)
+    return ~value & 0xFFFF
+
+
+class HeaderPatch:
+    """
+    Rewrites the IPv4 addresses and TCP/UDP ports of a packet in a mutable
+    buffer, adjusting the IP header checksum and the TCP/UDP checksum
+    (over the pseudo header) for every word changed instead of computing
+    them again
+
+    ip_offset is where the IPv4 header starts in the buffer. The transport
+    header is only patched if the datagram is its first fragment and the
+    buffer holds it up to the checksum. A UDP checksum of 0 (none) is left
+    alone.
+    """
+
+    __slots__ = ("buffer", "ip_offset", "transport_offset", "protocol")
+
+    def __init__(self, buffer: bytearray, ip_offset: int):
+        if len(buffer) - ip_offset < 20 or buffer[ip_offset] >> 4 != 4:
+            raise ValueError("no IPv4 header at offset {}".format(ip_offset))
+        self.buffer = buffer
+        self.ip_offset = ip_offset
+        self.protocol = buffer[ip_offset + 9]
+        self.transport_offset: Optional[int] = None
+        fragment = _WORD.unpack_from(buffer, ip_offset + 6)[0]
+        checksum_offset = _CHECKSUM_OFFSETS.get(self.protocol)
+        if checksum_offset is not None and not fragment & 0x1FFF:
+            offset = ip_offset + (buffer[ip_offset] & 0x0F) * 4
+            if len(buffer) >= offset + checksum_offset + 2:
+                self.transport_offset = offset
+
+    @property
+    def has_ports(self) -> bool:
+        return self.transport_offset is not None
+
+    def _set_word(self, offset: int, value: int, in_ip_header: bool) -> None:
+        """
+        Sets a word covered by the transport checksum (the addresses are,
+        through the pseudo header), and by the IP header checksum too if it
+        is in the IP header
+        """
+        buffer = self.buffer
+        old = _WORD.unpack_from(buffer, offset)[0]
+        if old == value:
+            return
+        _WORD.pack_into(buffer, offset, value)
+        if in_ip_header:
+            checksum = self.ip_offset + 10
+            _WORD.pack_into(
+                buffer,
+                checksum,
+                checksum_adjust(_WORD.unpack_from(buffer, checksum)[0], old, value),
+            )
+        if self.transport_offset is None:
+            return
+        checksum = self.transport_offset + _CHECKSUM_OFFSETS[self.protocol]
+        current = _WORD.unpack_from(buffer, checksum)[0]
+        if self.protocol == PROTOCOL_UDP and current == 0:
+            return
+        adjusted = checksum_adjust(current, old, value)
+        if self.protocol == PROTOCOL_UDP and adjusted == 0:
+            adjusted = 0xFFFF
+        _WORD.pack_into(buffer, checksum, adjusted)
+
+    def set_address(self, field: str, address: int) -> None:
+        """
+        field is "src" or "dst", address an IPv4 address as integer
+        """
+        offset = self.ip_offset + (12 if field == "src" else 16)
+        high, low = divmod(address, 1 << 16)
+        self._set_word(offset, high, True)
+        self._set_word(offset + 2, low, True)
+
+    def set_port(self, field: str, port: int) -> None:
+        """
+        field is "sport" or "dport", the packet has to have ports (see
+        has_ports)
+        """
+        if self.transport_offset is None:
+            raise ValueError("no TCP/UDP header to set the port in")
+        offset = self.transport_offset + (0 if field == "sport" else 2)
+        self._set_word(offset, port, False)
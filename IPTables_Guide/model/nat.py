@@ -0,0 +1,112 @@
+from typing import Any, Optional, Tuple
+
+import scapy.all as all
+
+from IPTables_Guide.model.classifier import ChainClassifier, packet_fields
+from IPTables_Guide.model.conntrack import Connection, ConnectionTracker, Endpoint
+from IPTables_Guide.model.headers import HeaderView, as_scapy
+from IPTables_Guide.model.predicates import clear_checksums, int_to_ip
+from IPTables_Guide.model.traversal import Stage
+
+# nat chains that rewrite the destination, the others rewrite the source
+DESTINATION_NAT_CHAINS = ["PREROUTING", "OUTPUT"]
+
+
+def endpoints(packet: Any) -> Tuple[Endpoint, Endpoint]:
+    fields = packet_fields(packet)
+    return (fields.src, fields.sport or 0), (fields.dst, fields.dport or 0)
+
+
+def rewrite(
+    packet: Any, source: Optional[Endpoint], destination: Optional[Endpoint]
+) -> Any:
+    """
+    The packet with the given ends set, ports of 0 are left alone, header
+    views are patched in their bytes where they can be (see
+    HeaderView.set_endpoints), other packets are rewritten by scapy
+    """
+    if isinstance(packet, HeaderView) and packet.set_endpoints(source, destination):
+        return packet
+    packet = as_scapy(packet)
+    ip = packet.getlayer(all.IP)
+    ports = None
+    for layer in [all.TCP, all.UDP]:
+        if packet.haslayer(layer):
+            ports = packet[layer]
+            break
+    for field, port_field, endpoint in [
+        ("src", "sport", source),
+        ("dst", "dport", destination),
+    ]:
+        if endpoint is None:
+            continue
+        address, port = endpoint
+        setattr(ip, field, int_to_ip(address))
+        if port and ports is not None:
+            setattr(ports, port_field, port)
+    clear_checksums(packet)
+    return packet
+
+
+class NatStage(Stage):
+    """
+    A nat chain, run only for the first packet of a connection, as
+    netfilter does
+
+    What the chain did to that packet is kept on the connection as its
+    binding for this chain, later packets of the connection get the same
+    translation without running the chain. Replies get the reverse of the
+    translations of the other kind: destination nat chains (PREROUTING)
+    undo source nat on them, source nat chains undo destination nat.
+    Packets without a connection run the chain every time.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        chain: str,
+        classifier: ChainClassifier,
+        policy: str,
+        tracker: ConnectionTracker,
+    ):
+        super().__init__(table, chain, classifier, policy)
+        self.tracker = tracker
+        self.rewrites_destination = chain in DESTINATION_NAT_CHAINS
+
+    def decide(
+        self, packet: Any, connection: Optional[Connection] = None, reply: bool = False
+    ) -> Tuple[Optional[int], Optional[Any]]:
+        """
+        Packets translated by the binding of their connection were not
+        decided by any rule of the chain, their rule index is None
+        """
+        if connection is None:
+            return super().decide(packet)
+        if reply:
+            return None, self._reverse(packet, connection)
+        if self.chain in connection.nat:
+            binding = connection.nat[self.chain]
+            if binding is None or binding == endpoints(packet):
+                return None, packet
+            return None, rewrite(packet, *binding)
+        before = endpoints(packet)
+        rule_index, result = super().decide(packet)
+        if result is None:
+            return rule_index, None
+        after = endpoints(result)
+        if after == before:
+            connection.nat[self.chain] = None
+        else:
+            connection.nat[self.chain] = after
+            self.tracker.translate(connection, *after)
+        return rule_index, result
+
+    def _reverse(self, packet: Any, connection: Connection) -> Any:
+        _, source, destination = connection.original
+        reply_source, reply_destination = endpoints(packet)
+        if self.rewrites_destination:
+            if reply_destination != source:
+                return rewrite(packet, None, source)
+        elif reply_source != destination:
+            return rewrite(packet, destination, None)
+        return packet
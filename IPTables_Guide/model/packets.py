@@ -101,6 +101,9 @@ class Packet:
     def __init__(self, packet: ScapyPacket) -> None:
         self._packet: scapy.packet.Packet = packet
 
+    def get_scapy_packet(self) -> ScapyPacket:
+        return self._packet
+
     def write(self, filename: Path) -> Any:
         wrpcap(str(filename), self._packet, append=True)
 
@@ -0,0 +1,90 @@
+import multiprocessing
+from typing import Iterator, List, Optional, Tuple
+
+from IPTables_Guide.model.classifier import ChainClassifier
+from IPTables_Guide.model.evaluation import ChainStatistics, evaluate_capture
+from IPTables_Guide.model.pcap_io import (
+    CaptureRecord,
+    capture_record,
+    read_pcap_headers,
+    record_ranges,
+)
+
+# bytes of capture per task, bounds what a worker holds at once
+SHARD_SIZE = 8 << 20
+
+# (start, end) byte offsets of the records of a shard
+Shard = Tuple[int, int]
+# records that passed, in capture order, and the shard's statistics
+ShardResult = Tuple[List[CaptureRecord], ChainStatistics]
+
+# what the workers evaluate, set before the pool forks so the compiled
+# chain is shared copy-on-write instead of pickled
+_shared: Optional[Tuple[ChainClassifier, str, bool, bool]] = None
+
+
+def evaluate_shard(
+    classifier: ChainClassifier,
+    file_name: str,
+    shard: Shard,
+    policy_accepts: bool,
+    vectorized: bool = False,
+) -> ShardResult:
+    statistics = ChainStatistics()
+    packets = read_pcap_headers(file_name, *shard)
+    records = [
+        capture_record(packet)
+        for packet in evaluate_capture(
+            classifier, packets, policy_accepts, statistics, vectorized
+        )
+    ]
+    return records, statistics
+
+
+def _evaluate_shard_in_worker(shard: Shard) -> ShardResult:
+    assert _shared is not None
+    classifier, file_name, policy_accepts, vectorized = _shared
+    return evaluate_shard(classifier, file_name, shard, policy_accepts, vectorized)
+
+
+def evaluate_capture_parallel(
+    classifier: ChainClassifier,
+    file_name: str,
+    policy_accepts: bool,
+    statistics: Optional[ChainStatistics] = None,
+    processes: Optional[int] = None,
+    vectorized: bool = False,
+    shard_size: int = SHARD_SIZE,
+) -> Iterator[CaptureRecord]:
+    """
+    evaluate_capture over record-aligned byte ranges of a pcap file in a
+    process pool (one process per core for None), the records come back in
+    capture order
+
+    Needs the fork start method; with one process, or for files that are
+    not classic pcap, the capture is evaluated in this process.
+    """
+    global _shared
+    if statistics is None:
+        statistics = ChainStatistics()
+    shards = record_ranges(file_name, shard_size)
+    if (
+        shards is None
+        or processes == 1
+        or "fork" not in multiprocessing.get_all_start_methods()
+    ):
+        packets = read_pcap_headers(file_name)
+        for packet in evaluate_capture(
+            classifier, packets, policy_accepts, statistics, vectorized
+        ):
+            yield capture_record(packet)
+        return
+    _shared = (classifier, file_name, policy_accepts, vectorized)
+    try:
+        pool = multiprocessing.get_context("fork").Pool(processes)
+    finally:
+        _shared = None
+    with pool:
+        for records, shard_statistics in pool.imap(_evaluate_shard_in_worker, shards):
+            statistics.merge(shard_statistics)
+            yield from records
@@ -0,0 +1,75 @@
+import itertools
+import multiprocessing
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from IPTables_Guide.model.rule_generator import Rule, SignatureGrammar
+
+# (key, raw rule, table, chain), the key is handed back untouched
+RuleLine = Tuple[Any, str, str, str]
+# (key, table, chain, components, remaining tokens)
+ParsedRule = Tuple[Any, str, str, List[Any], List[str]]
+
+# below this many rules starting the workers costs more than it saves
+PARALLEL_THRESHOLD = 20000
+
+_grammar: Optional[SignatureGrammar] = None
+
+
+def _init_worker(signatures) -> None:
+    global _grammar
+    _grammar = SignatureGrammar(signatures)
+
+
+def parse_chunk(grammar: SignatureGrammar, chunk: List[RuleLine]) -> List[ParsedRule]:
+    parsed = []
+    for key, raw, table, chain in chunk:
+        rule = Rule("", grammar.signatures, table, chain, grammar=grammar)
+        rule.raw_form = raw
+        components, remaining, _ = grammar.parse(rule) if raw else [[], [], []]
+        parsed.append((key, rule.table, rule.chain, components, remaining))
+    return parsed
+
+
+def _parse_chunk_in_worker(chunk: List[RuleLine]) -> List[ParsedRule]:
+    assert _grammar is not None
+    return parse_chunk(_grammar, chunk)
+
+
+def _chunks(lines: Iterator[RuleLine], chunk_size: int) -> Iterator[List[RuleLine]]:
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_rules(
+    signatures,
+    lines: Iterable[RuleLine],
+    processes: Optional[int] = None,
+    chunk_size: int = 2000,
+    threshold: Optional[int] = None,
+) -> Iterator[ParsedRule]:
+    """
+    Parses rules in a process pool, results come back in input order
+
+    Inputs shorter than threshold (PARALLEL_THRESHOLD by default) are
+    parsed in this process. The pool's feeder thread takes the lines, so
+    taking them must not change anything.
+    """
+    if threshold is None:
+        threshold = PARALLEL_THRESHOLD
+    lines = iter(lines)
+    head = list(itertools.islice(lines, threshold))
+    if len(head) < threshold or processes == 1:
+        grammar = SignatureGrammar(signatures)
+        yield from parse_chunk(grammar, head)
+        for chunk in _chunks(lines, chunk_size):
+            yield from parse_chunk(grammar, chunk)
+        return
+    with multiprocessing.Pool(
+        processes, initializer=_init_worker, initargs=(signatures,)
+    ) as pool:
+        chunks = _chunks(itertools.chain(head, lines), chunk_size)
+        for parsed in pool.imap(_parse_chunk_in_worker, chunks):
+            yield from parsed
@@ -1,7 +1,26 @@
+import functools
 import ipaddress
 from typing import Dict, List, Optional, Tuple, Union, Any
 import scapy.all as all
 
+from IPTables_Guide.model.components import Component, make_component
+from IPTables_Guide.model.predicates import (
+    compile_accept,
+    compile_destination,
+    compile_dnat,
+    compile_drop,
+    compile_snat,
+    compile_source,
+    compile_state,
+    compile_tcp,
+    compile_tcp_dport,
+    compile_tcp_sport,
+    compile_udp,
+    compile_udp_dport,
+    compile_udp_sport,
+    parse_network,
+)
+
 start_strs = {
     "iptables": {
         "str_form": "iptables",
@@ -116,7 +135,7 @@ def check_tcp_src_port(packet: Any, value: str):
     if packet.haslayer(all.TCP):
         try:
             port_as_int = int(value)
-            return packet[all.TCP][sport] == port_as_int
+            return packet[all.TCP].sport == port_as_int
         except ValueError:
             return False
     return False
@@ -126,7 +145,7 @@ def check_tcp_dport(packet: Any, value: str):
     if packet.haslayer(all.TCP):
         try:
             port_as_int = int(value)
-            return packet[all.TCP][dport] == port_as_int
+            return packet[all.TCP].dport == port_as_int
         except ValueError:
             return False
     return False
@@ -136,7 +155,7 @@ def check_udp_src_port(packet: Any, value: str):
     if packet.haslayer(all.UDP):
         try:
             port_as_int = int(value)
-            return packet[all.UDP][sport] == port_as_int
+            return packet[all.UDP].sport == port_as_int
         except ValueError:
             return False
     return False
@@ -146,7 +165,7 @@ def check_udp_dport(packet: Any, value: str):
     if packet.haslayer(all.UDP):
         try:
             port_as_int = int(value)
-            return packet[all.UDP][dport] == port_as_int
+            return packet[all.UDP].dport == port_as_int
         except ValueError:
             return False
     return False
@@ -158,11 +177,12 @@ def check_source_ip(packet: Any, value: str):
             return True
         else:
             try:
-                network = ipaddress.ip_network(value)
-                ip = ipaddress.ip_address(packet[all.IP.src])
+                network = parse_network(value)
+                ip = ipaddress.ip_address(packet[all.IP].src)
                 return ip in network
             except ValueError:
                 return False
+    return False
 
 
 def check_destination_ip(packet: Any, value: str):
@@ -171,11 +191,12 @@ def check_destination_ip(packet: Any, value: str):
             return True
         else:
             try:
-                network = ipaddress.ip_network(value)
-                ip = ipaddress.ip_address(packet[all.IP.dst])
+                network = parse_network(value)
+                ip = ipaddress.ip_address(packet[all.IP].dst)
                 return ip in network
             except ValueError:
                 return False
+    return False
 
 
 possible_tcp_options = [
@@ -184,12 +205,14 @@ possible_tcp_options = [
         "parser_method": src_port,
         "type": "condition",
         "condition_method": check_tcp_src_port,
+        "compile_method": compile_tcp_sport,
     },
     {
         "str_form": "--dport",
         "parser_method": dst_port,
         "type": "condition",
         "condition_method": check_tcp_dport,
+        "compile_method": compile_tcp_dport,
     },
 ]
 
@@ -201,6 +224,7 @@ def pair_iterator(substr: List[str]):
         i += 1
 
 
+@functools.lru_cache(maxsize=4096)
 def validate_ip(ip: str, delimiter="/") -> bool:
     if delimiter == "/":
         try:
@@ -224,6 +248,10 @@ def validate_ip(ip: str, delimiter="/") -> bool:
 
 
 class TCPParser:
+    # find_fit fails on every suffix of a list it failed on, the start
+    # string is not in it
+    fails_on_suffixes = True
+
     def __init__(self, start_string={}, possible_options=[]):
         if start_string:
             self.start_string = start_string
@@ -233,12 +261,16 @@ class TCPParser:
                     "str_form": "-p tcp",
                     "type": "condition",
                     "condition_method": check_tcp,
+                    "compile_method": compile_tcp,
                 }
             }
         if possible_options:
             self.possible_options = possible_options
         else:
             self.possible_options = possible_tcp_options
+        self.start_components = {
+            key: Component(value) for key, value in self.start_string.items()
+        }
 
     def find_fit(self, substr: List[str]):
         specs = []
@@ -246,7 +278,7 @@ class TCPParser:
         for pair in pairs:
             unified_pair = " ".join(pair)
             if unified_pair in self.start_string:
-                specs.append(self.start_string[unified_pair])
+                specs.append(self.start_components[unified_pair])
                 substr.remove(pair[0])
                 substr.remove(pair[1])
                 pairs.close()
@@ -254,12 +286,17 @@ class TCPParser:
             for option in self.possible_options:
                 for element in substr:
                     if option["str_form"] == element:
-                        spec = option.copy()
                         if "parser_method" in option:
-                            result, substr = option["parser_method"](substr)
-                            spec["value"] = result["value"]
-                            spec["str_form"] = result["src_form"]
+                            parsed = option["parser_method"](substr)
+                            if not parsed:
+                                # option without a valid value, e.g. mid-typing
+                                continue
+                            result, substr = parsed
+                            spec = make_component(
+                                option, result["value"], result["src_form"]
+                            )
                         else:
+                            spec = Component(option)
                             substr.remove(element)
                         specs.append(spec)
             return specs, substr
@@ -273,17 +310,23 @@ possible_udp_options = [
         "parser_method": src_port,
         "type": "condition",
         "condition_method": check_udp_src_port,
+        "compile_method": compile_udp_sport,
     },
     {
         "str_form": "--dport",
         "parser_method": dst_port,
         "type": "condition",
         "condition_method": check_udp_dport,
+        "compile_method": compile_udp_dport,
     },
 ]
 
 
 class UDPParser:
+    # find_fit fails on every suffix of a list it failed on, the start
+    # string is not in it
+    fails_on_suffixes = True
+
     def __init__(self, start_string="", possible_options=[]):
         if start_string:
             self.start_string = start_string
@@ -293,12 +336,16 @@ class UDPParser:
                     "str_form": "-p udp",
                     "type": "condition",
                     "condition_method": check_udp,
+                    "compile_method": compile_udp,
                 }
             }
         if possible_options:
             self.possible_options = possible_options
         else:
-            self.possible_options = possible_tcp_options
+            self.possible_options = possible_udp_options
+        self.start_components = {
+            key: Component(value) for key, value in self.start_string.items()
+        }
 
     def find_fit(self, substr: List[str]):
         specs = []
@@ -306,7 +353,7 @@ class UDPParser:
         for pair in pairs:
             unified_pair = " ".join(pair)
             if unified_pair in self.start_string:
-                specs.append(self.start_string[unified_pair])
+                specs.append(self.start_components[unified_pair])
                 substr.remove(pair[0])
                 substr.remove(pair[1])
                 pairs.close()
@@ -315,12 +362,15 @@ class UDPParser:
                 for element in substr:
                     if option["str_form"] == element:
                         if "parser_method" in option:
-                            result, substr = option["parser_method"](substr)
-                            spec = option.copy()
-                            spec["value"] = result["value"]
-                            spec["str_form"] = result["src_form"]
+                            parsed = option["parser_method"](substr)
+                            if not parsed:
+                                continue
+                            result, substr = parsed
+                            spec = make_component(
+                                option, result["value"], result["src_form"]
+                            )
                         else:
-                            spec = option
+                            spec = Component(option)
                             substr.remove(element)
                         specs.append(spec)
             return specs, substr
@@ -365,6 +415,9 @@ def dnat_action(packet: Any, value: str):
 
 
 class JumpParser:
+    # -j DNAT --to-destination <address>
+    lookahead = 4
+
     def __init__(self):
         self.actions = {
             "DROP": {
@@ -372,6 +425,7 @@ class JumpParser:
                 "forms": ["--jump DROP"],
                 "type": "action",
                 "action_method": drop_action,
+                "compile_method": compile_drop,
                 "explanation": "",
             },
             "ACCEPT": {
@@ -379,6 +433,7 @@ class JumpParser:
                 "forms": ["--jump ACCEPT", "--jump ACCEPT"],
                 "type": "action",
                 "action_method": accept_action,
+                "compile_method": compile_accept,
                 "explanation": "",
             },
             "SNAT": {
@@ -386,16 +441,26 @@ class JumpParser:
                 "forms": ["--jump SNAT --to-source"],
                 "type": "action",
                 "action_method": snat_action,
+                "compile_method": compile_snat,
                 "explanation": "",
             },
             "DNAT": {
                 "str_form": "-j DNAT --to-destination",
-                "forms": "--jump DNAT --to-destination",
+                "forms": ["--jump DNAT --to-destination"],
                 "type": "action",
                 "action_method": dnat_action,
+                "compile_method": compile_dnat,
                 "explanation": "",
             },
         }
+        self.first_tokens = {
+            form.split(" ")[0]
+            for action in self.actions.values()
+            for form in [action["str_form"]] + action["forms"]
+        }
+        self.components = {
+            action: Component(template) for action, template in self.actions.items()
+        }
 
     def find_fit(self, substr: List[str]):
         if len(substr) > 1:
@@ -406,9 +471,9 @@ class JumpParser:
                         start == self.actions[action]["str_form"]
                         or start in self.actions[action]["forms"]
                     ):
-                        to_return = self.actions[action].copy()
-                        to_return["str_form"] = start
-                        return to_return, substr[2:]
+                        if start == self.actions[action]["str_form"]:
+                            return self.components[action], substr[2:]
+                        return Component(self.actions[action], None, start), substr[2:]
                 else:
                     if len(substr) > 3:
                         start = " ".join(substr[:3])
@@ -416,14 +481,17 @@ class JumpParser:
                             start == self.actions[action]["str_form"]
                             or start in self.actions[action]["forms"]
                         ) and validate_ip(substr[3], ":"):
-                            to_return = self.actions[action].copy()
-                            to_return["value"] = substr[3]
-                            to_return["str_form"] += " {}".format(substr[3])
-                            return to_return, substr[4:]
+                            return (
+                                Component(self.actions[action], substr[3]),
+                                substr[4:],
+                            )
         return None
 
 
 class SourceParser:
+    # number of tokens find_fit looks at
+    lookahead = 2
+
     def __init__(self):
         self.start_strings = ["-s", "--source"]
         self.repr_dict = {
@@ -431,19 +499,21 @@ class SourceParser:
             "explanation": "",
             "type": "condition",
             "condition_method": check_source_ip,
+            "compile_method": compile_source,
         }
+        self.first_tokens = self.start_strings
 
     def find_fit(self, substr: List[str]):
         if len(substr) > 1:
             if substr[0] in self.start_strings and validate_ip(substr[1]):
-                to_return = self.repr_dict.copy()
-                to_return["str_form"] = to_return["str_form"] + " " + substr[1]
-                to_return["value"] = substr[1]
-                return to_return, substr[2:]
+                return Component(self.repr_dict, substr[1]), substr[2:]
         return None
 
 
 class DestinationParser:
+    # number of tokens find_fit looks at
+    lookahead = 2
+
     def __init__(self):
         self.start_strings = ["-d", "--destination"]
         self.repr_dict = {
@@ -451,58 +521,68 @@ class DestinationParser:
             "explanation": "",
             "type": "condition",
             "condition_method": check_destination_ip,
+            "compile_method": compile_destination,
         }
+        self.first_tokens = self.start_strings
 
     def find_fit(self, substr: List[str]):
         if len(substr) > 1:
             if substr[0] in self.start_strings and validate_ip(substr[1]):
-                to_return = self.repr_dict.copy()
-                to_return["str_form"] = to_return["str_form"] + " " + substr[1]
-                to_return["value"] = substr[1]
-                return to_return, substr[2:]
+                return Component(self.repr_dict, substr[1]), substr[2:]
         return None
 
 
 class InputInterfaceParser:
+    # number of tokens find_fit looks at
+    lookahead = 2
+
     def __init__(self):
         self.start_strings = ["-i", "--in-interface"]
-        self.repr_dict = ({"str_form": "-i", "explanation": ""},)
+        self.repr_dict = {"str_form": "-i", "explanation": ""}
+        self.first_tokens = self.start_strings
 
     def find_fit(self, substr: List[str]):
         if len(substr) > 1:
             if substr[0] in self.start_strings:
-                to_return = self.repr_dict.copy()
-                to_return["value"] = substr[1]
-                return to_return, substr[2:]
+                return Component(self.repr_dict, substr[1]), substr[2:]
         return None
 
 
 class OutputInterfaceParser:
+    # number of tokens find_fit looks at
+    lookahead = 2
+
     def __init__(self):
         self.start_strings = ["-o", "--out-interface"]
-        self.repr_dict = ({"str_form": "-o", "explanation": ""},)
+        self.repr_dict = {"str_form": "-o", "explanation": ""}
+        self.first_tokens = self.start_strings
 
     def find_fit(self, substr: List[str]):
         if len(substr) > 1:
             if substr[0] in self.start_strings:
-                to_return = self.repr_dict.copy()
-                to_return["value"] = substr[1]
-                return to_return, substr[2:]
+                return Component(self.repr_dict, substr[1]), substr[2:]
         return None
 
 
 class StateParser:
+    # number of tokens find_fit looks at
+    lookahead = 2
+
     def __init__(self):
         self.start_string = "--state"
         self.possible_states = ["INVALID", "ESTABLISHED", "NEW", "RELATED"]
-        self.repr_dict = (
-            {"str_form": "--state", "explanation": "", "type": "condition"},
-        )
+        self.repr_dict = {
+            "str_form": "--state",
+            "explanation": "",
+            "type": "condition",
+            "compile_method": compile_state,
+        }
+        self.first_tokens = [self.start_string]
 
     def find_fit(self, substr: List[str]):
-        if len(substr) > 1:
-            if substr[0] == self.start_string and substr[1] in self.possible_states:
-                to_return = self.repr_dict.copy()
-                to_return["value"] = substr[1]
-                return to_return, substr[2:]
+        if len(substr) > 1 and substr[0] == self.start_string:
+            # a comma separated list, like ESTABLISHED,RELATED
+            states = substr[1].split(",")
+            if set(states) <= set(self.possible_states):
+                return Component(self.repr_dict, substr[1]), substr[2:]
         return None
@@ -0,0 +1,167 @@
+import struct
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+import scapy.all as all
+
+from IPTables_Guide.model.headers import LINKTYPE_ETHERNET, HeaderView
+
+PCAP_HEADER_SIZE = 24
+READ_BUFFER_SIZE = 1 << 20
+
+# magic number -> (byte order, nanosecond timestamps)
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", False),
+    b"\xa1\xb2\xc3\xd4": (">", False),
+    b"\x4d\x3c\xb2\xa1": ("<", True),
+    b"\xa1\xb2\x3c\x4d": (">", True),
+}
+
+
+class CaptureRecord(NamedTuple):
+    data: bytes
+    sec: int
+    usec: int
+    wirelen: int
+    linktype: int
+
+
+def packet_record(packet: Any) -> CaptureRecord:
+    """
+    The record PcapWriter writes for a scapy packet
+    """
+    sec = int(packet.time)
+    usec = int(round((packet.time - sec) * 1000000))
+    data = bytes(packet)
+    wirelen = getattr(packet, "wirelen", None)
+    linktype = all.conf.l2types.layer2num.get(packet.__class__, LINKTYPE_ETHERNET)
+    return CaptureRecord(
+        data, sec, usec, len(data) if wirelen is None else wirelen, linktype
+    )
+
+
+def capture_record(packet: Any) -> CaptureRecord:
+    """
+    The record to write for a packet: a header view no target rewrote is
+    copied as it was read, anything else is encoded by scapy (see
+    packet_record)
+    """
+    if isinstance(packet, HeaderView):
+        if packet.rewritten:
+            return packet_record(packet.packet)
+        usec = packet.usec
+        if packet.nano:
+            usec = int(round(usec / 1000))
+        return CaptureRecord(
+            packet.data, packet.sec, usec, packet.wirelen, packet.linktype
+        )
+    return packet_record(packet)
+
+
+def _pcap_format(file_name: str) -> Optional[Tuple[str, bool]]:
+    """
+    (byte order, nanosecond timestamps) of a classic pcap file, None for
+    other formats
+    """
+    with open(file_name, "rb") as f:
+        return PCAP_MAGICS.get(f.read(4))
+
+
+def read_pcap_headers(
+    file_name: str, start: int = PCAP_HEADER_SIZE, end: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    Streams the records of a capture as HeaderViews, nothing is dissected
+
+    start and end are byte offsets of record boundaries (see
+    record_ranges), the whole file by default. Files that are not classic
+    pcap (pcapng) are read with scapy, their packets come as scapy
+    packets.
+    """
+    pcap_format = _pcap_format(file_name)
+    if pcap_format is None:
+        yield from all.PcapNgReader(file_name)
+        return
+    endian, nano = pcap_format
+    record = struct.Struct(endian + "IIII")
+    with open(file_name, "rb", READ_BUFFER_SIZE) as f:
+        linktype = struct.unpack(endian + "4xHHiIII", f.read(PCAP_HEADER_SIZE))[5]
+        f.seek(start)
+        position = start
+        while end is None or position < end:
+            header = f.read(16)
+            if len(header) < 16:
+                return
+            sec, usec, caplen, wirelen = record.unpack(header)
+            data = f.read(caplen)
+            if len(data) < caplen:
+                return
+            position += 16 + caplen
+            yield HeaderView(data, linktype & 0x0FFFFFFF, sec, usec, wirelen, nano)
+
+
+def record_ranges(file_name: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Splits the records of a classic pcap file into (start, end) byte
+    ranges of about size bytes each, None for other formats
+
+    Only the record headers are read.
+    """
+    pcap_format = _pcap_format(file_name)
+    if pcap_format is None:
+        return None
+    record = struct.Struct(pcap_format[0] + "IIII")
+    ranges = []
+    with open(file_name, "rb") as f:
+        start = position = PCAP_HEADER_SIZE
+        f.seek(position)
+        while True:
+            header = f.read(16)
+            if len(header) < 16:
+                break
+            position += 16 + record.unpack(header)[2]
+            if position - start >= size:
+                ranges.append((start, position))
+                start = position
+            f.seek(position)
+    if position > start:
+        ranges.append((start, position))
+    return ranges
+
+
+class CaptureWriter:
+    """
+    Appends packets to a capture through one open, buffered file
+
+    Writes the same records as all.wrpcap(file_name, packet, append=True)
+    per packet would, except that header views no target rewrote keep
+    their original bytes (see capture_record). The file is only created
+    once there is a packet to write.
+    """
+
+    def __init__(self, file_name: str, buffer_size: int = 1 << 20):
+        self.file_name = file_name
+        self.buffer_size = buffer_size
+        self._writer: Any = None
+
+    def write(self, packet: Any) -> None:
+        self.write_record(capture_record(packet))
+
+    def write_record(self, record: CaptureRecord) -> None:
+        if self._writer is None:
+            output = open(self.file_name, "ab", self.buffer_size)
+            self._writer = all.PcapWriter(output, linktype=record.linktype, append=True)
+            self._writer.write_header(None)
+        self._writer.write_packet(
+            record.data, record.sec, record.usec, wirelen=record.wirelen
+        )
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,293 @@
+import functools
+import ipaddress
+import socket
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import scapy.all as all
+
+Predicate = Callable[[Any], bool]
+# returns the packet to pass on, "DROP", or None if it could not handle it
+Target = Callable[[Any], Any]
+
+
+def ip_to_int(ip: str) -> int:
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+
+def int_to_ip(address: int) -> str:
+    return socket.inet_ntoa(address.to_bytes(4, "big"))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_network(value: str) -> Union[ipaddress.IPv4Network, ipaddress.IPv6Network]:
+    return ipaddress.ip_network(value, strict=False)
+
+
+def never(packet: Any) -> bool:
+    return False
+
+
+def always(packet: Any) -> bool:
+    return True
+
+
+def _layer_predicate(layer: Any) -> Predicate:
+    def predicate(packet: Any) -> bool:
+        return packet.haslayer(layer)
+
+    return predicate
+
+
+def _port_predicate(layer: Any, field: str, value: Any) -> Predicate:
+    try:
+        port = int(value)
+    except ValueError:
+        return never
+    if field == "sport":
+
+        def predicate(packet: Any) -> bool:
+            header = packet.getlayer(layer)
+            return header is not None and header.sport == port
+
+    else:
+
+        def predicate(packet: Any) -> bool:
+            header = packet.getlayer(layer)
+            return header is not None and header.dport == port
+
+    return predicate
+
+
+def _address_predicate(field: str, value: Any) -> Predicate:
+    try:
+        network = parse_network(value)
+    except ValueError:
+        return never
+    if network.version != 4:
+        # only IPv4 packets are simulated
+        return never
+    address = int(network.network_address)
+    mask = int(network.netmask)
+    if field == "src":
+
+        def predicate(packet: Any) -> bool:
+            ip = packet.getlayer(all.IP)
+            return ip is not None and ip_to_int(ip.src) & mask == address
+
+    else:
+
+        def predicate(packet: Any) -> bool:
+            ip = packet.getlayer(all.IP)
+            return ip is not None and ip_to_int(ip.dst) & mask == address
+
+    return predicate
+
+
+# compile methods of the option templates, module level functions so the
+# templates can be pickled
+
+
+def compile_tcp(value: Any) -> Predicate:
+    return _layer_predicate(all.TCP)
+
+
+def compile_udp(value: Any) -> Predicate:
+    return _layer_predicate(all.UDP)
+
+
+def compile_tcp_sport(value: Any) -> Predicate:
+    return _port_predicate(all.TCP, "sport", value)
+
+
+def compile_tcp_dport(value: Any) -> Predicate:
+    return _port_predicate(all.TCP, "dport", value)
+
+
+def compile_udp_sport(value: Any) -> Predicate:
+    return _port_predicate(all.UDP, "sport", value)
+
+
+def compile_udp_dport(value: Any) -> Predicate:
+    return _port_predicate(all.UDP, "dport", value)
+
+
+def compile_source(value: Any) -> Predicate:
+    return _address_predicate("src", value)
+
+
+def compile_destination(value: Any) -> Predicate:
+    return _address_predicate("dst", value)
+
+
+def compile_state(value: Any) -> Predicate:
+    """
+    --state, against the state the connection tracker stamped on the
+    packet, packets it did not see never match
+    """
+    states = frozenset(value.split(","))
+
+    def predicate(packet: Any) -> bool:
+        return getattr(packet, "ct_state", None) in states
+
+    return predicate
+
+
+def compile_drop(value: Any) -> Target:
+    def target(packet: Any) -> Any:
+        return "DROP"
+
+    return target
+
+
+def compile_accept(value: Any) -> Target:
+    def target(packet: Any) -> Any:
+        return packet
+
+    return target
+
+
+def clear_checksums(packet: Any) -> None:
+    """
+    Has scapy compute the IP and TCP/UDP checksums of a rewritten packet
+    again when it is encoded, it keeps the dissected ones otherwise, a UDP
+    checksum of 0 (none) is kept
+    """
+    ip = packet.getlayer(all.IP)
+    if ip is not None:
+        del ip.chksum
+    for layer in [all.TCP, all.UDP]:
+        header = packet.getlayer(layer)
+        if header is not None and not (layer is all.UDP and header.chksum == 0):
+            del header.chksum
+
+
+def _nat_target(field: str, value: Any) -> Target:
+    """
+    Rewrites the address field ("src" or "dst") and, if given, the port
+    of a TCP/UDP packet
+
+    Header views are patched in their bytes where they can be (see
+    HeaderView.set_endpoints), other packets through scapy.
+    """
+    port_field = "sport" if field == "src" else "dport"
+    parts = value.split(":")
+    address = parts[0]
+    port = int(parts[1]) if len(parts) == 2 and parts[1].isdigit() else None
+    try:
+        endpoint: Optional[Tuple[int, int]] = (ip_to_int(address), port or 0)
+    except OSError:
+        endpoint = None
+    ends = (endpoint, None) if field == "src" else (None, endpoint)
+
+    def target(packet: Any) -> Any:
+        # header views, predicates can not import them
+        set_endpoints = getattr(packet, "set_endpoints", None)
+        if set_endpoints is not None:
+            if endpoint is not None and port != 0 and set_endpoints(*ends):
+                # the same results as rewriting the scapy packet
+                return None if port is None else packet
+            packet = packet.packet
+        ip = packet.getlayer(all.IP)
+        if ip is None:
+            return None
+        setattr(ip, field, address)
+        if port is not None:
+            for layer in [all.TCP, all.UDP]:
+                header = packet.getlayer(layer)
+                if header is not None:
+                    setattr(header, port_field, port)
+                    clear_checksums(packet)
+                    return packet
+        clear_checksums(packet)
+        return None
+
+    return target
+
+
+def compile_snat(value: Any) -> Target:
+    return _nat_target("src", value)
+
+
+def compile_dnat(value: Any) -> Target:
+    return _nat_target("dst", value)
+
+
+def compile_condition(component: Any) -> Predicate:
+    """
+    Uses the template's compile_method, conditions that only have a
+    condition_method are wrapped, ones with neither never match
+    """
+    value = component.get("value", "")
+    factory = component.get("compile_method")
+    if factory is not None:
+        return factory(value)
+    method = component.get("condition_method")
+    if method is None:
+        return never
+    return lambda packet: method(packet, value)
+
+
+def compile_action(component: Any) -> Target:
+    value = component.get("value", "")
+    factory = component.get("compile_method")
+    if factory is not None:
+        return factory(value)
+    method = component["action_method"]
+    return lambda packet: method(packet, value)
+
+
+def all_of(predicates: List[Predicate]) -> Predicate:
+    if not predicates:
+        return always
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+
+        def both(packet: Any) -> bool:
+            return first(packet) and second(packet)
+
+        return both
+    remaining = tuple(predicates)
+
+    def every(packet: Any) -> bool:
+        for predicate in remaining:
+            if not predicate(packet):
+                return False
+        return True
+
+    return every
+
+
+def condition_positions(components: List[Any]) -> List[int]:
+    """
+    Indexes of the condition components, in textual order
+    """
+    return [
+        position
+        for position, component in enumerate(components)
+        if component.get("type") == "condition"
+    ]
+
+
+def compile_components(
+    components: List[Any], order: Optional[List[int]] = None
+) -> Tuple[Predicate, Optional[Target]]:
+    """
+    The conditions of a rule as one predicate and its target, None if it
+    has none
+
+    order, if given, is the order the conditions are checked in, indexes
+    of every condition component (see condition_positions).
+    """
+    positions = condition_positions(components)
+    if order is not None:
+        if sorted(order) != positions:
+            raise ValueError("not an order of the conditions: {}".format(order))
+        positions = order
+    predicates = [compile_condition(components[position]) for position in positions]
+    target = None
+    for component in components:
+        if component.get("type") == "action":
+            target = compile_action(component)
+    return all_of(predicates), target
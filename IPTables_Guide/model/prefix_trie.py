@@ -0,0 +1,88 @@
+from typing import List, Optional
+
+
+class _Node:
+    __slots__ = ("length", "prefix", "rules", "matched", "children")
+
+    def __init__(self, length: int, prefix: int, rules: int = 0):
+        self.length = length
+        # the top length bits of the network
+        self.prefix = prefix
+        # rules with exactly this prefix
+        self.rules = rules
+        # rules with this prefix or a shorter one containing it
+        self.matched = rules
+        self.children: List[Optional["_Node"]] = [None, None]
+
+
+def _common_length(length_a: int, prefix_a: int, length_b: int, prefix_b: int) -> int:
+    length = min(length_a, length_b)
+    diff = (prefix_a >> (length_a - length)) ^ (prefix_b >> (length_b - length))
+    return length - diff.bit_length()
+
+
+class PrefixTrie:
+    """
+    Path compressed binary trie of IPv4 prefixes
+
+    Every prefix carries a bitset of rules (bit i for the i-th rule of the
+    chain), a lookup returns the union of the bitsets of all prefixes that
+    contain the address. The union is computed for every node by build(),
+    so a lookup is a walk to the longest matching prefix.
+    """
+
+    BITS = 32
+
+    def __init__(self):
+        self.root = _Node(0, 0)
+
+    def insert(self, length: int, network: int, rules: int) -> None:
+        """
+        network is the address as an integer, bits after length are ignored
+        """
+        prefix = network >> (self.BITS - length)
+        node = self.root
+        while True:
+            if node.length == length:
+                node.rules |= rules
+                return
+            branch = (prefix >> (length - node.length - 1)) & 1
+            child = node.children[branch]
+            if child is None:
+                node.children[branch] = _Node(length, prefix, rules)
+                return
+            common = _common_length(child.length, child.prefix, length, prefix)
+            if common == child.length:
+                node = child
+                continue
+            split = _Node(common, prefix >> (length - common))
+            split.children[(child.prefix >> (child.length - common - 1)) & 1] = child
+            node.children[branch] = split
+            if common == length:
+                split.rules = rules
+            else:
+                split.children[(prefix >> (length - common - 1)) & 1] = _Node(
+                    length, prefix, rules
+                )
+            return
+
+    def build(self) -> None:
+        """
+        Has to be called after the last insert
+        """
+        stack = [(self.root, 0)]
+        while stack:
+            node, inherited = stack.pop()
+            node.matched = inherited | node.rules
+            for child in node.children:
+                if child is not None:
+                    stack.append((child, node.matched))
+
+    def lookup(self, address: int) -> int:
+        node = self.root
+        while node.length < self.BITS:
+            child = node.children[(address >> (self.BITS - 1 - node.length)) & 1]
+            if child is None or address >> (self.BITS - child.length) != child.prefix:
+                break
+            node = child
+        return node.matched
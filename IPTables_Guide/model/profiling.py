@@ -0,0 +1,459 @@
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from IPTables_Guide.model.classifier import ChainClassifier, CompiledRule, packet_fields
+from IPTables_Guide.model.headers import as_scapy
+from IPTables_Guide.model.predicates import (
+    Predicate,
+    Target,
+    compile_action,
+    compile_condition,
+    condition_positions,
+)
+
+# latencies kept per timing for the percentiles
+RESERVOIR_SIZE = 4096
+
+# the columns of the text report, the name comes last
+REPORT_HEADER = (
+    "calls",
+    "matches",
+    "total ms",
+    "mean us",
+    "p50 us",
+    "p90 us",
+    "p99 us",
+)
+
+# (table, chain, index in the chain or None, rule text)
+RuleKey = Tuple[str, str, Optional[int], str]
+
+
+def component_kind(component: Any) -> str:
+    """
+    The name profiles group a component by: its condition or action
+    method, its compile method for options without one
+    """
+    for key in ["condition_method", "action_method", "compile_method"]:
+        method = component.get(key)
+        if method is not None:
+            return method.__name__
+    return component.get("str_form", "?")
+
+
+class Timing:
+    """
+    Calls, matches and latencies of one rule, chain or component
+
+    The latencies of at most RESERVOIR_SIZE calls are kept, a uniform
+    sample of every call.
+    """
+
+    __slots__ = ("calls", "matches", "total_ns", "samples", "_random")
+
+    def __init__(self, rng: random.Random):
+        self.calls = 0
+        self.matches = 0
+        self.total_ns = 0
+        self.samples: List[int] = []
+        self._random = rng
+
+    def add(self, elapsed_ns: int, matched: bool) -> None:
+        self.calls += 1
+        self.matches += matched
+        self.total_ns += elapsed_ns
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(elapsed_ns)
+        else:
+            slot = self._random.randrange(self.calls)
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = elapsed_ns
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0.0
+
+    @property
+    def selectivity(self) -> float:
+        """
+        Share of the calls that matched
+        """
+        return self.matches / self.calls if self.calls else 0.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Nanoseconds, q between 0 and 100
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return float(ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))])
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "matches": self.matches,
+            "total_ms": self.total_ns / 1e6,
+            "mean_us": self.mean_ns / 1e3,
+            "p50_us": self.percentile(50) / 1e3,
+            "p90_us": self.percentile(90) / 1e3,
+            "p99_us": self.percentile(99) / 1e3,
+        }
+
+
+class RuleProfile:
+    """
+    The timing of a rule as a whole and of each of its conditions, by the
+    index of the condition's component in the rule
+    """
+
+    __slots__ = ("timing", "conditions")
+
+    def __init__(self, timing: Timing):
+        self.timing = timing
+        self.conditions: Dict[int, Timing] = {}
+
+
+# a condition as the profiler checks it: the predicate, the timing of the
+# condition in its rule and the timing of its component kind
+ProfiledCondition = Tuple[Predicate, Timing, Timing]
+
+
+def _check(
+    conditions: List[ProfiledCondition], packet: Any, exhaustive: bool = False
+) -> bool:
+    """
+    Whether the packet meets every condition, exhaustive checks the ones
+    after a condition that is not met too
+    """
+    result = True
+    for predicate, timing, kind_timing in conditions:
+        mark = time.perf_counter_ns()
+        met = predicate(packet)
+        elapsed = time.perf_counter_ns() - mark
+        timing.add(elapsed, met)
+        kind_timing.add(elapsed, met)
+        if not met:
+            if not exhaustive:
+                return False
+            result = False
+    return result
+
+
+class Profiler:
+    """
+    Opt-in timing of rule evaluation, per chain, per rule and per
+    component kind (see component_kind)
+
+    Nothing is timed unless a profiler is handed to Rule.run_on_packet or
+    to the chain runners of RuleSystem, which then evaluate through
+    ProfiledClassifier, so runs without one cost what they did.
+    """
+
+    def __init__(self, seed: int = 0):
+        self._random = random.Random(seed)
+        self.chains: Dict[Tuple[str, str], Timing] = {}
+        self.rules: Dict[RuleKey, RuleProfile] = {}
+        self.components: Dict[str, Timing] = {}
+        # (id of a rule, its index) -> (its components, order of the
+        # conditions, profile, conditions, target)
+        self._compiled: Dict[Tuple[int, Optional[int]], Tuple[Any, ...]] = {}
+
+    def timing(self) -> Timing:
+        return Timing(self._random)
+
+    def chain_timing(self, table: str, chain: str) -> Timing:
+        key = (table.upper(), chain.upper())
+        timing = self.chains.get(key)
+        if timing is None:
+            timing = self.chains[key] = self.timing()
+        return timing
+
+    def rule_profile(
+        self, table: str, chain: str, index: Optional[int], text: str
+    ) -> RuleProfile:
+        key = (table.upper(), chain.upper(), index, text)
+        profile = self.rules.get(key)
+        if profile is None:
+            profile = self.rules[key] = RuleProfile(self.timing())
+        return profile
+
+    def component_timing(self, kind: str) -> Timing:
+        timing = self.components.get(kind)
+        if timing is None:
+            timing = self.components[kind] = self.timing()
+        return timing
+
+    def profiled_condition(
+        self, profile: RuleProfile, predicate: Predicate, position: int, component: Any
+    ) -> ProfiledCondition:
+        timing = profile.conditions.get(position)
+        if timing is None:
+            timing = profile.conditions[position] = self.timing()
+        return predicate, timing, self.component_timing(component_kind(component))
+
+    def _compile(self, rule: Any, index: Optional[int]) -> Tuple[Any, ...]:
+        key = (id(rule), index)
+        order = rule.condition_order
+        compiled = self._compiled.get(key)
+        if (
+            compiled is None
+            or compiled[0] is not rule.components
+            or compiled[1] != order
+        ):
+            profile = self.rule_profile(rule.table, rule.chain, index, rule.raw_form)
+            positions = (
+                order if order is not None else condition_positions(rule.components)
+            )
+            conditions = [
+                self.profiled_condition(
+                    profile,
+                    compile_condition(rule.components[position]),
+                    position,
+                    rule.components[position],
+                )
+                for position in positions
+            ]
+            target = None
+            for component in rule.components:
+                if component.get("type") == "action":
+                    target = (
+                        compile_action(component),
+                        self.component_timing(component_kind(component)),
+                    )
+            compiled = (rule.components, order, profile, conditions, target)
+            self._compiled[key] = compiled
+        return compiled
+
+    def check_conditions(
+        self,
+        rule: Any,
+        packet: Any,
+        index: Optional[int] = None,
+        exhaustive: bool = False,
+    ) -> bool:
+        """
+        Whether the packet meets the conditions of the rule, in the order
+        the rule checks them, timing each, the target is not run
+
+        index is the rule's index in its chain, to tell apart rules with
+        the same text. exhaustive checks every condition, not only the ones
+        up to the first that is not met, so each is measured on every
+        packet rather than on the ones the conditions before it passed.
+        """
+        _, _, profile, conditions, _ = self._compile(rule, index)
+        start = time.perf_counter_ns()
+        met = _check(conditions, packet, exhaustive)
+        profile.timing.add(time.perf_counter_ns() - start, met)
+        return met
+
+    def run_rule(
+        self, rule: Any, packet: Any, index: Optional[int] = None
+    ) -> Tuple[bool, Optional[Any]]:
+        """
+        Rule.run_on_packet, timing each condition and the target
+        """
+        _, _, profile, conditions, target = self._compile(rule, index)
+        start = time.perf_counter_ns()
+        if not _check(conditions, packet):
+            profile.timing.add(time.perf_counter_ns() - start, False)
+            return False, None
+        result = None
+        if target is not None:
+            result = _run_target(target, packet)
+        profile.timing.add(time.perf_counter_ns() - start, True)
+        return True, result
+
+    def report(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        The chains, rules and component kinds, each slowest (by total
+        time) first
+        """
+
+        def entries(items, describe):
+            ordered = sorted(items, key=lambda item: -item[1].total_ns)
+            return [dict(describe(key), **timing.summary()) for key, timing in ordered]
+
+        return {
+            "chains": entries(
+                self.chains.items(),
+                lambda key: {"table": key[0], "chain": key[1]},
+            ),
+            "rules": entries(
+                [(key, profile.timing) for key, profile in self.rules.items()],
+                lambda key: {
+                    "table": key[0],
+                    "chain": key[1],
+                    "index": key[2],
+                    "rule": key[3],
+                },
+            ),
+            "components": entries(
+                self.components.items(), lambda key: {"component": key}
+            ),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.report(), indent=2)
+
+    def format_report(self) -> str:
+        report = self.report()
+        lines = []
+        for section, describe in [
+            ("chains", lambda entry: "{table} {chain}".format(**entry)),
+            (
+                "rules",
+                lambda entry: "{} {} #{} {}".format(
+                    entry["table"],
+                    entry["chain"],
+                    "-" if entry["index"] is None else entry["index"],
+                    entry["rule"],
+                ),
+            ),
+            ("components", lambda entry: entry["component"]),
+        ]:
+            if not report[section]:
+                continue
+            lines.append(
+                "".join("{:>11}".format(column) for column in REPORT_HEADER)
+                + "  "
+                + section
+            )
+            for entry in report[section]:
+                lines.append(
+                    "{:>11}{:>11}{:>11.3f}{:>11.3f}{:>11.3f}{:>11.3f}{:>11.3f}  {}".format(
+                        entry["calls"],
+                        entry["matches"],
+                        entry["total_ms"],
+                        entry["mean_us"],
+                        entry["p50_us"],
+                        entry["p90_us"],
+                        entry["p99_us"],
+                        describe(entry),
+                    )
+                )
+            lines.append("")
+        return "\n".join(lines)
+
+
+def _run_target(target: Tuple[Target, Timing], packet: Any) -> Any:
+    method, timing = target
+    mark = time.perf_counter_ns()
+    result = method(packet)
+    timing.add(time.perf_counter_ns() - mark, bool(result))
+    return result
+
+
+class _ProfiledRule:
+    __slots__ = ("compiled", "profile", "conditions", "target")
+
+    def __init__(
+        self,
+        compiled: CompiledRule,
+        profile: RuleProfile,
+        conditions: List[ProfiledCondition],
+        target: Optional[Tuple[Target, Timing]],
+    ):
+        self.compiled = compiled
+        self.profile = profile
+        self.conditions = conditions
+        self.target = target
+
+
+class ProfiledClassifier:
+    """
+    A ChainClassifier whose decide times the index lookup, every rule it
+    tries, their residual conditions and targets, with the same results
+
+    The index lookup is reported as the "classifier index" component.
+    """
+
+    def __init__(
+        self, classifier: ChainClassifier, profiler: Profiler, table: str, chain: str
+    ):
+        self.classifier = classifier
+        self.profiler = profiler
+        self._chain = profiler.chain_timing(table, chain)
+        self._index = profiler.component_timing("classifier index")
+        self._rules: Dict[int, _ProfiledRule] = {}
+        for compiled in classifier.compiled_rules:
+            rule = classifier.rules[compiled.index]
+            profile = profiler.rule_profile(table, chain, compiled.index, rule.raw_form)
+            conditions = [
+                profiler.profiled_condition(
+                    profile, predicate, position, rule.components[position]
+                )
+                for predicate, position in zip(
+                    compiled.residual, compiled.residual_positions
+                )
+            ]
+            target = None
+            if compiled.target is not None:
+                target = (
+                    compiled.run_target,
+                    profiler.component_timing(component_kind(compiled.action)),
+                )
+            self._rules[compiled.index] = _ProfiledRule(
+                compiled, profile, conditions, target
+            )
+
+    @property
+    def rules(self) -> List[Any]:
+        return self.classifier.rules
+
+    @property
+    def compiled_rules(self) -> List[CompiledRule]:
+        return self.classifier.compiled_rules
+
+    def _try(self, rule: _ProfiledRule, packet: Any) -> Tuple[bool, Any]:
+        """
+        Whether the residual conditions are met, and what the target (if
+        any) returned then
+        """
+        start = time.perf_counter_ns()
+        if rule.conditions and not _check(rule.conditions, as_scapy(packet)):
+            rule.profile.timing.add(time.perf_counter_ns() - start, False)
+            return False, None
+        result = None
+        if rule.target is not None:
+            result = _run_target(rule.target, packet)
+        rule.profile.timing.add(time.perf_counter_ns() - start, True)
+        return True, result
+
+    def decide(
+        self, packet: Any, start: int = 0, matched: Optional[List[int]] = None
+    ) -> Tuple[Optional[CompiledRule], Optional[Any]]:
+        began = time.perf_counter_ns()
+        fields = packet_fields(packet)
+        while True:
+            mark = time.perf_counter_ns()
+            candidates = self.classifier.candidates(fields) >> start << start
+            self._index.add(time.perf_counter_ns() - mark, bool(candidates))
+            decided = None
+            while candidates:
+                lowest = candidates & -candidates
+                rule = self._rules[lowest.bit_length() - 1]
+                met, result = self._try(rule, packet)
+                if met and rule.target is not None:
+                    decided = rule.compiled
+                    break
+                if met and matched is not None:
+                    matched.append(rule.compiled.index)
+                candidates ^= lowest
+            if decided is None:
+                self._chain.add(time.perf_counter_ns() - began, False)
+                return None, None
+            if result:
+                self._chain.add(time.perf_counter_ns() - began, True)
+                return decided, result
+            if matched is not None:
+                matched.append(decided.index)
+            # the target may have rewritten the packet before giving up on it
+            packet = as_scapy(packet)
+            fields = packet_fields(packet)
+            start = decided.index + 1
+
+    def run_on_packet(self, packet: Any, start: int = 0) -> Optional[Any]:
+        return self.decide(packet, start)[1]
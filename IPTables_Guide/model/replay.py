@@ -0,0 +1,237 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional
+
+from IPTables_Guide.model.evaluation import input_packet
+from IPTables_Guide.model.headers import HeaderView, as_scapy
+from IPTables_Guide.model.pcap_io import CaptureWriter
+
+# packets the evaluator takes off the queue at once before yielding
+BATCH_SIZE = 64
+
+
+class ReplaySample(NamedTuple):
+    """
+    How the evaluation kept up during one interval of a replay
+    """
+
+    # seconds since the replay started
+    time: float
+    packets: int
+    packets_per_second: float
+    # packets waiting to be evaluated at the end of the interval
+    queue_depth: int
+    # most seconds a packet of the interval waited past its capture time
+    lag: float
+    # whether the lag went over the driver's lag_limit
+    lagging: bool
+
+
+@dataclass
+class ReplayReport:
+    packets: int = 0
+    accepted: int = 0
+    elapsed: float = 0.0
+    samples: List[ReplaySample] = field(default_factory=list)
+
+    @property
+    def dropped(self) -> int:
+        return self.packets - self.accepted
+
+    @property
+    def max_lag(self) -> float:
+        return max((sample.lag for sample in self.samples), default=0.0)
+
+    @property
+    def kept_up(self) -> bool:
+        """
+        Whether no interval of the replay lagged
+        """
+        for sample in self.samples:
+            if sample.lagging:
+                return False
+        return True
+
+
+def packet_time(packet: Any) -> float:
+    """
+    Capture timestamp of a header view, scapy packet or model Packet, raw
+    frames (bytes) have none
+    """
+    if isinstance(packet, HeaderView):
+        return packet.time
+    if isinstance(packet, (bytes, bytearray, memoryview)):
+        raise TypeError("raw frames have no capture time, replay them with speed None")
+    get_scapy_packet = getattr(packet, "get_scapy_packet", None)
+    if get_scapy_packet is not None:
+        packet = get_scapy_packet()
+    return float(as_scapy(packet).time)
+
+
+class ReplayDriver:
+    """
+    Feeds packets to a chain at the pace they were captured, speed times
+    faster (None for as fast as possible), through a queue of queue_size
+    packets
+
+    A reader task sleeps until each packet is due and puts it on the
+    queue, waiting while the queue is full, the evaluator takes packets off
+    it and runs them through RuleSystem.evaluate_packets. A packet's lag is
+    how long after it was due it was evaluated (after it was read, when
+    not paced). Every interval seconds a ReplaySample is taken and handed
+    to on_sample, if given.
+    """
+
+    def __init__(
+        self,
+        system: Any,
+        table: Any,
+        chain: Any,
+        speed: Optional[float] = 1.0,
+        queue_size: int = 1024,
+        interval: float = 1.0,
+        lag_limit: float = 0.1,
+        on_sample: Optional[Callable[[ReplaySample], None]] = None,
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed has to be positive, or None")
+        self.system = system
+        self.table = table
+        self.chain = chain
+        self.speed = speed
+        self.queue_size = queue_size
+        self.interval = interval
+        self.lag_limit = lag_limit
+        self.on_sample = on_sample
+
+    async def run(
+        self, packets: Iterable[Any], output: Optional[CaptureWriter] = None
+    ) -> ReplayReport:
+        """
+        Replays the packets, writing the ones the chain passes to output,
+        raises what reading the packets raised once the ones read before
+        are evaluated
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        report = ReplayReport()
+        start = loop.time()
+        window = _Window()
+
+        async def read() -> None:
+            first = None
+            try:
+                for packet in packets:
+                    if self.speed is None:
+                        due = loop.time()
+                    else:
+                        captured = packet_time(packet)
+                        if first is None:
+                            first = captured
+                        due = start + (captured - first) / self.speed
+                        delay = due - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    # header views, for the output to copy what it can
+                    await queue.put((input_packet(packet), due))
+            except Exception:
+                # the evaluator stops at the end marker, awaiting the
+                # reader raises the error
+                await queue.put(None)
+                raise
+            await queue.put(None)
+
+        async def sample() -> None:
+            while True:
+                await asyncio.sleep(self.interval)
+                self._sample(report, window, loop.time() - start, queue.qsize())
+
+        reader = asyncio.ensure_future(read())
+        sampler = asyncio.ensure_future(sample())
+        try:
+            await self._evaluate(queue, report, window, loop, output)
+            await reader
+        finally:
+            reader.cancel()
+            sampler.cancel()
+        report.elapsed = loop.time() - start
+        if window.packets or not report.samples:
+            self._sample(report, window, report.elapsed, queue.qsize())
+        return report
+
+    async def _evaluate(
+        self,
+        queue: asyncio.Queue,
+        report: ReplayReport,
+        window: "_Window",
+        loop: asyncio.AbstractEventLoop,
+        output: Optional[CaptureWriter],
+    ) -> None:
+        pending: Deque[Any] = deque()
+        verdicts = self.system.evaluate_packets(_taken(pending), self.table, self.chain)
+        try:
+            while True:
+                batch = [await queue.get()]
+                while len(batch) < BATCH_SIZE and not queue.empty():
+                    batch.append(queue.get_nowait())
+                for item in batch:
+                    if item is None:
+                        return
+                    packet, due = item
+                    pending.append(packet)
+                    verdict = next(verdicts)
+                    window.add(loop.time() - due)
+                    report.packets += 1
+                    if verdict.packet is not None:
+                        report.accepted += 1
+                        if output is not None:
+                            output.write(verdict.packet)
+                # let the reader and the sampler run
+                await asyncio.sleep(0)
+        finally:
+            verdicts.close()
+
+    def _sample(
+        self, report: ReplayReport, window: "_Window", time: float, depth: int
+    ) -> None:
+        previous = report.samples[-1].time if report.samples else 0.0
+        duration = time - previous
+        sample = ReplaySample(
+            time,
+            window.packets,
+            window.packets / duration if duration > 0 else 0.0,
+            depth,
+            window.lag,
+            window.lag > self.lag_limit,
+        )
+        window.packets = 0
+        window.lag = 0.0
+        report.samples.append(sample)
+        if self.on_sample is not None:
+            self.on_sample(sample)
+
+
+class _Window:
+    """
+    What the evaluator did since the last sample
+    """
+
+    __slots__ = ("packets", "lag")
+
+    def __init__(self):
+        self.packets = 0
+        self.lag = 0.0
+
+    def add(self, lag: float) -> None:
+        self.packets += 1
+        if lag > self.lag:
+            self.lag = lag
+
+
+def _taken(pending: Deque[Any]) -> Iterator[Any]:
+    """
+    The packets put in pending, one for every verdict asked for
+    """
+    while True:
+        yield pending.popleft()
@@ -1,7 +1,21 @@
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Union, Any
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 from abc import abstractmethod
 
+from IPTables_Guide.model.components import Component
+from IPTables_Guide.model.predicates import Predicate, Target, compile_components
+
 
 class SignatureComponent:
     @abstractmethod
@@ -10,13 +24,17 @@ class SignatureComponent:
 
 
 class StartComponent(SignatureComponent):
+    # number of tokens find_fit looks at
+    lookahead = 1
+
     def __init__(self, start_strs):
         self.start_strs = start_strs
+        self.components = {key: Component(value) for key, value in start_strs.items()}
 
     def find_fit(self, substr: List[str]) -> Optional[Tuple[Dict[str, str], List[str]]]:
         to_find = substr[0]
         if to_find in self.start_strs:
-            return self.start_strs[to_find], substr[1:]
+            return self.components[to_find], substr[1:]
         else:
             return None
 
@@ -27,13 +45,16 @@ class StartComponent(SignatureComponent):
 
 
 class TableComponent(SignatureComponent):
+    lookahead = 2
+
     def __init__(self, tables: Dict[str, Dict[str, str]]):
         self.possible_tables = tables
+        self.components = {key: Component(value) for key, value in tables.items()}
 
     def find_fit(self, substr: List[str]) -> Optional[Tuple[Dict[str, str], List[str]]]:
         to_find = " ".join(substr[:2])
         if to_find in self.possible_tables:
-            return self.possible_tables[to_find], substr[2:]
+            return self.components[to_find], substr[2:]
         else:
             return None
 
@@ -45,41 +66,172 @@ class TableComponent(SignatureComponent):
         return self.possible_tables
 
 
+class OptionStep(NamedTuple):
+    """
+    One option RuleSpecification.resume fitted
+    """
+
+    # the tokens the parsers with fixed first tokens looked at
+    tokens: List[str]
+    # len(tokens), None if a floating parser fitted, those look at all of
+    # the remaining tokens
+    lookahead: Optional[int]
+    # the parsers fitted before
+    seen: FrozenSet[int]
+    # the floating parsers not tried, they failed on a longer list
+    skipped: FrozenSet[int]
+    # the floating parsers tried before the one that fitted, they failed
+    failed: Tuple[int, ...]
+    index: int
+    components: List[Any]
+    # the number of tokens consumed, or the remaining tokens if they were
+    # not a suffix
+    rest: Union[int, List[str]]
+
+
 class RuleSpecification:
     def __init__(self, spec_components):
         self.possible_components = spec_components
+        # spec parsers keyed by the token they have to start with, parsers
+        # without a fixed first token (e.g. "-p tcp" is searched anywhere)
+        # are tried at every position
+        self._by_first_token: Dict[str, List[int]] = {}
+        self._floating: List[int] = []
+        # the number of tokens the parsers starting with a token look at,
+        # None if one of them does not say
+        self._lookahead: Dict[str, Optional[int]] = {}
+        for i, component in enumerate(spec_components):
+            first_tokens = getattr(component, "first_tokens", None)
+            if first_tokens is None:
+                self._floating.append(i)
+                continue
+            window = getattr(component, "lookahead", None)
+            for token in first_tokens:
+                self._by_first_token.setdefault(token, []).append(i)
+                if token not in self._lookahead:
+                    self._lookahead[token] = window
+                elif window is None or self._lookahead[token] is None:
+                    self._lookahead[token] = None
+                else:
+                    self._lookahead[token] = max(self._lookahead[token], window)
 
     def find_fit(self, substr: List[str]) -> Optional[Tuple[List[Any], List[str]]]:
-        specs = []
-        i = 0
-        already_seen = []
-        while i < len(self.possible_components) and substr:
-            if i not in already_seen:
+        return self.resume(substr, [])[0]
+
+    def resume(
+        self, substr: List[str], steps: List[OptionStep]
+    ) -> Tuple[Optional[Tuple[List[Any], List[str]]], List[OptionStep]]:
+        """
+        find_fit, reusing the options an earlier call parsed (its steps)
+        where the tokens they looked at are unchanged, with the steps of
+        this call
+
+        A step depends on the parsers fitted before it, on the tokens the
+        parsers with fixed first tokens look at and on the floating parsers
+        (e.g. "-p tcp", which collects its --dport from anywhere) failing
+        before the one that fitted, those are tried again to reuse it.
+        """
+        specs: List[Any] = []
+        already_seen: FrozenSet[int] = frozenset()
+        # until a floating parser fits, the lists are suffixes of each other
+        skipped: FrozenSet[int] = frozenset()
+        done: List[OptionStep] = []
+        while substr:
+            k = len(done)
+            if k < len(steps) and self._reusable(
+                steps[k], substr, already_seen, skipped
+            ):
+                # only steps of parsers with fixed first tokens are reused
+                step = steps[k]
+                specs += step.components
+                substr = substr[step.rest :]
+                already_seen = already_seen | {step.index}
+                skipped = skipped | self._given_up(step.failed)
+                done.append(step)
+                continue
+            candidates = sorted(
+                i
+                for i in self._by_first_token.get(substr[0], []) + self._floating
+                if i not in already_seen and i not in skipped
+            )
+            lookahead = self._lookahead.get(substr[0], 0)
+            tokens = substr[:lookahead]
+            failed: List[int] = []
+            for i in candidates:
                 result = self.possible_components[i].find_fit(substr)
-                if result:
-                    if type(result[0]) == list:
-                        specs += result[0]
-                        substr = result[1]
-                    else:
-                        specs.append(result[0])
-                        substr = result[1]
-                    already_seen.append(i)
-                    i = 0
-            i += 1
-        return (specs, substr) if len(specs) > 0 else None
+                if not result:
+                    if i in self._floating:
+                        failed.append(i)
+                    continue
+                components = list(result[0]) if type(result[0]) == list else [result[0]]
+                step = OptionStep(
+                    tokens,
+                    lookahead,
+                    already_seen,
+                    skipped,
+                    tuple(failed),
+                    i,
+                    components,
+                    len(substr) - len(result[1]),
+                )
+                if i in self._floating:
+                    # it may have taken tokens from anywhere
+                    step = step._replace(
+                        lookahead=None, tokens=[], rest=list(result[1])
+                    )
+                    skipped = frozenset()
+                else:
+                    skipped = skipped | self._given_up(step.failed)
+                specs += components
+                substr = result[1]
+                done.append(step)
+                already_seen = already_seen | {i}
+                break
+            else:
+                break
+        return ((specs, substr) if len(specs) > 0 else None), done
+
+    def _given_up(self, failed: Tuple[int, ...]) -> FrozenSet[int]:
+        return frozenset(
+            i
+            for i in failed
+            if getattr(self.possible_components[i], "fails_on_suffixes", False)
+        )
+
+    def _reusable(
+        self,
+        step: OptionStep,
+        substr: List[str],
+        already_seen: FrozenSet[int],
+        skipped: FrozenSet[int],
+    ) -> bool:
+        if step.lookahead is None:
+            return False
+        if step.seen != already_seen or step.skipped != skipped:
+            return False
+        if substr[: step.lookahead] != step.tokens:
+            return False
+        for i in step.failed:
+            # floating parsers may consume the list they get
+            if self.possible_components[i].find_fit(list(substr)):
+                return False
+        return True
 
     def possible_elements(self, rule):
         pass
 
 
 class CommandComponent(SignatureComponent):
+    lookahead = 1
+
     def __init__(self, commands):
         self.possible_commands = commands
+        self.components = {key: Component(value) for key, value in commands.items()}
 
     def find_fit(self, substr: List[str]) -> Optional[Tuple[Dict[str, str], List[str]]]:
         to_find = substr[0]
         if to_find in self.possible_commands:
-            return self.possible_commands[to_find], substr[1:]
+            return self.components[to_find], substr[1:]
         else:
             return None
 
@@ -92,8 +244,11 @@ class CommandComponent(SignatureComponent):
 
 
 class ChainComponent:
+    lookahead = 1
+
     def __init__(self, chains):
         self.possible_chains = chains
+        self.components = {key: Component(value) for key, value in chains.items()}
 
     def find_fit(
         self, substr: List[str], table: Optional[str] = ""
@@ -103,7 +258,7 @@ class ChainComponent:
             to_find in self.possible_chains
             and table in self.possible_chains[to_find]["tables"]
         ):
-            return self.possible_chains[to_find], substr[1:]
+            return self.components[to_find], substr[1:]
         else:
             return None
 
@@ -115,7 +270,252 @@ class ChainComponent:
         return self.possible_chains
 
 
+def copy_components(components: List[Any]) -> List[Any]:
+    return [component.copy() for component in components]
+
+
+def _component_key(part) -> Any:
+    """
+    Components built from the same option table parse the same way,
+    so they can share a node of the signature tree
+    """
+    if isinstance(part, StartComponent):
+        return StartComponent, id(part.start_strs)
+    if isinstance(part, TableComponent):
+        return TableComponent, id(part.possible_tables)
+    if isinstance(part, CommandComponent):
+        return CommandComponent, id(part.possible_commands)
+    if isinstance(part, ChainComponent):
+        return ChainComponent, id(part.possible_chains)
+    return id(part)
+
+
+class SignatureGrammar:
+    """
+    Rule signatures compiled into a prefix tree
+
+    The common start/table/command/chain prefix of the signatures is parsed
+    once per rule, every signature continues from the memoized state of
+    its shared prefix.
+    """
+
+    def __init__(
+        self,
+        signatures: List[
+            List[Union[SignatureComponent, ChainComponent, RuleSpecification]]
+        ],
+    ):
+        self.signatures = signatures
+        self._parts: List[Any] = []
+        self._parents: List[int] = []
+        self._paths: List[List[int]] = []
+        nodes: Dict[Tuple[int, Any], int] = {}
+        for signature in signatures:
+            parent = -1
+            path = []
+            for part in signature:
+                key = (parent, _component_key(part))
+                if key not in nodes:
+                    nodes[key] = len(self._parts)
+                    self._parts.append(part)
+                    self._parents.append(parent)
+                parent = nodes[key]
+                path.append(parent)
+            self._paths.append(path)
+
+    @staticmethod
+    def _step(
+        rule,
+        part,
+        components: List[Any],
+        substr: List[str],
+        tokens,
+        option_steps: Optional[List[OptionStep]] = None,
+    ):
+        result: Any = ()
+        # parsers may consume the list they get, it is shared between branches
+        if type(part) == ChainComponent:
+            result = part.find_fit(list(substr), rule.table)
+            if result:
+                rule.chain = result[0]["value"]
+        elif type(part) == RuleSpecification and option_steps is not None:
+            # the options of the previous parse are replaced by these
+            result, option_steps[:] = part.resume(list(substr), option_steps)
+        else:
+            result = part.find_fit(list(substr))
+        lookahead = getattr(part, "lookahead", None)
+        # tokens[:needed] determine the result, None if it depends on all of them
+        needed = (
+            len(tokens) - len(substr) + lookahead if lookahead is not None else None
+        )
+        if not result:
+            return components, substr, rule.table, rule.chain, needed
+        if type(part) == TableComponent and rule.table == "":
+            rule.table = result[0]["value"]
+        if type(part) == RuleSpecification:
+            components = components + result[0]
+        else:
+            components = components + [result[0]]
+        return components, result[1], rule.table, rule.chain, needed
+
+    def parse(
+        self,
+        rule,
+        keep_best_estimate=True,
+        states: Optional[Dict[int, Tuple[Any, ...]]] = None,
+        option_steps: Optional[Dict[int, List[OptionStep]]] = None,
+    ) -> Optional[List[Any]]:
+        """
+        states and option_steps, if given, hold what an earlier parse of
+        the rule left (see reusable_states and RuleSpecification.resume),
+        they are updated to this parse
+        """
+        tokens = rule.raw_form.split(" ")
+        if states is None:
+            states = {}
+        visited = set()
+        best_components: List[Any] = []
+        best_components_length = 0
+        best_substr: List[str] = tokens
+        possible_elements: List[Any] = []
+        for signature, path in zip(self.signatures, self._paths):
+            components: List[Any] = []
+            substr = tokens
+            i = 0
+            while i < len(path) and substr:
+                node = path[i]
+                if node not in states:
+                    states[node] = self._step(
+                        rule,
+                        self._parts[node],
+                        components,
+                        substr,
+                        tokens,
+                        option_steps.setdefault(node, [])
+                        if option_steps is not None
+                        else None,
+                    )
+                elif node not in visited:
+                    # state kept from an earlier parse, replay its side effects
+                    rule.table, rule.chain = states[node][2:4]
+                visited.add(node)
+                components, substr = states[node][:2]
+                i += 1
+            if i < len(signature) - 1 and len(substr) == 0:
+                possible_elements.append(signature[i].possible_elements(rule))
+                possible_elements.append(signature[i + 1].possible_elements(rule))
+            if i == len(signature) and len(substr) == 0:
+                if keep_best_estimate:
+                    return [components, [], []]
+            if keep_best_estimate and len(components) > best_components_length:
+                best_components = components
+                best_components_length = len(components)
+                best_substr = substr
+        return (
+            [best_components, best_substr, possible_elements]
+            if keep_best_estimate
+            else None
+        )
+
+    def reusable_states(
+        self,
+        states: Dict[int, Tuple[Any, ...]],
+        old_tokens: List[str],
+        new_tokens: List[str],
+    ) -> Dict[int, Tuple[Any, ...]]:
+        """
+        Keeps the states which only depend on the unchanged token prefix,
+        rebased onto the new tokens
+        """
+        common = 0
+        shorter = min(len(old_tokens), len(new_tokens))
+        while common < shorter and old_tokens[common] == new_tokens[common]:
+            common += 1
+        kept: Dict[int, Tuple[Any, ...]] = {}
+        # parents are always numbered before their children
+        for node in sorted(states):
+            components, substr, table, chain, needed = states[node]
+            parent = self._parents[node]
+            if needed is None or needed > common:
+                continue
+            if parent != -1 and parent not in kept:
+                continue
+            end = len(old_tokens) - len(substr)
+            kept[node] = (components, new_tokens[end:], table, chain, needed)
+        return kept
+
+
+def unrecognised_message(token_count: int, remaining: List[str]) -> str:
+    return "unrecognised element at position {}: {}".format(
+        token_count - len(remaining), remaining[0]
+    )
+
+
+@dataclass
+class ParseResult:
+    components: List[Any]
+    remaining: List[str]
+    possible_elements: List[Any]
+    diagnostics: List[str] = field(default_factory=list)
+
+
+class IncrementalRuleParser:
+    """
+    Parser for a rule that is being edited
+
+    The results of the start/table/command/chain components, and of every
+    option, are kept between calls as long as the tokens they looked at are
+    unchanged, so each edit is only re-parsed from the first changed token.
+    The protocol options ("-p tcp" with its --sport/--dport) look at all
+    of the option tokens and are parsed again on every edit.
+    """
+
+    def __init__(
+        self, grammar: SignatureGrammar, table: str = "", chain: str = ""
+    ) -> None:
+        self.grammar = grammar
+        self.table = table
+        self.chain = chain
+        self._tokens: List[str] = []
+        self._states: Dict[int, Tuple[Any, ...]] = {}
+        self._option_steps: Dict[int, List[OptionStep]] = {}
+
+    def parse(self, raw_form: str) -> Tuple["Rule", ParseResult]:
+        rule = Rule(
+            "", self.grammar.signatures, self.table, self.chain, grammar=self.grammar
+        )
+        rule.raw_form = raw_form
+        tokens = raw_form.split(" ")
+        states = self.grammar.reusable_states(self._states, self._tokens, tokens)
+        components, remaining, possible_elements = self.grammar.parse(
+            rule, True, states, self._option_steps
+        )
+        self._tokens = tokens
+        self._states = states
+        rule.components = copy_components(components)
+        rule.possible_elements = possible_elements
+        diagnostics = []
+        if raw_form and remaining:
+            diagnostics.append(unrecognised_message(len(tokens), remaining))
+        return rule, ParseResult(
+            rule.components, remaining, possible_elements, diagnostics
+        )
+
+
 class Rule:
+    __slots__ = (
+        "table",
+        "signatures",
+        "grammar",
+        "chain",
+        "_raw_form",
+        "components",
+        "possible_elements",
+        "_matcher",
+        "packets",
+        "bytes",
+    )
+
     def __init__(
         self,
         raw_form: str,
@@ -125,13 +525,23 @@ class Rule:
         table: str,
         chain: str,
         allow_partial_rule=True,
+        grammar: Optional[SignatureGrammar] = None,
     ):
         self.table = table
         self.signatures = signatures
+        self.grammar = grammar if grammar else SignatureGrammar(signatures)
         self.chain = chain
         self.raw_form = raw_form
         self.components: List[Any] = []
-        self.possible_elements: List[Any] = []
+        self.possible_elements: Sequence[Any] = ()
+        # (components, predicate, target, order of the conditions or None)
+        # compiled by matcher()
+        self._matcher: Optional[
+            Tuple[List[Any], Predicate, Optional[Target], Optional[List[int]]]
+        ] = None
+        # the packets the rule matched, like the counters of iptables -v
+        self.packets = 0
+        self.bytes = 0
         if self.raw_form:
             if allow_partial_rule:
                 parsed_components, substr, possible_elements = self.parse_raw_form(
@@ -141,93 +551,111 @@ class Rule:
                 parsed_components = self.parse_raw_form(allow_partial_rule)
             if parsed_components:
                 self.components = parsed_components
+            self.compact_raw_form()
+
+    @property
+    def raw_form(self) -> str:
+        if self._raw_form is None:
+            return self._joined_str_form()
+        return self._raw_form
+
+    @raw_form.setter
+    def raw_form(self, raw_form: Optional[str]) -> None:
+        self._raw_form = raw_form
+
+    def _joined_str_form(self) -> str:
+        return " ".join(component["str_form"] for component in self.components)
+
+    def compact_raw_form(self) -> None:
+        """
+        Stops storing raw_form if the components spell it out exactly
+        """
+        try:
+            if self._raw_form == self._joined_str_form():
+                self._raw_form = None
+        except KeyError:
+            pass
 
     def parse_raw_form(self, keep_best_estimate=True) -> Optional[List[Any]]:
-        best_components = []
-        best_components_length = 0
-        possible_elements = []
-        substr = []
-        for signature in self.signatures:
-            substr = self.raw_form.split(" ")
-            components = []
-            i = 0
-            while i < len(signature) and substr:
-                part = signature[i]
-                result: Any = ()
-                if type(part) == ChainComponent:
-                    result = part.find_fit(substr, self.table)  # type: ignore
-                    if result:
-                        self.chain = result[0]["value"]
-                else:
-                    result = part.find_fit(substr)  # type: ignore
-                if result:
-                    if type(part) == TableComponent and self.table == "":
-                        self.table = result[0]["value"]
-                    if type(part) == RuleSpecification:
-                        components += result[0]
-                    else:
-                        components.append(result[0])
-                    substr = result[1]
-                i += 1
-            if i < len(signature) - 1 and len(substr) == 0:
-                possible_elements.append(signature[i].possible_elements(self))
-                possible_elements.append(signature[i + 1].possible_elements(self))
-            if i == len(signature) and len(substr) == 0:
-                if keep_best_estimate:
-                    return [components, [], []]
-            if keep_best_estimate and len(components) > best_components_length:
-                best_components = components
-                best_components_length = len(components)
-        return (
-            [best_components, substr, possible_elements] if keep_best_estimate else None
-        )
+        return self.grammar.parse(self, keep_best_estimate)
 
     def check_total_correctness(self) -> bool:
-        raw_parts = [component["str_form"] for component in self.components]
-        actual_raw_form = " ".join(raw_parts)
+        actual_raw_form = self._joined_str_form()
         return self.parse_raw_form(actual_raw_form) != None
 
     def check_partial_correctness(self) -> bool:
-        raw_parts = [component["str_form"] for component in self.components]
-        self.raw_form = " ".join(raw_parts)
+        self.raw_form = None
         result = self.parse_raw_form(True)
         if result:
             self.possible_elements = result[2]
-        return self.parse_raw_form(True) != None
-
-    def run_on_packet(self, packet) -> Tuple[bool, Optional[Any]]:
-        conditions_met = True
-        run_method = None
-        for component in self.components:
-            if "type" in component:
-                if component["type"] == "condition":
-                    if "value" not in component:
-                        component["value"] = ""
-                    conditions_met = conditions_met and component["condition_method"](
-                        packet, component["value"]
-                    )
-                    if not conditions_met:
-                        return False, None
-                elif component["type"] == "action":
-                    run_method = component["action_method"]
-                    method_value = ""
-                    if "value" in component:
-                        method_value = component["value"]
-        if conditions_met and run_method:
-            return True, run_method(packet, method_value)
+        return result != None
+
+    def matcher(self) -> Tuple[Predicate, Optional[Target]]:
+        """
+        The conditions compiled into one predicate and the target, compiled
+        again if the components changed
+        """
+        if self._matcher is None or self._matcher[0] is not self.components:
+            self.set_condition_order(None)
+        return self._matcher[1], self._matcher[2]
+
+    @property
+    def condition_order(self) -> Optional[List[int]]:
+        """
+        The order the conditions are checked in, indexes of components,
+        None for textual order
+        """
+        if self._matcher is None or self._matcher[0] is not self.components:
+            return None
+        return self._matcher[3]
+
+    def set_condition_order(self, order: Optional[List[int]]) -> None:
+        """
+        Checks the conditions in the given order (see condition_order) until
+        the components change, the conditions have no side effects so the
+        rule matches the same packets
+        """
+        self._matcher = (
+            (self.components,) + compile_components(self.components, order) + (order,)
+        )
+
+    def reset_counters(self) -> None:
+        self.packets = 0
+        self.bytes = 0
+
+    def run_on_packet(self, packet, profiler=None) -> Tuple[bool, Optional[Any]]:
+        """
+        (whether the conditions are met, what the target returned), the
+        profiler (see profiling.Profiler), if given, times the conditions
+        and the target
+        """
+        if profiler is not None:
+            return profiler.run_rule(self, packet)
+        predicate, target = self.matcher()
+        if not predicate(packet):
+            return False, None
+        if target is None:
+            # no target, the packet goes on to the next rule
+            return True, None
+        return True, target(packet)
 
     def delete_element(self, id: int) -> bool:
         if len(self.components) > id:
             del self.components[id]
+            self._matcher = None
             return True
         return False
 
-    def get_possible_elements(self) -> List:
+    def get_possible_elements(self) -> Sequence:
         return self.possible_elements
 
     def set_value(self, id: int, value) -> bool:
         if len(self.components) > id and "value" in self.components[id]:
-            self.components[id]["value"] = value
+            if isinstance(self.components[id], Component):
+                self.components[id] = self.components[id].with_value(value)
+            else:
+                self.components[id]["value"] = value
+            self._matcher = None
             return True
         return False
 
@@ -235,6 +663,5 @@ class Rule:
         return self.components
 
     def get_str_form(self):
-        raw_parts = [component["str_form"] for component in self.components]
-        self.raw_form = " ".join(raw_parts)
+        self.raw_form = None
         return self.raw_form
@@ -1,5 +1,8 @@
+import asyncio
+import itertools
+from collections import deque
 from enum import Enum
-from typing import List, Dict, Optional
+from typing import Any, Callable, Deque, List, Dict, Iterable, Iterator, Optional, Tuple
 import scapy.all as all
 from IPTables_Guide.model.parser_entries import *
 
@@ -12,7 +15,39 @@ from IPTables_Guide.model.rule_generator import (
     CommandComponent,
     ChainComponent,
     RuleSpecification,
+    SignatureGrammar,
+    IncrementalRuleParser,
+    copy_components,
+    unrecognised_message,
 )
+from IPTables_Guide.model.lru_cache import LRUCache
+from IPTables_Guide.model.iptables_save import (
+    LineError,
+    read_iptables_save,
+    write_iptables_save,
+)
+from IPTables_Guide.model.parallel_parsing import parse_rules
+from IPTables_Guide.model.completion import CompletionIndex
+from IPTables_Guide.model.classifier import ChainClassifier
+from IPTables_Guide.model.conntrack import ConnectionTracker, uses_state
+from IPTables_Guide.model.evaluation import (
+    ChainStatistics,
+    Verdict,
+    decide_capture,
+    input_packet,
+    output_packet,
+    verdict,
+)
+from IPTables_Guide.model.headers import LINKTYPE_ETHERNET
+from IPTables_Guide.model.packets import Packet
+from IPTables_Guide.model.parallel_evaluation import evaluate_capture_parallel
+from IPTables_Guide.model.pcap_io import CaptureWriter, read_pcap_headers
+from IPTables_Guide.model.traversal import TRAVERSAL_HOOKS, Stage, Traversal
+from IPTables_Guide.model.nat import NatStage
+from IPTables_Guide.model.profiling import ProfiledClassifier, Profiler
+from IPTables_Guide.model import condition_order
+from IPTables_Guide.model.verdict_cache import CachedClassifier, VerdictCache
+from IPTables_Guide.model.replay import ReplayDriver, ReplayReport, ReplaySample
 from IPTables_Guide.model.parser_entries import (
     start_strs,
     possible_chains,
@@ -70,18 +105,21 @@ def chain_to_value(chain: Union[Chain, str]) -> Chain:
     assert False
 
 
-class Packet:  # Remove once the original module can be included!
-    pass
-
-
 class RuleSystem(QObject):
     rule_appended = Signal(str, str)
     rule_inserted = Signal(str, str, int)
     rule_deleted = Signal(str, str, int)
+    counters_changed = Signal(str, str)
 
-    def __init__(self, rule_signatures=[]):
+    def __init__(
+        self, rule_signatures=[], rule_cache_size=4096, verdict_cache_size=65536
+    ):
         super().__init__()
         self._tables: Dict[str, Dict[str, List[Rule]]] = RuleSystem.empty_tables()
+        self._policies: Dict[str, Dict[str, str]] = {
+            table: {chain: "ACCEPT" for chain in chains}
+            for table, chains in self._tables.items()
+        }
         if rule_signatures:
             self._rule_signatures = rule_signatures
         else:
@@ -117,6 +155,16 @@ class RuleSystem(QObject):
                     ),
                 ],
             ]
+        self._grammar = SignatureGrammar(self._rule_signatures)
+        self._rule_cache = LRUCache(rule_cache_size)
+        # (table, chain) -> classifier, dropped whenever the chain changes
+        self._classifiers: Dict[Tuple[str, str], ChainClassifier] = {}
+        # (table, chain) -> (packets, bytes) the policy decided
+        self._policy_counters: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        # bumped whenever a chain changes, see get_verdict_cache
+        self._generation = 0
+        self._verdict_cache_size = verdict_cache_size
+        self._verdict_caches: Dict[Tuple[str, str], VerdictCache] = {}
 
     #    def __init__(self, table: Table, chain: Chain, rules: List[Rule]):
     #        self._tables: Dict[str, Dict[str, List[Rule]]] = RuleSystem.empty_tables()
@@ -138,12 +186,131 @@ class RuleSystem(QObject):
     def create_rule_from_raw_str(
         self, raw: str, table: Union[Table, str], chain: Union[Chain, str]
     ) -> Rule:
-        return Rule(
-            raw, self._rule_signatures, table_to_str(table), chain_to_str(chain)
+        table_str = table_to_str(table)
+        chain_str = chain_to_str(chain)
+        key = (raw, table_str, chain_str, id(self._rule_signatures))
+        cached = self._rule_cache.get(key)
+        if cached is None:
+            rule = Rule(
+                raw,
+                self._rule_signatures,
+                table_str,
+                chain_str,
+                grammar=self._grammar,
+            )
+            self._rule_cache.put(
+                key, (rule.table, rule.chain, copy_components(rule.components))
+            )
+            return rule
+        return self._build_rule(raw, *cached)
+
+    def _build_rule(self, raw: str, table: str, chain: str, components) -> Rule:
+        """
+        Rule from an already parsed components list
+        """
+        rule = Rule("", self._rule_signatures, table, chain, grammar=self._grammar)
+        rule.raw_form = raw
+        rule.components = copy_components(components)
+        return rule
+
+    def create_rule_parser(
+        self, table: Union[Table, str], chain: Union[Chain, str]
+    ) -> IncrementalRuleParser:
+        return IncrementalRuleParser(
+            self._grammar, table_to_str(table), chain_to_str(chain)
         )
 
-    def run_on_packet(self, packet: Packet) -> Packet:
-        pass
+    def create_completion_index(
+        self, table: Union[Table, str], chain: Union[Chain, str]
+    ) -> CompletionIndex:
+        return CompletionIndex(self._grammar, table_to_str(table), chain_to_str(chain))
+
+    @property
+    def rule_cache(self) -> LRUCache:
+        return self._rule_cache
+
+    def run_on_packet(
+        self,
+        packet: Union[Packet, Any],
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+    ) -> Optional[Any]:
+        """
+        The packet as the chain left it, None if the chain dropped it, see
+        evaluate_packets, the packet is the first of its connection
+        """
+        (result,) = self.evaluate_packets([packet], table, chain)
+        return result.packet
+
+    def evaluate_packets(
+        self,
+        packets: Iterable[Any],
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        vectorized: bool = False,
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+        linktype: int = LINKTYPE_ETHERNET,
+    ) -> Iterator[Verdict]:
+        """
+        The verdict of the chain on every packet, in order, evaluated as
+        they are asked for
+
+        The packets are scapy packets, raw frames of the linktype (bytes),
+        model Packets or header views, a PacketManager is iterated. The
+        packets of the verdicts are of the type they were given as (see
+        output_packet). The packets of one call are one capture: they share
+        their connections (see run_chain_on_raw_packets for the other
+        arguments). The counters of the chain are updated once the packets
+        run out, or the verdicts are no longer asked for.
+        """
+        statistics = ChainStatistics()
+        # the packets as given, taken ahead of their verdicts
+        given: Deque[Any] = deque()
+
+        def inputs() -> Iterator[Any]:
+            for packet in packets:
+                given.append(packet)
+                yield input_packet(packet, linktype)
+
+        try:
+            for result in self._decide_packets(
+                inputs(),
+                table,
+                chain,
+                statistics,
+                vectorized,
+                profiler,
+                cache_verdicts,
+            ):
+                yield result._replace(
+                    packet=output_packet(result.packet, given.popleft())
+                )
+        finally:
+            self.apply_statistics(table, chain, statistics)
+
+    def evaluate_batches(
+        self,
+        packets: Iterable[Any],
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        batch_size: int = 1024,
+        vectorized: bool = False,
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+        linktype: int = LINKTYPE_ETHERNET,
+    ) -> Iterator[List[Verdict]]:
+        """
+        evaluate_packets, batch_size verdicts at a time
+        """
+        verdicts = self.evaluate_packets(
+            packets, table, chain, vectorized, profiler, cache_verdicts, linktype
+        )
+        while True:
+            batch = list(itertools.islice(verdicts, batch_size))
+            if not batch:
+                return
+            yield batch
 
     def run_chain_on_raw_packets(
         self,
@@ -151,22 +318,388 @@ class RuleSystem(QObject):
         outputFileName: str,
         table: Union[Table, str],
         chain: Union[Chain, str],
-    ):
+        vectorized: bool = False,
+        processes: Optional[int] = 1,
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+    ) -> ChainStatistics:
+        """
+        vectorized evaluates the chain rule by rule over header columns of
+        the capture, worth it for large captures, processes > 1 (or None
+        for one per core) splits the capture between worker processes
+
+        Chains with --state conditions and nat chains follow the
+        connections of the capture, in capture order, so they are always
+        run in this process, nat chains one packet at a time (see NatStage).
+        With a profiler the chain is also run in this process one packet at
+        a time, timing every rule it tries (see ProfiledClassifier).
+        cache_verdicts runs it one packet at a time too, looking the
+        packets up in the chain's verdict cache first (see
+        get_verdict_cache), the statistics tell the hit rate.
+        The counters of the chain are updated once the run is over.
+        """
+        statistics = self._run_chain_on_raw_packets(
+            inputFileName,
+            outputFileName,
+            table,
+            chain,
+            vectorized,
+            processes,
+            profiler,
+            cache_verdicts,
+        )
+        self.apply_statistics(table, chain, statistics)
+        return statistics
+
+    def replay_raw_packets(
+        self,
+        inputFileName: str,
+        outputFileName: str,
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        speed: Optional[float] = 1.0,
+        queue_size: int = 1024,
+        interval: float = 1.0,
+        lag_limit: float = 0.1,
+        on_sample: Optional[Callable[[ReplaySample], None]] = None,
+    ) -> ReplayReport:
+        """
+        Runs a capture through the chain at the pace it was captured, speed
+        times faster (None for as fast as possible), the report tells
+        whether the evaluation kept up, see ReplayDriver
+        """
+        driver = ReplayDriver(
+            self, table, chain, speed, queue_size, interval, lag_limit, on_sample
+        )
+        with CaptureWriter(outputFileName) as output:
+            return asyncio.run(driver.run(read_pcap_headers(inputFileName), output))
+
+    def _run_chain_on_raw_packets(
+        self,
+        inputFileName: str,
+        outputFileName: str,
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        vectorized: bool = False,
+        processes: Optional[int] = 1,
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+    ) -> ChainStatistics:
+        statistics = ChainStatistics()
+        if processes != 1 and profiler is None and not cache_verdicts:
+            table = table_to_value(table)
+            chain = chain_to_value(chain)
+            if self._tracker(table, chain) is None:
+                classifier = self.get_classifier(table, chain)
+                with CaptureWriter(outputFileName) as output:
+                    for record in evaluate_capture_parallel(
+                        classifier,
+                        inputFileName,
+                        self.get_policy(table, chain) != "DROP",
+                        statistics,
+                        processes,
+                        vectorized,
+                    ):
+                        output.write_record(record)
+                return statistics
+        with CaptureWriter(outputFileName) as output:
+            for result in self._decide_packets(
+                read_pcap_headers(inputFileName),
+                table,
+                chain,
+                statistics,
+                vectorized,
+                profiler,
+                cache_verdicts,
+            ):
+                if result.packet is not None:
+                    output.write(result.packet)
+        return statistics
+
+    def _tracker(self, table: Table, chain: Chain) -> Optional[ConnectionTracker]:
+        """
+        A connection tracker if the chain needs one
+        """
+        rules = self.get_rules_in_chain(table, chain)
+        if uses_state(rules) or (table == Table.NAT and rules):
+            return ConnectionTracker()
+        return None
+
+    def _decide_packets(
+        self,
+        packets: Iterable[Any],
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        statistics: ChainStatistics,
+        vectorized: bool = False,
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+    ) -> Iterator[Verdict]:
+        """
+        The verdicts of the chain in this process, counted in statistics
+        """
         table = table_to_value(table)
         chain = chain_to_value(chain)
-        input = all.rdpcap(inputFileName)
-        rules = self.get_rules_in_chain(table, chain)
-        for packet in input:
-            rule_transformed_it = False
-            for rule in rules:
-                result = rule.run_on_packet(packet)
-                if result[0] and result[1]:
-                    rule_transformed_it = True
-                    if result[1] != "DROP":
-                        all.wrpcap(outputFileName, result[1], append=True)
-                    break
-            if not rule_transformed_it:
-                all.wrpcap(outputFileName, packet, append=True)
+        if profiler is not None or cache_verdicts:
+            vectorized = False
+        tracker = self._tracker(table, chain)
+        if table == Table.NAT and tracker is not None:
+            stage = self._stage(
+                table.value, chain.value, tracker, profiler, cache_verdicts
+            )
+            stage.statistics = statistics
+            try:
+                for packet in packets:
+                    _, connection, reply = tracker.follow(packet)
+                    rule_index, result = stage.decide(packet, connection, reply)
+                    yield verdict(rule_index, result)
+            finally:
+                self._count_cache_lookups(stage.classifier, statistics)
+            return
+        classifier = self._classifier(
+            table.value, chain.value, profiler, cache_verdicts
+        )
+        try:
+            yield from decide_capture(
+                classifier,
+                packets,
+                self.get_policy(table, chain) != "DROP",
+                statistics,
+                vectorized,
+                tracker,
+            )
+        finally:
+            self._count_cache_lookups(classifier, statistics)
+
+    def create_traversal(
+        self,
+        local_networks: Iterable[str] = (),
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+    ) -> Traversal:
+        """
+        The chains of every table compiled into one traversal, see
+        Traversal, local_networks are the addresses routed to INPUT, the
+        profiler, if given, times every chain, cache_verdicts has every
+        chain look packets up in its verdict cache first
+        """
+        hooks = [
+            (table, chain)
+            for table, chain in TRAVERSAL_HOOKS
+            if chain in self._tables[table]
+        ]
+        tracker = None
+        for table, chain in hooks:
+            rules = self._tables[table][chain]
+            if uses_state(rules) or (table == Table.NAT.value and rules):
+                tracker = ConnectionTracker()
+        stages = [
+            self._stage(table, chain, tracker, profiler, cache_verdicts)
+            for table, chain in hooks
+        ]
+        return Traversal(stages, local_networks, tracker)
+
+    def _classifier(
+        self,
+        table: str,
+        chain: str,
+        profiler: Optional[Profiler],
+        cache_verdicts: bool = False,
+    ) -> ChainClassifier:
+        """
+        The classifier of the chain as a run uses it, profiled runs are not
+        cached, every packet has to be evaluated to be timed
+        """
+        classifier = self.get_classifier(table, chain)
+        if profiler is not None:
+            return ProfiledClassifier(classifier, profiler, table, chain)
+        if cache_verdicts:
+            return CachedClassifier(classifier, self.get_verdict_cache(table, chain))
+        return classifier
+
+    @staticmethod
+    def _count_cache_lookups(classifier: Any, statistics: ChainStatistics) -> None:
+        if isinstance(classifier, CachedClassifier):
+            statistics.cache_hits += classifier.hits
+            statistics.cache_misses += classifier.misses
+
+    def _stage(
+        self,
+        table: str,
+        chain: str,
+        tracker: Optional[ConnectionTracker],
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+    ) -> Stage:
+        classifier = self._classifier(table, chain, profiler, cache_verdicts)
+        policy = self.get_policy(table, chain)
+        if table == Table.NAT.value and tracker is not None:
+            return NatStage(table, chain, classifier, policy, tracker)
+        return Stage(table, chain, classifier, policy)
+
+    def run_traversal_on_raw_packets(
+        self,
+        inputFileName: str,
+        outputFileName: str,
+        local_networks: Iterable[str] = (),
+        profiler: Optional[Profiler] = None,
+        cache_verdicts: bool = False,
+    ) -> Dict[Tuple[str, str], ChainStatistics]:
+        """
+        Runs a capture through every table and chain in hook order, reading
+        and writing it once, returns the statistics of each chain
+        """
+        traversal = self.create_traversal(local_networks, profiler, cache_verdicts)
+        with CaptureWriter(outputFileName) as output:
+            for packet in traversal.run(read_pcap_headers(inputFileName)):
+                output.write(packet)
+        for stage in traversal.stages.values():
+            self._count_cache_lookups(stage.classifier, stage.statistics)
+        for (table, chain), statistics in traversal.statistics.items():
+            self.apply_statistics(table, chain, statistics)
+        return traversal.statistics
+
+    def apply_statistics(
+        self,
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        statistics: ChainStatistics,
+    ) -> None:
+        """
+        Adds what a run counted to the counters of the chain's rules and
+        policy
+        """
+        table_str = table_to_str(table).upper()
+        chain_str = chain_to_str(chain).upper()
+        rules = self._tables[table_str][chain_str]
+        for index, packets in statistics.rule_packets.items():
+            rules[index].packets += packets
+            rules[index].bytes += statistics.rule_bytes.get(index, 0)
+        packets, bytes = self.get_policy_counters(table_str, chain_str)
+        self._policy_counters[(table_str, chain_str)] = (
+            packets + statistics.policy_packets,
+            bytes + statistics.policy_bytes,
+        )
+        self.counters_changed.emit(table_str, chain_str)
+
+    def get_policy_counters(
+        self, table: Union[Table, str], chain: Union[Chain, str]
+    ) -> Tuple[int, int]:
+        """
+        (packets, bytes) the chain policy decided
+        """
+        key = (table_to_str(table).upper(), chain_to_str(chain).upper())
+        return self._policy_counters.get(key, (0, 0))
+
+    def reset_counters(
+        self,
+        table: Optional[Union[Table, str]] = None,
+        chain: Optional[Union[Chain, str]] = None,
+    ) -> None:
+        """
+        Zeroes the counters of a chain, of every chain of a table if chain
+        is None, of everything if table is None too, like iptables -Z
+        """
+        for table_str, chains in self._tables.items():
+            if table is not None and table_to_str(table).upper() != table_str:
+                continue
+            for chain_str, rules in chains.items():
+                if chain is not None and chain_to_str(chain).upper() != chain_str:
+                    continue
+                for rule in rules:
+                    rule.reset_counters()
+                self._policy_counters.pop((table_str, chain_str), None)
+                self.counters_changed.emit(table_str, chain_str)
+
+    def sample_conditions(
+        self,
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        inputFileName: str,
+        sample_size: int = 1000,
+        profiler: Optional[Profiler] = None,
+    ) -> Profiler:
+        """
+        Profiles the conditions of every rule of the chain against the
+        first sample_size packets of a capture, see
+        condition_order.sample_conditions
+        """
+        packets = itertools.islice(read_pcap_headers(inputFileName), sample_size)
+        return condition_order.sample_conditions(
+            self.get_rules_in_chain(table, chain), packets, profiler
+        )
+
+    def optimize_condition_order(
+        self,
+        table: Union[Table, str],
+        chain: Union[Chain, str],
+        profiler: Profiler,
+        min_calls: int = condition_order.MIN_CALLS,
+    ) -> int:
+        """
+        Has the rules of the chain check their conditions cheapest and most
+        selective first, by what the profiler measured in a sampling run
+        (see sample_conditions) or in a profiled chain run, returns how many
+        rules changed order, which matches the same packets
+
+        The order is kept with the compiled rule until its components
+        change, a rule written back with overwrite_rule starts over.
+        """
+        table_str = table_to_str(table).upper()
+        chain_str = chain_to_str(chain).upper()
+        changed = condition_order.optimize_condition_order(
+            self.get_rules_in_chain(table_str, chain_str),
+            profiler,
+            table_str,
+            chain_str,
+            min_calls,
+        )
+        if changed:
+            self._classifiers.pop((table_str, chain_str), None)
+        return changed
+
+    @property
+    def generation(self) -> int:
+        """
+        Bumped by every change to the rules of a chain (append, insert,
+        delete, overwrite), decisions cached before are stale
+        """
+        return self._generation
+
+    def _chain_changed(self, table_str: str, chain_str: str) -> None:
+        self._classifiers.pop((table_str, chain_str), None)
+        self._generation += 1
+
+    def get_verdict_cache(
+        self, table: Union[Table, str], chain: Union[Chain, str]
+    ) -> VerdictCache:
+        """
+        The decisions of the chain by flow, kept between runs until the
+        rules change (see generation), its stats() count every run's
+        lookups
+        """
+        key = (table_to_str(table).upper(), chain_to_str(chain).upper())
+        cache = self._verdict_caches.get(key)
+        if cache is None:
+            cache = VerdictCache(self._verdict_cache_size)
+            self._verdict_caches[key] = cache
+        cache.check_generation(self._generation)
+        return cache
+
+    def get_classifier(
+        self, table: Union[Table, str], chain: Union[Chain, str]
+    ) -> ChainClassifier:
+        """
+        The chain compiled for first-match lookups, rebuilt after the chain
+        changed, rules edited in place have to be written back with
+        overwrite_rule
+        """
+        key = (table_to_str(table).upper(), chain_to_str(chain).upper())
+        classifier = self._classifiers.get(key)
+        if classifier is None:
+            classifier = ChainClassifier(self.get_rules_in_chain(table, chain))
+            self._classifiers[key] = classifier
+        return classifier
 
     def get_rule(
         self, table: Union[Table, str], chain: Union[Chain, str], id: int
@@ -203,6 +736,7 @@ class RuleSystem(QObject):
         ):
             try:
                 self._tables[table_str][chain_str][id] = rule
+                self._chain_changed(table_str, chain_str)
                 return True
             except (IndexError, KeyError):
                 return False
@@ -219,6 +753,7 @@ class RuleSystem(QObject):
         ):
             try:
                 self._tables[table_str][chain_str].append(rule)
+                self._chain_changed(table_str, chain_str)
                 self.rule_appended.emit(table_str, chain_str)
                 return True
             except (IndexError, KeyError):
@@ -244,6 +779,7 @@ class RuleSystem(QObject):
                     + [rule]
                     + self._tables[table_str][chain_str][rule_num:]
                 )
+                self._chain_changed(table_str, chain_str)
                 self.rule_inserted.emit(table_str, chain_str, rule_num)
                 return True
             except (IndexError, KeyError):
@@ -257,6 +793,7 @@ class RuleSystem(QObject):
         chain_str = chain_to_str(chain).upper()
         try:
             del self._tables[table_str][chain_str][rule_num]
+            self._chain_changed(table_str, chain_str)
             self.rule_deleted.emit(table_str, chain_str, rule_num)
             return True
         except (IndexError, KeyError):
@@ -284,8 +821,26 @@ class RuleSystem(QObject):
     def delete_chain(self, table: Table, chain: str):
         pass
 
-    def policy(self, table: Table, chain: str, target: str):
-        pass
+    def policy(self, table: Union[Table, str], chain: str, target: str) -> bool:
+        table_str = table_to_str(table).upper()
+        chain_str = chain_to_str(chain).upper()
+        if target not in ["ACCEPT", "DROP"]:
+            return False
+        try:
+            if chain_str not in self._policies[table_str]:
+                return False
+            self._policies[table_str][chain_str] = target
+            return True
+        except KeyError:
+            return False
+
+    def get_policy(self, table: Union[Table, str], chain: Union[Chain, str]) -> str:
+        try:
+            return self._policies[table_to_str(table).upper()][
+                chain_to_str(chain).upper()
+            ]
+        except KeyError:
+            return "ACCEPT"
 
     def rename_chain(self, table: Table, old_chain: str, new_chain: str):
         pass
@@ -302,20 +857,159 @@ class RuleSystem(QObject):
                     ]
                     f.writelines(rules)
 
-    def read_from_file(self, file_name):
-        table = ""
-        chain = ""
+    def read_from_file(self, file_name, processes=1):
+        """
+        processes > 1 (or None for one per core) parses large files
+        in a process pool
+        """
         with open(file_name, "r") as f:
-            lines = f.readlines()
-            for line in lines:
-                line = line.strip()
-                if len(line) > 0 and line[0] == "#":
-                    table, chain = line[1:].split(".")
-                else:
+            lines = self._rule_file_lines(f)
+            if processes == 1:
+                for _, line, table, chain in lines:
                     rule = self.create_rule_from_raw_str(line, table, chain)
                     self.append_rule(
                         Table(rule.table.upper()), Chain(rule.chain.upper()), rule
                     )
+                return
+            for line, table, chain, components, _ in parse_rules(
+                self._rule_signatures, lines, processes
+            ):
+                rule = self._build_rule(line, table, chain, components)
+                self.append_rule(
+                    Table(rule.table.upper()), Chain(rule.chain.upper()), rule
+                )
+
+    @staticmethod
+    def _rule_file_lines(lines: Iterable[str]):
+        table = ""
+        chain = ""
+        for line in lines:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            if line[0] == "#":
+                table, chain = line[1:].split(".")
+            else:
+                yield line, line, table, chain
+
+    def export_iptables_save(self, file_name: str) -> None:
+        """
+        Writes the rules in iptables-save -c format, with the counters
+        """
+        with open(file_name, "w") as f:
+            for line in self.iptables_save_lines():
+                f.write(line + "\n")
+
+    def iptables_save_lines(self) -> Iterator[str]:
+        tables = []
+        for table, chains in self._tables.items():
+            save_chains = [
+                (
+                    chain,
+                    self.get_policy(table, chain),
+                    self.get_policy_counters(table, chain),
+                )
+                for chain in chains
+            ]
+            save_rules = [
+                (rule.get_str_form(), (rule.packets, rule.bytes))
+                for rules in chains.values()
+                for rule in rules
+            ]
+            tables.append((table, save_chains, save_rules))
+        return write_iptables_save(tables)
+
+    def import_iptables_save(self, file_name, processes=1) -> List[LineError]:
+        """
+        Appends the rules of an iptables-save dump, returns the lines
+        that could not be imported
+        """
+        with open(file_name, "r") as f:
+            return self.import_iptables_save_lines(f, processes)
+
+    def import_iptables_save_lines(
+        self, lines: Iterable[str], processes=1
+    ) -> List[LineError]:
+        errors: List[LineError] = []
+        rule_lines = self._iptables_save_rules(lines, errors)
+        if processes == 1:
+            parser = self.create_rule_parser("", "")
+            for entry, raw, _, _ in rule_lines:
+                rule, result = parser.parse(raw)
+                self._append_imported_rule(entry, rule, result.remaining, errors)
+        else:
+            # policies and errors are applied here, not on the pool's
+            # feeder thread, the workers get the raw rules only
+            rule_lines = list(rule_lines)
+            for index, table, chain, components, remaining in parse_rules(
+                self._rule_signatures,
+                [
+                    (index, raw, "", "")
+                    for index, (_, raw, _, _) in enumerate(rule_lines)
+                ],
+                processes,
+            ):
+                entry, raw, _, _ = rule_lines[index]
+                rule = self._build_rule(raw, table, chain, components)
+                self._append_imported_rule(entry, rule, remaining, errors)
+        errors.sort(key=lambda error: error.line_number)
+        return errors
+
+    def _iptables_save_rules(self, lines: Iterable[str], errors: List[LineError]):
+        """
+        Applies the table and chain lines, yields the rules to be parsed
+        """
+        skipped_table = ""
+        for entry in read_iptables_save(lines):
+            if isinstance(entry, LineError):
+                errors.append(entry)
+            elif entry.kind == "table" and entry.table.upper() not in self._tables:
+                skipped_table = entry.table
+                errors.append(
+                    LineError(
+                        entry.line_number,
+                        "*" + entry.table,
+                        "unsupported table: {}".format(entry.table),
+                    )
+                )
+            elif entry.table == skipped_table:
+                continue
+            elif entry.kind == "chain":
+                if self.policy(entry.table, entry.chain, entry.value):
+                    if entry.counters is not None:
+                        key = (entry.table.upper(), entry.chain.upper())
+                        self._policy_counters[key] = entry.counters
+                else:
+                    errors.append(
+                        LineError(
+                            entry.line_number,
+                            ":{} {}".format(entry.chain, entry.value),
+                            "unsupported chain or policy",
+                        )
+                    )
+            elif entry.kind == "rule":
+                raw = "iptables -t {} {}".format(entry.table, entry.value)
+                yield entry, raw, "", ""
+
+    def _append_imported_rule(
+        self, entry, rule: Rule, remaining: List[str], errors: List[LineError]
+    ) -> None:
+        if remaining:
+            token_count = len(rule.raw_form.split(" "))
+            errors.append(
+                LineError(
+                    entry.line_number,
+                    entry.value,
+                    unrecognised_message(token_count, remaining),
+                )
+            )
+            return
+        if entry.counters is not None:
+            rule.packets, rule.bytes = entry.counters
+        if not self.append_rule(entry.table, entry.chain, rule):
+            errors.append(
+                LineError(entry.line_number, entry.value, "unsupported chain")
+            )
 
     @property
     def tables(self):
@@ -0,0 +1,134 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from IPTables_Guide.model.classifier import ChainClassifier, packet_fields
+from IPTables_Guide.model.conntrack import Connection, ConnectionTracker
+from IPTables_Guide.model.evaluation import ChainStatistics
+from IPTables_Guide.model.headers import HeaderView, packet_length
+from IPTables_Guide.model.predicates import parse_network
+
+# (table, chain) pairs in the order netfilter's hooks run them
+PREROUTING_HOOKS = [("NAT", "PREROUTING")]
+LOCAL_IN_HOOKS = [("FILTER", "INPUT"), ("NAT", "INPUT")]
+FORWARD_HOOKS = [("FILTER", "FORWARD"), ("NAT", "POSTROUTING")]
+TRAVERSAL_HOOKS = PREROUTING_HOOKS + LOCAL_IN_HOOKS + FORWARD_HOOKS
+
+
+class Stage:
+    """
+    One chain of the traversal, compiled once
+    """
+
+    def __init__(
+        self, table: str, chain: str, classifier: ChainClassifier, policy: str
+    ):
+        self.table = table
+        self.chain = chain
+        self.classifier = classifier
+        self.policy_accepts = policy != "DROP"
+        self.statistics = ChainStatistics()
+
+    def run(
+        self, packet: Any, connection: Optional[Connection] = None, reply: bool = False
+    ) -> Optional[Any]:
+        """
+        The packet as the chain left it, None if it was dropped, the
+        connection of the packet only matters to nat chains (see NatStage)
+        """
+        return self.decide(packet, connection, reply)[1]
+
+    def decide(
+        self, packet: Any, connection: Optional[Connection] = None, reply: bool = False
+    ) -> Tuple[Optional[int], Optional[Any]]:
+        """
+        The index of the rule that decided the packet (None for the policy)
+        and the packet as the chain left it, None if it was dropped
+        """
+        length = packet_length(packet)
+        matched: List[int] = []
+        rule, result = self.classifier.decide(packet, 0, matched)
+        if rule is None:
+            self.statistics.count(-1, self.policy_accepts, length, matched)
+            if not self.policy_accepts:
+                return None, None
+            if isinstance(packet, HeaderView) and packet.rewritten:
+                # the decoded fields are stale
+                return None, packet.packet
+            return None, packet
+        passed = result != "DROP"
+        self.statistics.count(rule.index, passed, length, matched)
+        return rule.index, result if passed else None
+
+
+class Traversal:
+    """
+    Routes packets through the chains of every table in netfilter's hook
+    order: nat PREROUTING, then the routing decision, then filter and nat
+    INPUT for packets to a local network, filter FORWARD and nat
+    POSTROUTING for the rest
+
+    The routing decision sees the destination PREROUTING's DNAT left.
+    Packets without an IPv4 header are forwarded. The tracker, if given,
+    stamps the packets with their --state before PREROUTING, as netfilter
+    does, and hands their connection to the stages.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        local_networks: Iterable[str] = (),
+        tracker: Optional[ConnectionTracker] = None,
+    ):
+        self.stages = {(stage.table, stage.chain): stage for stage in stages}
+        self.tracker = tracker
+        self.local_networks: List[Tuple[int, int]] = []
+        for value in local_networks:
+            network = parse_network(value)
+            if network.version == 4:
+                self.local_networks.append(
+                    (int(network.network_address), int(network.netmask))
+                )
+
+    def _hooks(self, hooks: List[Tuple[str, str]]) -> List[Stage]:
+        return [self.stages[hook] for hook in hooks if hook in self.stages]
+
+    def is_local(self, packet: Any) -> bool:
+        dst = packet_fields(packet).dst
+        if dst is None:
+            return False
+        for address, mask in self.local_networks:
+            if dst & mask == address:
+                return True
+        return False
+
+    def run_on_packet(self, packet: Any) -> Optional[Any]:
+        """
+        The packet as the last chain left it, None if a chain dropped it
+        """
+        connection = None
+        reply = False
+        if self.tracker is not None:
+            _, connection, reply = self.tracker.follow(packet)
+        for stage in self._hooks(PREROUTING_HOOKS):
+            packet = stage.run(packet, connection, reply)
+            if packet is None:
+                return None
+        hooks = LOCAL_IN_HOOKS if self.is_local(packet) else FORWARD_HOOKS
+        for stage in self._hooks(hooks):
+            packet = stage.run(packet, connection, reply)
+            if packet is None:
+                return None
+        return packet
+
+    def run(self, packets: Iterable[Any]) -> Iterator[Any]:
+        """
+        The packets that make it through, in capture order, header views
+        no chain rewrote as they were read (see capture_record)
+        """
+        for packet in packets:
+            result = self.run_on_packet(packet)
+            if result is not None:
+                yield result
+
+    @property
+    def statistics(self) -> Dict[Tuple[str, str], ChainStatistics]:
+        return {hook: stage.statistics for hook, stage in self.stages.items()}
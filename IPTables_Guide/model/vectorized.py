@@ -0,0 +1,188 @@
+import itertools
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from IPTables_Guide.model.classifier import (
+    ChainClassifier,
+    CompiledRule,
+    packet_fields,
+)
+from IPTables_Guide.model.headers import as_scapy
+from IPTables_Guide.model.predicates import compile_accept, compile_drop
+
+PROTOCOL_NUMBERS = {"tcp": 6, "udp": 17}
+
+# values of ChainVerdicts.verdict
+VERDICT_POLICY = 0
+VERDICT_ACCEPT = 1
+VERDICT_DROP = 2
+
+BUILTIN_VERDICTS = {compile_accept: VERDICT_ACCEPT, compile_drop: VERDICT_DROP}
+
+
+@dataclass
+class PacketColumns:
+    """
+    Header fields of a capture, one array element per packet
+
+    protocol is 0 for packets that are neither TCP nor UDP, ports are -1
+    for them, src/dst are only meaningful where has_ip is set.
+    """
+
+    has_ip: np.ndarray
+    protocol: np.ndarray
+    src: np.ndarray
+    dst: np.ndarray
+    sport: np.ndarray
+    dport: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.protocol)
+
+
+def extract_columns(packets: List[Any]) -> PacketColumns:
+    count = len(packets)
+    columns = PacketColumns(
+        has_ip=np.zeros(count, dtype=bool),
+        protocol=np.zeros(count, dtype=np.uint8),
+        src=np.zeros(count, dtype=np.uint32),
+        dst=np.zeros(count, dtype=np.uint32),
+        sport=np.full(count, -1, dtype=np.int32),
+        dport=np.full(count, -1, dtype=np.int32),
+    )
+    for i, packet in enumerate(packets):
+        fields = packet_fields(packet)
+        if fields.src is not None:
+            columns.has_ip[i] = True
+            columns.src[i] = fields.src
+            columns.dst[i] = fields.dst
+        if fields.protocol is not None:
+            columns.protocol[i] = PROTOCOL_NUMBERS[fields.protocol]
+            columns.sport[i] = fields.sport
+            columns.dport[i] = fields.dport
+    return columns
+
+
+def rule_mask(
+    rule: CompiledRule, columns: PacketColumns, packets: np.ndarray
+) -> np.ndarray:
+    """
+    Which of the given packets (indexes into columns) meet the rule's
+    indexed conditions
+    """
+    mask = np.ones(len(packets), dtype=bool)
+    if rule.protocol is not None:
+        mask &= columns.protocol[packets] == PROTOCOL_NUMBERS[rule.protocol]
+    if rule.sport is not None:
+        mask &= columns.sport[packets] == rule.sport
+    if rule.dport is not None:
+        mask &= columns.dport[packets] == rule.dport
+    for prefix, column in [(rule.src, columns.src), (rule.dst, columns.dst)]:
+        if prefix is None:
+            continue
+        length, network = prefix
+        mask &= columns.has_ip[packets]
+        if length:
+            netmask = np.uint32((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+            mask &= (column[packets] & netmask) == np.uint32(network)
+    return mask
+
+
+@dataclass
+class ChainVerdicts:
+    # index of the deciding rule in the chain, -1 where the policy applies
+    rule_index: np.ndarray
+    verdict: np.ndarray
+    # what targets other than ACCEPT/DROP returned, by packet index
+    results: Dict[int, Any]
+    # the other rules a packet matched before the deciding one (rules
+    # without a target, targets that gave up on it), by packet index
+    matched: Dict[int, List[int]]
+
+
+def evaluate_chain(
+    classifier: ChainClassifier,
+    packets: List[Any],
+    columns: Optional[PacketColumns] = None,
+) -> ChainVerdicts:
+    """
+    Runs a chain over a whole capture, one rule at a time
+
+    Every rule is a boolean mask over the packets no earlier rule claimed,
+    so the first match is kept without a Python call per packet and rule.
+    Rules without a target only record their matches, the packets stay
+    for the rules after them. Conditions without a column (and targets
+    other than ACCEPT/DROP) are still evaluated per packet, only for the
+    packets they apply to.
+    """
+    if columns is None:
+        columns = extract_columns(packets)
+    rule_index = np.full(len(columns), -1, dtype=np.int32)
+    verdict = np.full(len(columns), VERDICT_POLICY, dtype=np.uint8)
+    results: Dict[int, Any] = {}
+    matched: Dict[int, List[int]] = {}
+    remaining = np.arange(len(columns))
+    claims = []
+    for rule in classifier.compiled_rules:
+        if not len(remaining):
+            break
+        mask = rule_mask(rule, columns, remaining)
+        if rule.residual:
+            for position in np.flatnonzero(mask):
+                if not rule.residual_met(packets[remaining[position]]):
+                    mask[position] = False
+        claimed = remaining[mask]
+        if rule.target is None:
+            for i in claimed.tolist():
+                matched.setdefault(i, []).append(rule.index)
+        elif len(claimed):
+            rule_index[claimed] = rule.index
+            claims.append((rule, claimed))
+            remaining = remaining[~mask]
+
+    for rule, claimed in claims:
+        builtin = BUILTIN_VERDICTS.get(rule.action.get("compile_method"))
+        if builtin is not None:
+            verdict[claimed] = builtin
+            continue
+        for i in claimed.tolist():
+            result = rule.run_target(packets[i])
+            if not result:
+                # the target gave up on the packet, the rules after it decide
+                passed = matched.setdefault(i, [])
+                passed.append(rule.index)
+                deciding, result = classifier.decide(
+                    as_scapy(packets[i]), rule.index + 1, passed
+                )
+                rule_index[i] = -1 if deciding is None else deciding.index
+            if result:
+                dropped = isinstance(result, str) and result == "DROP"
+                verdict[i] = VERDICT_DROP if dropped else VERDICT_ACCEPT
+                results[i] = result
+    return ChainVerdicts(rule_index, verdict, results, matched)
+
+
+def evaluate_stream(
+    classifier: ChainClassifier, packets: Iterable[Any], chunk_size: int = 65536
+) -> Iterator[Tuple[Any, int, int, Any, List[int]]]:
+    """
+    (packet, index of the deciding rule or -1, verdict, what the target
+    returned or None, the other rules it matched) for a capture of any
+    size, evaluated chunk_size packets at a time
+    """
+    packets = iter(packets)
+    while True:
+        chunk = list(itertools.islice(packets, chunk_size))
+        if not chunk:
+            return
+        verdicts = evaluate_chain(classifier, chunk)
+        for i, packet in enumerate(chunk):
+            yield (
+                packet,
+                int(verdicts.rule_index[i]),
+                int(verdicts.verdict[i]),
+                verdicts.results.get(i),
+                verdicts.matched.get(i, []),
+            )
@@ -0,0 +1,121 @@
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from IPTables_Guide.model.classifier import ChainClassifier, CompiledRule, packet_fields
+from IPTables_Guide.model.headers import PacketFields, as_scapy
+from IPTables_Guide.model.lru_cache import LRUCache
+
+# index cached for packets the chain policy decides
+POLICY = -1
+
+
+class VerdictCache(LRUCache):
+    """
+    The deciding rule (its index, POLICY for the chain policy) of a chain
+    and the rules without a target matched before it, by the fields of the
+    packets, valid for one generation of the rules (see
+    RuleSystem.generation)
+    """
+
+    def __init__(self, max_size: int = 65536):
+        super().__init__(max_size)
+        self.generation: Optional[int] = None
+
+    def check_generation(self, generation: int) -> None:
+        """
+        Forgets every decision if the rules changed since they were cached
+        """
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+
+
+def _key_function(names: Tuple[str, ...]) -> Callable[[Any, PacketFields], Hashable]:
+    positions = [
+        PacketFields._fields.index(name) for name in names if name != "ct_state"
+    ]
+    state = "ct_state" in names
+
+    def key(packet: Any, fields: PacketFields) -> Hashable:
+        values = tuple(fields[position] for position in positions)
+        if state:
+            return values, getattr(packet, "ct_state", None)
+        return values
+
+    return key
+
+
+class CachedClassifier:
+    """
+    A ChainClassifier that remembers which rule decided a packet (and the
+    rules without a target it matched), keyed on the fields the chain
+    inspects (see ChainClassifier.inspected_fields), so packets of a flow
+    seen before cost one lookup
+
+    Only decisions that did not run a rewriting target (SNAT, DNAT) are
+    cached, the cached rule's target is run again on a hit, which for
+    ACCEPT and DROP is a constant. Chains with conditions on other fields
+    are not cached at all.
+    """
+
+    def __init__(self, classifier: ChainClassifier, cache: VerdictCache):
+        self.classifier = classifier
+        self.cache = cache
+        names = classifier.inspected_fields()
+        self._key = None if names is None else _key_function(names)
+        self._compiled = {rule.index: rule for rule in classifier.compiled_rules}
+        # lookups of this classifier, the cache counts every run's
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cacheable(self) -> bool:
+        return self._key is not None
+
+    @property
+    def rules(self) -> List[Any]:
+        return self.classifier.rules
+
+    @property
+    def compiled_rules(self) -> List[CompiledRule]:
+        return self.classifier.compiled_rules
+
+    def decide(
+        self, packet: Any, start: int = 0, matched: Optional[List[int]] = None
+    ) -> Tuple[Optional[CompiledRule], Optional[Any]]:
+        if start or self._key is None:
+            return self.classifier.decide(packet, start, matched)
+        fields = packet_fields(packet)
+        key = self._key(packet, fields)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            index, passed = cached
+            rule, result = None, None
+            if index != POLICY:
+                rule = self._compiled[index]
+                result = rule.run_target(packet)
+                if not result:
+                    return self.classifier.decide(packet, 0, matched)
+            if matched is not None:
+                matched += passed
+            return rule, result
+        self.misses += 1
+        passed: List[int] = []
+        rule = self.classifier.first_match(packet, fields, 0, passed)
+        if matched is not None:
+            matched += passed
+        if rule is None:
+            self.cache.put(key, (POLICY, tuple(passed)))
+            return None, None
+        result = rule.run_target(packet)
+        if result:
+            if not rule.rewrites:
+                self.cache.put(key, (rule.index, tuple(passed)))
+            return rule, result
+        if matched is not None:
+            matched.append(rule.index)
+        # the target may have rewritten the packet before giving up on it
+        return self.classifier.decide(as_scapy(packet), rule.index + 1, matched)
+
+    def run_on_packet(self, packet: Any, start: int = 0) -> Optional[Any]:
+        return self.decide(packet, start)[1]
@@ -23,6 +23,7 @@ from IPTables_Guide.view.help_window import display_help
 from IPTables_Guide.view.custom_widgets import CustomLineEdit
 
 from IPTables_Guide.model.rule_system import Table, RuleSystem
+from IPTables_Guide.model.iptables_save import format_counters
 
 
 class IPTableWindow(AbstractTableWindow):
@@ -36,7 +37,12 @@ class IPTableWindow(AbstractTableWindow):
         """
         super().__init__(
             "",
-            [("select", QCheckBox), ("rule", CustomLineEdit), ("check", QLabel)],
+            [
+                ("select", QCheckBox),
+                ("counters", QLabel),
+                ("rule", CustomLineEdit),
+                ("check", QLabel),
+            ],
             parent,
         )
 
@@ -62,6 +68,8 @@ class IPTableWindow(AbstractTableWindow):
         self.buttons = {}
         self.chain_widget = QWidget(self.menu_line)
         self.menu_line.layout().addWidget(self.chain_widget)
+        self.policy_label = QLabel(self.menu_line)
+        self.menu_line.layout().addWidget(self.policy_label)
         self.menu_line.layout().insertStretch(-1)  # type: ignore
 
         self.menu_line.setStyleSheet(
@@ -120,6 +128,12 @@ class IPTableWindow(AbstractTableWindow):
         self.chain_radiobuttons[0].setChecked(True)
 
         self.checked_value = self.chain_types[0]
+        self.rule_parser = self.model.create_rule_parser(
+            self.ip_table_type, self.checked_value
+        )
+        self.rule_completions = self.model.create_completion_index(
+            self.ip_table_type, self.checked_value
+        )
 
         self.table_label.setText(
             "sudo iptables -t " + self.ip_table_type.value + " -A " + self.checked_value
@@ -130,6 +144,8 @@ class IPTableWindow(AbstractTableWindow):
         self.model.rule_appended.connect(self.rule_appended)
         self.model.rule_inserted.connect(self.rule_inserted)
         self.model.rule_deleted.connect(self.rule_deleted)
+        self.model.counters_changed.connect(self.counters_changed)
+        self._show_policy_counters()
 
         self.table.setStyleSheet(
             """
@@ -171,6 +187,34 @@ class IPTableWindow(AbstractTableWindow):
         else:
             assert False
 
+    @Slot(str, str)
+    def counters_changed(self, table_str: str, chain_str: str) -> None:
+        """
+        handle model counters_changed
+        """
+        if self.ip_table_type.value == table_str and self.checked_value == chain_str:
+            for ind in range(len(self.table.get_column("counters"))):
+                self._show_counters(ind)
+            self._show_policy_counters()
+
+    def _show_counters(self, ind: int) -> None:
+        rule = self.model.get_rule(self.ip_table_type, self.checked_value, ind)
+        self.table[ind, "counters"].setText(  # type: ignore
+            format_counters(rule.packets, rule.bytes)
+        )
+
+    def _show_policy_counters(self) -> None:
+        self.policy_label.setText(
+            "{} {}".format(
+                self.model.get_policy(self.ip_table_type, self.checked_value),
+                format_counters(
+                    *self.model.get_policy_counters(
+                        self.ip_table_type, self.checked_value
+                    )
+                ),
+            )
+        )
+
     @override
     def _set_row(self, ind: int):
         """
@@ -181,23 +225,29 @@ class IPTableWindow(AbstractTableWindow):
                 self.ip_table_type, self.checked_value, ind
             ).get_str_form()
         )
+        self._show_counters(ind)
         self.table[ind, "check"].setText("")  # type: ignore
 
         @Slot(str)
         def text_edited(text: str) -> None:
+            typed_space = text.endswith(" ")
             text = " ".join(filter(lambda x: len(x), text.split(" ")))
-            assert self.model.update_rule(
-                self.ip_table_type,
-                self.checked_value,
-                ind,
-                text,
+            suggestions = self.rule_completions.complete(
+                text + " " if typed_space else text, limit=10
+            )
+            self.table[ind, "rule"].setToolTip(  # type: ignore
+                "\n".join(entry.text for entry in suggestions)
             )
-            rule = self.model.get_rule(
+            rule, result = self.rule_parser.parse(text)
+            assert self.model.overwrite_rule(
                 self.ip_table_type,
                 self.checked_value,
                 ind,
+                rule,
             )
-            if rule.check_partial_correctness():
+            # a replaced rule starts counting again, as with iptables -R
+            self._show_counters(ind)
+            if result.components or not text:
                 rule_text = rule.get_str_form()
                 if rule_text == text:
                     self.table[ind, "check"].setText("")  # type: ignore
@@ -219,11 +269,18 @@ class IPTableWindow(AbstractTableWindow):
         log_gui("entered setup rules " + text)
         self.table.clear_table()
         self.checked_value = text
+        self.rule_parser = self.model.create_rule_parser(
+            self.ip_table_type, self.checked_value
+        )
+        self.rule_completions = self.model.create_completion_index(
+            self.ip_table_type, self.checked_value
+        )
         for _ in self.model.get_rules_in_chain(self.ip_table_type, self.checked_value):
             self.append_row()
         self.table_label.setText(
             "sudo iptables -t " + self.ip_table_type.value + " -A " + self.checked_value
         )
+        self._show_policy_counters()
 
     @Slot()
     def append_clicked(self) -> None:
@@ -23,8 +23,12 @@ from IPTables_Guide.view.abstract_table_window import AbstractTableWindow
 from IPTables_Guide.view.gui_utils import log_gui
 
 from IPTables_Guide.model.packets import PacketType, Packet
+from IPTables_Guide.model.predicates import parse_network
 from IPTables_Guide.model.rule_system import RuleSystem
 
+# table choice that runs the packets through every table and chain
+TRAVERSAL_CHOICE = "Teljes bejárás"
+
 
 class PacketWindow(QWidget):
     """"""
@@ -81,6 +85,8 @@ class PacketWindow(QWidget):
         self.output_label = QLabel("Kimeneti fájl:", self)
         self.input_text = QLineEdit(self)
         self.output_text = QLineEdit(self)
+        self.local_label = QLabel("Helyi hálózatok (vesszővel elválasztva):", self)
+        self.local_text = QLineEdit(self)
         self.table = QComboBox(self)
         self.chain = QComboBox(self)
 
@@ -90,13 +96,17 @@ class PacketWindow(QWidget):
         self.main_layout.addWidget(self.input_text, 1, 0, 1, 2)
         self.main_layout.addWidget(self.output_label, 2, 0)
         self.main_layout.addWidget(self.output_text, 3, 0, 1, 2)
-        self.main_layout.addWidget(self.table, 4, 0)
-        self.main_layout.addWidget(self.chain, 4, 1)
-        self.main_layout.addWidget(self.run_button, 5, 1)
+        self.main_layout.addWidget(self.local_label, 4, 0)
+        self.main_layout.addWidget(self.local_text, 5, 0, 1, 2)
+        self.main_layout.addWidget(self.table, 6, 0)
+        self.main_layout.addWidget(self.chain, 6, 1)
+        self.main_layout.addWidget(self.run_button, 7, 1)
 
         self.setLayout(self.main_layout)
 
-        self.table.addItems(["Válassz"] + list(self.model.tables.keys()))
+        self.table.addItems(
+            ["Válassz"] + list(self.model.tables.keys()) + [TRAVERSAL_CHOICE]
+        )
         self.chain.addItems(["Válassz"])
 
         @Slot(str)
@@ -112,9 +122,45 @@ class PacketWindow(QWidget):
 
         self.table.currentTextChanged.connect(reinit_chain_values)  # type: ignore
 
+        def valid_files(input_file: str, output_file: str) -> bool:
+            return (
+                sum(output_file.count(c) for c in ["|", "<", ">", ":", '"', "?", "*"])
+                == 0
+            ) and os.path.isfile(input_file)
+
+        def show_success() -> None:
+            msg_box = QMessageBox()
+            msg_box.setWindowTitle("Csomagküldés")
+            msg_box.setIcon(QMessageBox.Information)
+            msg_box.setText("Sikeres futtatás!")
+            msg_box.exec()
+
         @Slot()
         def run_packet():
-            if (
+            if self.table.currentText() == TRAVERSAL_CHOICE and self.input_text.text():
+                input_file = self.input_text.text()
+                output_file = self.output_text.text()
+                local_networks = [
+                    network.strip()
+                    for network in self.local_text.text().split(",")
+                    if network.strip()
+                ]
+                if valid_files(input_file, output_file):
+                    try:
+                        for network in local_networks:
+                            parse_network(network)
+                    except ValueError:
+                        msg_box = QMessageBox()
+                        msg_box.setWindowTitle("Csomagküldés")
+                        msg_box.setIcon(QMessageBox.Warning)
+                        msg_box.setText("Hibás helyi hálózat!")
+                        msg_box.exec()
+                        return
+                    self.model.run_traversal_on_raw_packets(
+                        input_file, output_file, local_networks
+                    )
+                    show_success()
+            elif (
                 self.table.currentText() in self.model.tables
                 and self.input_text.text() != ""
             ):
@@ -122,21 +168,11 @@ class PacketWindow(QWidget):
                 if self.chain.currentText() in self.model.get_chain_names(table):
                     input_file = self.input_text.text()
                     output_file = self.output_text.text()
-                    if (
-                        sum(
-                            output_file.count(c)
-                            for c in ["|", "<", ">", ":", '"', "?", "*"]
-                        )
-                        == 0
-                    ) and os.path.isfile(input_file):
+                    if valid_files(input_file, output_file):
                         self.model.run_chain_on_raw_packets(
                             input_file, output_file, table, self.chain.currentText()
                         )
-                        msg_box = QMessageBox()
-                        msg_box.setWindowTitle("Csomagküldés")
-                        msg_box.setIcon(QMessageBox.Information)
-                        msg_box.setText("Sikeres futtatás!")
-                        msg_box.exec()
+                        show_success()
             else:
                 msg_box = QMessageBox()
                 msg_box.setWindowTitle("Csomagküldés")
@@ -0,0 +1,72 @@
+"""
+    Chain lookups per second, rule by rule against the compiled classifier
+
+    python benchmarks/bench_classifier.py [rules] [packets]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import scapy.all as all  # noqa: E402
+
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+from bench_rule_memory import generate_rules  # noqa: E402
+
+
+def generate_packets(raw_rules, count: int):
+    """
+    Half of the packets are aimed at a random rule
+    """
+    random.seed(1)
+    for _ in range(count):
+        tokens = random.choice(raw_rules).split(" ")
+        layer = all.TCP if tokens[tokens.index("-p") + 1] == "tcp" else all.UDP
+        dport = int(tokens[tokens.index("--dport") + 1])
+        src = tokens[tokens.index("-s") + 1].replace("0/24", "7")
+        if random.random() < 0.5:
+            dport = random.randint(1, 65535)
+        yield all.IP(src=src, dst="192.168.0.1") / layer(sport=1234, dport=dport)
+
+
+def linear(rules, packet):
+    for rule in rules:
+        result = rule.run_on_packet(packet)
+        if result[0] and result[1]:
+            return result[1]
+    return None
+
+
+if __name__ == "__main__":
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    packet_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    system = RuleSystem(rule_cache_size=0)
+    raw_rules = list(generate_rules(rule_count))
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    rules = system.get_rules_in_chain("FILTER", "INPUT")
+    packets = list(generate_packets(raw_rules, packet_count))
+
+    start = time.perf_counter()
+    expected = [linear(rules, packet) for packet in packets]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    classifier = system.get_classifier("FILTER", "INPUT")
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [classifier.run_on_packet(packet) for packet in packets]
+    classifier_time = time.perf_counter() - start
+    assert results == expected
+
+    print("rules:               {}".format(rule_count))
+    print("packets:             {}".format(packet_count))
+    print("matched:             {}".format(sum(1 for r in results if r)))
+    print("compile:             {:.3f} s".format(compile_time))
+    print("linear packets/s:    {:.0f}".format(packet_count / linear_time))
+    print("classifier packets/s:{:.0f}".format(packet_count / classifier_time))
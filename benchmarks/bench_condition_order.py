@@ -0,0 +1,82 @@
+"""
+    Cost of checking the conditions of a rule, in textual order against
+    the order a sampling run chose
+
+    python benchmarks/bench_condition_order.py [rules] [packets]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import scapy.all as all  # noqa: E402
+
+from IPTables_Guide.model.condition_order import sample_conditions  # noqa: E402
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+
+
+def generate_rules(count: int):
+    """
+    Rules written the way people write them: protocol, then a wide
+    source network most of the traffic comes from, then the port
+    """
+    random.seed(0)
+    for _ in range(count):
+        yield "iptables -t filter -A INPUT -p tcp -s 10.0.0.0/8 --dport {} -j {}".format(
+            random.randint(1, 65535), random.choice(["ACCEPT", "DROP"])
+        )
+
+
+def generate_packets(count: int):
+    random.seed(1)
+    for _ in range(count):
+        src = "10.{}.{}.{}".format(*[random.randint(0, 255) for _ in range(3)])
+        if random.random() < 0.1:
+            src = "192.0.2.1"
+        layer = all.TCP if random.random() < 0.9 else all.UDP
+        yield all.IP(src=src, dst="10.0.0.1") / layer(
+            sport=1234, dport=random.randint(1, 65535)
+        )
+
+
+def run(rules, packets):
+    """
+    Seconds per rule that did not match, and the results
+    """
+    results = []
+    misses = 0
+    start = time.perf_counter()
+    for packet in packets:
+        for rule in rules:
+            matched, result = rule.run_on_packet(packet)
+            results.append(matched)
+            misses += not matched
+    return (time.perf_counter() - start) / misses, results
+
+
+if __name__ == "__main__":
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    packet_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    system = RuleSystem(rule_cache_size=0)
+    raw_rules = list(generate_rules(rule_count))
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    rules = system.get_rules_in_chain("FILTER", "INPUT")
+    packets = list(generate_packets(packet_count))
+
+    textual, expected = run(rules, packets)
+    start = time.perf_counter()
+    profiler = sample_conditions(rules, packets[: packet_count // 5])
+    changed = system.optimize_condition_order("FILTER", "INPUT", profiler)
+    sample_time = time.perf_counter() - start
+    ordered, results = run(rules, packets)
+    assert results == expected
+
+    print("rules reordered: {} of {}".format(changed, rule_count))
+    print("sampling run: {:.3f}s".format(sample_time))
+    print("textual order: {:.3f} us per non-matching rule".format(textual * 1e6))
+    print("chosen order:  {:.3f} us per non-matching rule".format(ordered * 1e6))
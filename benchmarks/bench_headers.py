@@ -0,0 +1,62 @@
+"""
+    Per packet cost of getting the matched header fields, scapy dissection
+    against the struct based decoder, and of a chain lookup on top
+
+    python benchmarks/bench_headers.py [packets]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import scapy.all as all  # noqa: E402
+
+from IPTables_Guide.model.headers import (  # noqa: E402
+    LINKTYPE_ETHERNET,
+    HeaderView,
+    scapy_fields,
+)
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+from bench_classifier import generate_packets  # noqa: E402
+from bench_rule_memory import generate_rules  # noqa: E402
+
+
+def timed(function, frames):
+    start = time.perf_counter()
+    results = [function(frame) for frame in frames]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    raw_rules = list(generate_rules(1000))
+    frames = [
+        bytes(all.Ether() / packet) for packet in generate_packets(raw_rules, count)
+    ]
+    system = RuleSystem(rule_cache_size=0)
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    classifier = system.get_classifier("FILTER", "INPUT")
+
+    dissected, scapy_time = timed(lambda frame: scapy_fields(all.Ether(frame)), frames)
+    decoded, view_time = timed(
+        lambda frame: HeaderView(frame, LINKTYPE_ETHERNET).fields, frames
+    )
+    assert dissected == decoded
+    scapy_results, scapy_lookup = timed(
+        lambda frame: classifier.decide(all.Ether(frame))[0], frames
+    )
+    view_results, view_lookup = timed(
+        lambda frame: classifier.decide(HeaderView(frame, LINKTYPE_ETHERNET))[0],
+        frames,
+    )
+    assert scapy_results == view_results
+
+    print("packets:                 {}".format(count))
+    print("scapy fields us/packet:  {:.2f}".format(scapy_time / count * 1e6))
+    print("decoder fields us/packet:{:.2f}".format(view_time / count * 1e6))
+    print("scapy lookup us/packet:  {:.2f}".format(scapy_lookup / count * 1e6))
+    print("decoder lookup us/packet:{:.2f}".format(view_lookup / count * 1e6))
@@ -0,0 +1,66 @@
+"""
+    Capture evaluation on 1 to N worker processes, with the scaling
+    efficiency (speedup / processes) of each
+
+    python benchmarks/bench_parallel_evaluation.py [rules] [packets] [processes]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import scapy.all as all
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+from bench_classifier import generate_packets  # noqa: E402
+from bench_rule_memory import generate_rules  # noqa: E402
+
+
+if __name__ == "__main__":
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    packet_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    max_processes = (
+        int(sys.argv[3]) if len(sys.argv) > 3 else multiprocessing.cpu_count()
+    )
+    system = RuleSystem(rule_cache_size=0)
+    raw_rules = list(generate_rules(rule_count))
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    system.get_classifier("FILTER", "INPUT")
+
+    print("rules:     {}".format(rule_count))
+    print("packets:   {}".format(packet_count))
+    print("cores:     {}".format(multiprocessing.cpu_count()))
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, "in.pcap")
+        output_file = os.path.join(directory, "out.pcap")
+        all.wrpcap(
+            input_file,
+            [
+                all.Ether() / packet
+                for packet in generate_packets(raw_rules, packet_count)
+            ],
+        )
+        serial_time = None
+        for processes in range(1, max_processes + 1):
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            start = time.perf_counter()
+            system.run_chain_on_raw_packets(
+                input_file, output_file, "FILTER", "INPUT", processes=processes
+            )
+            elapsed = time.perf_counter() - start
+            if serial_time is None:
+                serial_time = elapsed
+            print(
+                "{} processes: {:.0f} packets/s, efficiency {:.2f}".format(
+                    processes,
+                    packet_count / elapsed,
+                    serial_time / elapsed / processes,
+                )
+            )
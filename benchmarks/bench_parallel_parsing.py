@@ -0,0 +1,58 @@
+"""
+    Serial vs process pool parsing of a generated iptables-save dump
+
+    python benchmarks/bench_parallel_parsing.py [rules] [processes]
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+
+
+def write_dump(file_name: str, rules: int) -> None:
+    random.seed(0)
+    with open(file_name, "w") as f:
+        f.write("*filter\n:INPUT ACCEPT [0:0]\n:FORWARD ACCEPT [0:0]\n")
+        for i in range(rules):
+            protocol = random.choice(["tcp", "udp"])
+            f.write(
+                "-A {} -s 10.{}.{}.0/24 -p {} -m {} --dport {} -j {}\n".format(
+                    random.choice(["INPUT", "FORWARD"]),
+                    i % 256,
+                    (i // 256) % 256,
+                    protocol,
+                    protocol,
+                    random.randint(1, 65535),
+                    random.choice(["ACCEPT", "DROP"]),
+                )
+            )
+        f.write("COMMIT\n")
+
+
+def run(file_name: str, processes: int) -> float:
+    system = RuleSystem(rule_cache_size=0)
+    start = time.perf_counter()
+    errors = system.import_iptables_save(file_name, processes)
+    elapsed = time.perf_counter() - start
+    assert not errors, errors[:3]
+    return elapsed
+
+
+if __name__ == "__main__":
+    rules = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "dump.txt")
+        write_dump(file_name, rules)
+        serial = run(file_name, 1)
+        parallel = run(file_name, processes)
+    print("rules:      {}".format(rules))
+    print("serial:     {:.2f} s".format(serial))
+    print("{} processes: {:.2f} s".format(processes, parallel))
+    print("speedup:    {:.2f}x".format(serial / parallel))
@@ -0,0 +1,45 @@
+"""
+    Memory held by the rules of a RuleSystem
+
+    python benchmarks/bench_rule_memory.py [rules]
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+
+
+def generate_rules(count: int):
+    random.seed(0)
+    for i in range(count):
+        protocol = random.choice(["tcp", "udp"])
+        yield "iptables -t filter -A INPUT -p {} --dport {} -s 10.{}.{}.0/24 -j {}".format(
+            protocol,
+            random.randint(1, 65535),
+            i % 256,
+            (i // 256) % 256,
+            random.choice(["ACCEPT", "DROP"]),
+        )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    raw_rules = list(generate_rules(count))
+    system = RuleSystem()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    if hasattr(system, "rule_cache"):
+        system.rule_cache.clear()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("rules:          {}".format(count))
+    print("memory:         {:.1f} MiB".format(used / 2**20))
+    print("bytes per rule: {:.0f}".format(used / count))
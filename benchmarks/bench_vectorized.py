@@ -0,0 +1,53 @@
+"""
+    Whole capture evaluation, packet by packet through the classifier
+    against rule by rule over header columns
+
+    python benchmarks/bench_vectorized.py [rules] [packets]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+from IPTables_Guide.model.vectorized import (  # noqa: E402
+    evaluate_chain,
+    extract_columns,
+)
+from bench_classifier import generate_packets  # noqa: E402
+from bench_rule_memory import generate_rules  # noqa: E402
+
+
+if __name__ == "__main__":
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    packet_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    system = RuleSystem(rule_cache_size=0)
+    raw_rules = list(generate_rules(rule_count))
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    classifier = system.get_classifier("FILTER", "INPUT")
+    packets = list(generate_packets(raw_rules, packet_count))
+
+    start = time.perf_counter()
+    expected = [classifier.decide(packet)[0] for packet in packets]
+    classifier_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = extract_columns(packets)
+    extract_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    verdicts = evaluate_chain(classifier, packets, columns)
+    vectorized_time = time.perf_counter() - start
+    assert verdicts.rule_index.tolist() == [
+        -1 if rule is None else rule.index for rule in expected
+    ]
+
+    print("rules:                {}".format(rule_count))
+    print("packets:              {}".format(packet_count))
+    print("classifier packets/s: {:.0f}".format(packet_count / classifier_time))
+    print("column extraction:    {:.2f} s".format(extract_time))
+    print("vectorized packets/s: {:.0f}".format(packet_count / vectorized_time))
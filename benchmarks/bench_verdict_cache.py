@@ -0,0 +1,57 @@
+"""
+    Capture evaluation with and without the verdict cache, on a capture
+    where every flow shows up many times
+
+    python benchmarks/bench_verdict_cache.py [rules] [packets] [flows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import scapy.all as all
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from IPTables_Guide.model.rule_system import RuleSystem  # noqa: E402
+from bench_classifier import generate_packets  # noqa: E402
+from bench_rule_memory import generate_rules  # noqa: E402
+
+
+if __name__ == "__main__":
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    packet_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    flow_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    system = RuleSystem(rule_cache_size=0)
+    raw_rules = list(generate_rules(rule_count))
+    for raw in raw_rules:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    system.get_classifier("FILTER", "INPUT")
+    flows = [all.Ether() / packet for packet in generate_packets(raw_rules, flow_count)]
+    random.seed(2)
+
+    print("rules:     {}".format(rule_count))
+    print("packets:   {}".format(packet_count))
+    print("flows:     {}".format(flow_count))
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, "in.pcap")
+        all.wrpcap(input_file, [random.choice(flows) for _ in range(packet_count)])
+        for name, cache_verdicts in [("uncached", False), ("cached", True)]:
+            output_file = os.path.join(directory, name + ".pcap")
+            start = time.perf_counter()
+            statistics = system.run_chain_on_raw_packets(
+                input_file,
+                output_file,
+                "FILTER",
+                "INPUT",
+                cache_verdicts=cache_verdicts,
+            )
+            elapsed = time.perf_counter() - start
+            print(
+                "{}: {:.0f} packets/s, hit rate {:.3f}".format(
+                    name, packet_count / elapsed, statistics.cache_hit_rate
+                )
+            )
@@ -1,9 +1,11 @@
-from typing import List
+from typing import Iterable, List
 
+from IPTables_Guide.model.iptables_save import SaveLine, read_iptables_save
 
-filter_expected = ["-A INPUT -p tcp -m tcp --sport 1222 -j DROP"]
+
+filter_expected = ["-A INPUT -p tcp --sport 1222 -j DROP"]
 nat_expected = [
-    "-A PREROUTING -p tcp -m tcp --dport 5001 -j DNAT --to-destination 192.168.0.11"
+    "-A PREROUTING -p tcp --dport 5001 -j DNAT --to-destination 192.168.0.11"
 ]
 
 
@@ -14,35 +16,23 @@ def read_from_file(filename: str) -> List[str]:
     return f_content
 
 
-def get_rules_from_filter(ips_content: List[str]) -> List[str]:
-    relevant_content = []
-    start_relevant = False
-    for line in ips_content:
-        if start_relevant and ("COMMIT" in line):
-            break
-        if start_relevant:
-            relevant_content.append(line)
-        if "*filter" in line:
-            start_relevant = True
-    return relevant_content
-
-
-def get_rules_from_nat(ips_content: List[str]) -> List[str]:
-    relevant_content = []
-    start_relevant = False
-    for line in ips_content:
-        if start_relevant and ("COMMIT" in line):
-            break
-        if start_relevant:
-            relevant_content.append(line)
-        if "*nat" in line:
-            start_relevant = True
-    return relevant_content
+def get_rules_from_table(ips_content: Iterable[str], table: str) -> List[str]:
+    return [
+        entry.value
+        for entry in read_iptables_save(ips_content)
+        if isinstance(entry, SaveLine) and entry.kind == "rule" and entry.table == table
+    ]
+
+
+def get_rules_from_filter(ips_content: Iterable[str]) -> List[str]:
+    return get_rules_from_table(ips_content, "filter")
+
+
+def get_rules_from_nat(ips_content: Iterable[str]) -> List[str]:
+    return get_rules_from_table(ips_content, "nat")
 
 
 def validate(filter_rules: List[str], nat_rules: List[str]):
-    filter_rules = [x.strip("\n") for x in filter_rules]
-    nat_rules = [x.strip("\n") for x in nat_rules]
     for frule in filter_expected:
         assert frule in filter_rules
     for nrule in nat_expected:
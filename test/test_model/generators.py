@@ -0,0 +1,47 @@
+"""
+    Random rules and packets shared by the tests
+"""
+import scapy.all as all
+
+
+def random_rule(rng):
+    parts = ["iptables -t filter -A INPUT"]
+    protocol = rng.choice([None, "tcp", "udp"])
+    if protocol:
+        parts.append("-p " + protocol)
+        if rng.random() < 0.6:
+            parts.append("--dport {}".format(rng.randint(1, 4)))
+        if rng.random() < 0.3:
+            parts.append("--sport {}".format(rng.randint(1, 4)))
+    if rng.random() < 0.5:
+        parts.append(
+            "-s 10.0.{}.0/{}".format(rng.randint(0, 3), rng.choice([16, 24, 30, 32]))
+        )
+    if rng.random() < 0.4:
+        parts.append("-d 192.168.0.{}".format(rng.randint(0, 3)))
+    parts.append(
+        rng.choice(
+            [
+                "-j DROP",
+                "-j ACCEPT",
+                "-j DNAT --to-destination 10.1.1.1:80",
+                "-j SNAT --to-source 10.2.2.2",
+            ]
+        )
+    )
+    return " ".join(parts)
+
+
+def random_packet(rng):
+    ip = all.IP(
+        src="10.0.{}.{}".format(rng.randint(0, 3), rng.randint(0, 5)),
+        dst="192.168.0.{}".format(rng.randint(0, 3)),
+    )
+    layer = rng.choice([all.TCP, all.UDP, all.ICMP])
+    if layer == all.ICMP:
+        return bytes(ip / all.ICMP())
+    return bytes(ip / layer(sport=rng.randint(1, 4), dport=rng.randint(1, 4)))
+
+
+def as_bytes(result):
+    return result if result in [None, "DROP"] else bytes(result)
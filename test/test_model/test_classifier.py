@@ -0,0 +1,55 @@
+import random
+
+import scapy.all as all
+
+from IPTables_Guide.model.rule_system import *
+from test.test_model.generators import as_bytes, random_packet, random_rule
+
+
+def linear_result(rules, packet):
+    for rule in rules:
+        result = rule.run_on_packet(packet)
+        if result[0] and result[1]:
+            return result[1]
+    return None
+
+
+def test_classifier_keeps_first_match():
+    rng = random.Random(0)
+    system = RuleSystem(rule_cache_size=0)
+    for _ in range(200):
+        rule = system.create_rule_from_raw_str(random_rule(rng), "", "")
+        assert system.append_rule("FILTER", "INPUT", rule)
+    rules = system.get_rules_in_chain("FILTER", "INPUT")
+    classifier = system.get_classifier("FILTER", "INPUT")
+    matched = 0
+    for _ in range(1000):
+        raw = random_packet(rng)
+        expected = as_bytes(linear_result(rules, all.IP(raw)))
+        assert as_bytes(classifier.run_on_packet(all.IP(raw))) == expected
+        matched += expected is not None
+    assert matched > 500
+
+
+def test_classifier_is_rebuilt_on_change():
+    system = RuleSystem(rule_cache_size=0)
+    packet = all.IP(src="10.0.0.1", dst="10.0.0.2") / all.UDP(sport=5, dport=53)
+
+    def add(raw):
+        return system.create_rule_from_raw_str(raw, "", "")
+
+    assert system.get_classifier("FILTER", "INPUT").run_on_packet(packet) is None
+
+    system.append_rule("FILTER", "INPUT", add("iptables -t filter -A INPUT -j ACCEPT"))
+    assert system.get_classifier("FILTER", "INPUT").run_on_packet(packet) is packet
+
+    drop = add("iptables -t filter -A INPUT -p udp --dport 53 -j DROP")
+    system.insert_rule("FILTER", "INPUT", drop, 0)
+    assert system.get_classifier("FILTER", "INPUT").run_on_packet(packet) == "DROP"
+
+    tcp_drop = add("iptables -t filter -A INPUT -p tcp --dport 53 -j DROP")
+    system.overwrite_rule("FILTER", "INPUT", 0, tcp_drop)
+    assert system.get_classifier("FILTER", "INPUT").run_on_packet(packet) is packet
+
+    system.delete_rule("FILTER", "INPUT", 1)
+    assert system.get_classifier("FILTER", "INPUT").run_on_packet(packet) is None
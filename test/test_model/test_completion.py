@@ -0,0 +1,53 @@
+from IPTables_Guide.model.rule_system import *
+
+
+def completions(index, text):
+    return [entry.text for entry in index.complete(text)]
+
+
+def test_completion_follows_the_signature():
+    index = RuleSystem().create_completion_index("", "")
+    assert completions(index, "") == ["iptables"]
+    assert completions(index, "ipt") == ["iptables"]
+    assert completions(index, "iptables -t n") == ["-t nat"]
+    assert completions(index, "iptables -t nat -A ") == [
+        "INPUT",
+        "OUTPUT",
+        "PREROUTING",
+        "POSTROUTING",
+    ]
+    assert completions(index, "iptables -t filter -A F") == ["FORWARD"]
+    assert completions(index, "iptables -t nat -A F") == []
+
+
+def test_completion_of_rule_specifications():
+    index = RuleSystem().create_completion_index("", "")
+    rule = "iptables -t filter -A INPUT "
+    assert "--sport" not in completions(index, rule)
+    assert "--sport" in completions(index, rule + "-p tcp ")
+    assert "--sport" not in completions(index, rule + "-p tcp --sport 80 ")
+    assert "--dport" in completions(index, rule + "-p tcp --sport 80 -")
+    assert len(index.complete(rule, limit=3)) == 3
+    assert index.complete("iptables")[0].explanation
+
+
+def test_completions_are_ranked():
+    index = RuleSystem().create_completion_index("", "")
+    rule = "iptables -t filter -A INPUT "
+    # the ones the query covers more of first
+    assert completions(index, rule + "-j DROP --s") == [
+        "--source",
+        "--state NEW",
+        "--state INVALID",
+        "--state RELATED",
+        "--state ESTABLISHED",
+    ]
+    assert completions(index, rule + "-p tcp --d") == ["--dport", "--destination"]
+    assert completions(index, "iptables -") == ["-t nat", "-t filter"]
+    assert [entry.text for entry in index.complete(rule, limit=4)] == [
+        "-s",
+        "-d",
+        "-p tcp",
+        "-p udp",
+    ]
+    assert completions(index, "iptables -t filter ") == ["-A", "-I"]
@@ -0,0 +1,74 @@
+import pickle
+import tracemalloc
+
+from IPTables_Guide.model.components import Component, make_component
+from IPTables_Guide.model.rule_system import *
+
+
+def test_component_reads_like_its_template():
+    template = {"str_form": "--dport", "type": "condition"}
+    component = make_component(template, 80, "--dport 80")
+    assert component["str_form"] == "--dport 80"
+    assert component["value"] == 80
+    assert component == {"str_form": "--dport 80", "type": "condition", "value": 80}
+    assert "value" in component and "explanation" not in component
+    assert component.get("explanation", "") == ""
+
+    changed = component.with_value(81)
+    assert changed["str_form"] == "--dport 81"
+    assert component["value"] == 80
+    assert pickle.loads(pickle.dumps(changed)) == changed
+
+    spelled = make_component({"str_form": "-j DROP"}, None, "--jump DROP")
+    assert spelled["str_form"] == "--jump DROP"
+    assert (
+        Component({"str_form": "-t nat", "value": "nat"}).with_value("x")["str_form"]
+        == "-t nat"
+    )
+
+
+def test_rules_share_component_templates():
+    system = RuleSystem(rule_cache_size=0)
+    rule_a = system.create_rule_from_raw_str(
+        "iptables -t filter -A INPUT -p tcp --dport 22 --state NEW -j ACCEPT", "", ""
+    )
+    rule_b = system.create_rule_from_raw_str(
+        "iptables -t filter -A INPUT -p tcp --dport 80 --state NEW -j ACCEPT", "", ""
+    )
+    assert rule_a.get_str_form() == (
+        "iptables -t filter -A INPUT -p tcp --dport 22 --state NEW -j ACCEPT"
+    )
+    assert rule_a.components[0] is rule_b.components[0]
+    assert rule_a.components[5].template is rule_b.components[5].template
+    assert rule_a.components[5]["value"] == 22
+    assert rule_a.components[6]["value"] == "NEW"
+
+    rule_a.set_value(5, 23)
+    assert "--dport 23 " in rule_a.get_str_form()
+    assert rule_b.components[5]["value"] == 80
+
+
+def test_rule_footprint():
+    system = RuleSystem(rule_cache_size=0)
+    raw_rules = [
+        "iptables -t filter -A INPUT -p {} --dport {} -s 10.{}.{}.0/24 -j {}".format(
+            ["tcp", "udp"][i % 2],
+            1000 + i,
+            i % 256,
+            i // 256,
+            ["ACCEPT", "DROP"][i % 2],
+        )
+        for i in range(2000)
+    ]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for raw in raw_rules:
+            system.append_rule(
+                "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+            )
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    # about 525 bytes, dict components and a stored raw form took 1230
+    assert used / len(raw_rules) < 700
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+import scapy.all as all
+
+from IPTables_Guide.model.condition_order import *
+from IPTables_Guide.model.rule_system import *
+
+
+def sample_packets(rng, count):
+    for _ in range(count):
+        src = "10.0.{}.{}".format(rng.randint(0, 255), rng.randint(1, 254))
+        if rng.random() < 0.1:
+            src = "11.0.0.1"
+        layer = all.TCP if rng.random() < 0.9 else all.UDP
+        yield all.IP(src=src, dst="10.1.1.1") / layer(dport=rng.randint(1, 100))
+
+
+def test_selective_conditions_first():
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A INPUT -p tcp -s 10.0.0.0/8 --dport 22 -j DROP", "", ""
+    )
+    system.append_rule("FILTER", "INPUT", rule)
+    rng = random.Random(0)
+    packets = list(sample_packets(rng, 400))
+    expected = [rule.run_on_packet(packet) for packet in packets]
+    decisions = [system.get_classifier("FILTER", "INPUT").decide(p) for p in packets]
+
+    profiler = sample_conditions([rule], packets)
+    # every condition is measured on every packet
+    (profile,) = profiler.rules.values()
+    assert [timing.calls for timing in profile.conditions.values()] == [400] * 3
+    assert system.optimize_condition_order("FILTER", "INPUT", profiler) == 1
+    # the port rejects almost every packet, the protocol almost none
+    dport = [c["str_form"] for c in rule.components].index("--dport 22")
+    assert rule.condition_order[0] == dport
+    assert [rule.run_on_packet(packet) for packet in packets] == expected
+    classifier = system.get_classifier("FILTER", "INPUT")
+    assert [classifier.decide(p) for p in packets] == decisions
+
+    # measured again in the new order, the order is already the best one
+    profiler = sample_conditions([rule], packets)
+    assert system.optimize_condition_order("FILTER", "INPUT", profiler) == 0
+
+
+def test_condition_order_kept_with_compiled_rule():
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A INPUT -p udp --dport 53 -s 10.0.0.0/8 "
+        "--state NEW -j ACCEPT",
+        "",
+        "",
+    )
+    positions = condition_positions(rule.components)
+    assert rule.condition_order is None
+    with pytest.raises(ValueError):
+        rule.set_condition_order(positions[1:])
+    order = positions[::-1]
+    rule.set_condition_order(order)
+    assert rule.condition_order == order
+    rule.matcher()
+    assert rule.condition_order == order
+
+    system.append_rule("FILTER", "INPUT", rule)
+    compiled = system.get_classifier("FILTER", "INPUT").compiled_rules[0]
+    assert compiled.residual_positions == [
+        position for position in order if position in compiled.residual_positions
+    ]
+
+    # the measurements were for the old conditions
+    rule.set_value(positions[1], "5353")
+    assert rule.condition_order is None
@@ -0,0 +1,124 @@
+import scapy.all as all
+
+from IPTables_Guide.model.conntrack import *
+from IPTables_Guide.model.headers import LINKTYPE_ETHERNET, HeaderView
+from IPTables_Guide.model.rule_system import *
+
+
+def packet(time, src, dst, layer):
+    result = all.Ether() / all.IP(src=src, dst=dst) / layer
+    result.time = time
+    return result
+
+
+def test_tcp_connection_states():
+    tracker = ConnectionTracker()
+    syn = all.TCP(sport=1000, dport=22, flags="S")
+    assert tracker.track(packet(0, "10.0.0.1", "10.0.0.2", syn)) == "NEW"
+    assert tracker.track(packet(1, "10.0.0.1", "10.0.0.2", syn)) == "NEW"
+    syn_ack = all.TCP(sport=22, dport=1000, flags="SA")
+    assert tracker.track(packet(2, "10.0.0.2", "10.0.0.1", syn_ack)) == "ESTABLISHED"
+    ack = all.TCP(sport=1000, dport=22, flags="A")
+    assert tracker.track(packet(3, "10.0.0.1", "10.0.0.2", ack)) == "ESTABLISHED"
+    assert len(tracker) == 1
+
+    rst = all.TCP(sport=1000, dport=22, flags="R")
+    assert tracker.track(packet(4, "10.0.0.1", "10.0.0.2", rst)) == "ESTABLISHED"
+    # closed connections only linger for tcp_close
+    assert tracker.track(packet(20, "10.0.0.1", "10.0.0.2", rst)) == "INVALID"
+    assert len(tracker) == 0
+
+
+def test_udp_timeouts_and_related():
+    tracker = ConnectionTracker(timeouts={"udp_unreplied": 5})
+    query = all.UDP(sport=5353, dport=53)
+    assert tracker.track(packet(0, "10.0.0.1", "8.8.8.8", query)) == "NEW"
+    assert tracker.track(packet(10, "10.0.0.1", "8.8.8.8", query)) == "NEW"
+    answer = all.UDP(sport=53, dport=5353)
+    assert tracker.track(packet(11, "8.8.8.8", "10.0.0.1", answer)) == "ESTABLISHED"
+
+    error = all.ICMP(type=3, code=3) / all.IPerror(src="10.0.0.1", dst="8.8.8.8")
+    related = packet(
+        12, "8.8.8.8", "10.0.0.1", error / all.UDPerror(sport=5353, dport=53)
+    )
+    assert tracker.track(related) == "RELATED"
+    unrelated = packet(
+        12, "8.8.8.8", "10.0.0.1", error / all.UDPerror(sport=1, dport=2)
+    )
+    assert tracker.track(unrelated) == "INVALID"
+
+    ping = packet(13, "10.0.0.1", "8.8.8.8", all.ICMP())
+    assert tracker.track(ping) == "NEW"
+    pong = packet(13, "8.8.8.8", "10.0.0.1", all.ICMP(type=0))
+    assert tracker.track(pong) == "ESTABLISHED"
+
+
+def test_tracker_memory_is_bounded():
+    tracker = ConnectionTracker(max_connections=10)
+    for i in range(1000):
+        udp = all.UDP(sport=i, dport=53)
+        assert tracker.track(packet(i, "10.0.0.1", "8.8.8.8", udp)) == "NEW"
+        assert len(tracker) <= 10
+        assert len(tracker._expiries) == len(tracker)
+    # the connections that expire first were dropped
+    last = all.UDP(sport=999, dport=53)
+    assert tracker.track(packet(1000, "10.0.0.1", "8.8.8.8", last)) == "NEW"
+    reply = all.UDP(sport=53, dport=999)
+    assert tracker.track(packet(1000, "8.8.8.8", "10.0.0.1", reply)) == "ESTABLISHED"
+
+
+def test_rescheduled_connections_are_forgotten_once():
+    for max_connections in [1, 10]:
+        tracker = ConnectionTracker(max_connections=max_connections)
+        for time, flags in [(0, "S"), (100, "R"), (105, "A"), (110, "A"), (116, "A")]:
+            tcp = all.TCP(sport=1000, dport=22, flags=flags)
+            tracker.track(packet(time, "10.0.0.1", "10.0.0.2", tcp))
+            assert len(tracker) == 1
+        # two heap entries of the connection expire at 120
+        udp = all.UDP(sport=5353, dport=53)
+        assert tracker.track(packet(200, "10.0.0.1", "8.8.8.8", udp)) == "NEW"
+        assert len(tracker) == 1
+        assert len(tracker._connections) == 2
+
+
+def test_header_views_carry_state():
+    tracker = ConnectionTracker()
+    view = HeaderView(
+        bytes(all.Ether() / all.IP() / all.TCP(flags="S")), LINKTYPE_ETHERNET
+    )
+    assert tracker.track(view) == "NEW"
+    assert view.ct_state == "NEW"
+    assert view.packet.ct_state == "NEW"
+
+
+def test_stateful_chain(tmp_path):
+    system = RuleSystem()
+    for raw in [
+        "iptables -t filter -A INPUT -p tcp --state ESTABLISHED,RELATED -j ACCEPT",
+        "iptables -t filter -A INPUT -p tcp --dport 22 --state NEW -j ACCEPT",
+    ]:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    system.policy("FILTER", "INPUT", "DROP")
+    packets = [
+        packet(0, "10.0.0.1", "10.0.0.2", all.TCP(sport=1000, dport=22, flags="S")),
+        packet(1, "10.0.0.1", "10.0.0.2", all.TCP(sport=1001, dport=80, flags="S")),
+        packet(2, "10.0.0.2", "10.0.0.1", all.TCP(sport=22, dport=1000, flags="SA")),
+        packet(3, "10.0.0.2", "10.0.0.1", all.TCP(sport=80, dport=1001, flags="SA")),
+    ]
+    all.wrpcap(str(tmp_path / "in.pcap"), packets)
+    for vectorized in [False, True]:
+        output = tmp_path / "out_{}.pcap".format(vectorized)
+        statistics = system.run_chain_on_raw_packets(
+            str(tmp_path / "in.pcap"),
+            str(output),
+            "FILTER",
+            "INPUT",
+            vectorized=vectorized,
+            processes=2,
+        )
+        # the reply of the dropped connection is still ESTABLISHED, as
+        # conntrack runs before the filter table
+        assert [p[all.TCP].sport for p in all.rdpcap(str(output))] == [1000, 22, 80]
+        assert statistics.rule_packets == {0: 2, 1: 1}
@@ -0,0 +1,101 @@
+import os
+
+import scapy.all as all
+
+from IPTables_Guide.model.rule_system import *
+
+
+def counted_system(tmp_path, **kwargs):
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A FORWARD -p tcp -j DROP", "", ""
+    )
+    system.append_rule("FILTER", "FORWARD", rule)
+    for run in range(2):
+        system.run_chain_on_raw_packets(
+            os.path.join("pcaps", "example.pcap"),
+            str(tmp_path / "out_{}.pcap".format(run)),
+            "FILTER",
+            "FORWARD",
+            **kwargs
+        )
+    return system
+
+
+def test_chain_counters(tmp_path):
+    packets = all.rdpcap(os.path.join("pcaps", "example.pcap"))
+    tcp = [p for p in packets if p.haslayer(all.TCP)]
+    other = [p for p in packets if not p.haslayer(all.TCP)]
+
+    def length(packet):
+        return packet[all.IP].len if packet.haslayer(all.IP) else len(packet)
+
+    expected = (
+        (2 * len(tcp), 2 * sum(map(length, tcp))),
+        (2 * len(other), 2 * sum(map(length, other))),
+    )
+    for kwargs in [{}, {"vectorized": True}, {"processes": 2}]:
+        system = counted_system(tmp_path, **kwargs)
+        rule = system.get_rule("FILTER", "FORWARD", 0)
+        assert (rule.packets, rule.bytes) == expected[0]
+        assert system.get_policy_counters("FILTER", "FORWARD") == expected[1]
+
+    system.reset_counters("FILTER")
+    assert (rule.packets, rule.bytes) == (0, 0)
+    assert system.get_policy_counters("FILTER", "FORWARD") == (0, 0)
+
+
+def test_counters_in_iptables_save(tmp_path):
+    system = counted_system(tmp_path)
+    rule = system.get_rule("FILTER", "FORWARD", 0)
+    policy = system.get_policy_counters("FILTER", "FORWARD")
+    lines = list(system.iptables_save_lines())
+    assert "[{}:{}] -A FORWARD -p tcp -j DROP".format(rule.packets, rule.bytes) in lines
+    assert ":FORWARD ACCEPT [{}:{}]".format(*policy) in lines
+
+    system.export_iptables_save(str(tmp_path / "rules.save"))
+    imported = RuleSystem()
+    assert imported.import_iptables_save(str(tmp_path / "rules.save")) == []
+    imported_rule = imported.get_rule("FILTER", "FORWARD", 0)
+    assert (imported_rule.packets, imported_rule.bytes) == (rule.packets, rule.bytes)
+    assert imported.get_policy_counters("FILTER", "FORWARD") == policy
+    assert list(imported.iptables_save_lines()) == lines
+
+
+def test_every_matched_rule_counts(tmp_path):
+    system = RuleSystem()
+    for raw in [
+        # no target, the classic accounting rule
+        "iptables -t filter -A INPUT -p tcp --dport 80",
+        # rewrites the destination, then gives up on the packet (no port)
+        "iptables -t filter -A INPUT -p tcp -j DNAT --to-destination 10.1.1.1",
+        "iptables -t filter -A INPUT -p tcp -j ACCEPT",
+    ]:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+    tcp = all.Ether() / all.IP() / all.TCP(dport=80)
+    udp = all.Ether() / all.IP() / all.UDP(dport=53)
+    all.wrpcap(str(tmp_path / "in.pcap"), [tcp, tcp, tcp, udp])
+    tcp_bytes = 3 * len(tcp[all.IP])
+    udp_bytes = len(udp[all.IP])
+
+    for kwargs in [
+        {},
+        {"vectorized": True},
+        {"processes": 2},
+        {"cache_verdicts": True},
+        {"profiler": Profiler()},
+    ]:
+        system.reset_counters("FILTER")
+        system.run_chain_on_raw_packets(
+            str(tmp_path / "in.pcap"),
+            str(tmp_path / "out.pcap"),
+            "FILTER",
+            "INPUT",
+            **kwargs
+        )
+        for index in range(3):
+            rule = system.get_rule("FILTER", "INPUT", index)
+            assert (rule.packets, rule.bytes) == (3, tcp_bytes)
+        assert system.get_policy_counters("FILTER", "INPUT") == (1, udp_bytes)
@@ -0,0 +1,66 @@
+import random
+
+import scapy.all as all
+
+from IPTables_Guide.model.headers import *
+
+
+def frames(rng):
+    ip = all.IP(src="10.0.0.1", dst="192.168.1.{}".format(rng.randint(0, 255)))
+    tcp = all.TCP(sport=rng.randint(0, 65535), dport=80, flags="SA")
+    udp = all.UDP(sport=53, dport=rng.randint(0, 65535))
+    yield all.Ether() / ip / tcp
+    yield all.Ether() / ip / udp / b"payload"
+    yield all.Ether() / ip / all.ICMP()
+    yield all.Ether() / all.IP(src="1.2.3.4", options=[all.IPOption_NOP()] * 4) / tcp
+    yield all.Ether() / all.IP(frag=5) / tcp
+    yield all.Ether() / all.IP(flags="MF") / udp
+    yield all.Ether() / all.Dot1Q(vlan=5) / ip / tcp
+    yield all.Ether() / ip / all.IP(src="5.6.7.8") / udp
+    yield all.Ether() / all.IPv6() / tcp
+    yield all.Ether() / all.ARP()
+    yield all.Ether(bytes(all.Ether() / ip / tcp)[:40])
+    yield all.Ether() / ip / all.ICMP() / all.IPerror() / all.TCPerror()
+
+
+def test_header_view_reads_like_scapy():
+    rng = random.Random(0)
+    for _ in range(20):
+        for frame in frames(rng):
+            data = bytes(frame)
+            view = HeaderView(data, LINKTYPE_ETHERNET)
+            packet = all.Ether(data)
+            assert view.fields == scapy_fields(packet), frame.summary()
+            if packet.haslayer(all.TCP):
+                assert view.tcp_flags == int(packet[all.TCP].flags)
+            assert bytes(view.packet) == data
+
+            if packet.haslayer(all.IP) and frame.type == 0x0800:
+                raw_ip = bytes(packet[all.IP])
+                view = HeaderView(raw_ip, LINKTYPE_IPV4)
+                assert view.fields == scapy_fields(all.IP(raw_ip))
+
+
+def test_header_view_dissects_lazily():
+    view = HeaderView(bytes(all.Ether() / all.IP() / all.TCP()), LINKTYPE_ETHERNET)
+    assert view._packet is None
+    assert as_scapy(view) is view.packet
+    assert view.packet.haslayer(all.TCP)
+
+
+def test_classifier_on_header_views():
+    from IPTables_Guide.model.rule_system import RuleSystem
+    from test.test_model.generators import as_bytes, random_packet, random_rule
+
+    rng = random.Random(2)
+    system = RuleSystem(rule_cache_size=0)
+    for _ in range(100):
+        rule = system.create_rule_from_raw_str(random_rule(rng), "", "")
+        system.append_rule("FILTER", "INPUT", rule)
+    classifier = system.get_classifier("FILTER", "INPUT")
+    for _ in range(500):
+        raw = random_packet(rng)
+        rule, result = classifier.decide(all.IP(raw))
+        view_rule, view_result = classifier.decide(HeaderView(raw, LINKTYPE_IPV4))
+        assert view_rule == rule
+        assert as_bytes(as_scapy(view_result)) == as_bytes(result)
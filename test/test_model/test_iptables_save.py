@@ -0,0 +1,71 @@
+from IPTables_Guide.model.rule_system import *
+from IPTables_Guide.model.iptables_save import (
+    LineError,
+    SaveLine,
+    read_iptables_save,
+)
+
+DUMP = """# Generated by iptables-save v1.8.7 on Thu Jan  5 10:00:00 2023
+*nat
+:PREROUTING ACCEPT [12:720]
+:INPUT ACCEPT [0:0]
+:POSTROUTING ACCEPT [3:180]
+-A PREROUTING -p tcp -m tcp --dport 5001 -j DNAT --to-destination 192.168.0.11
+COMMIT
+*mangle
+:PREROUTING ACCEPT [0:0]
+-A PREROUTING -j ACCEPT
+COMMIT
+*filter
+:INPUT DROP [5:300]
+:FORWARD ACCEPT [0:0]
+:DOCKER - [0:0]
+[7:420] -A INPUT -p tcp -m tcp --sport 1222 -j DROP
+-A INPUT -s 10.0.0.0/8 -j ACCEPT
+-A INPUT -p icmp -j ACCEPT
+-A DOCKER -j DROP
+COMMIT
+"""
+
+
+def test_read_iptables_save():
+    entries = list(read_iptables_save(DUMP.splitlines()))
+    assert entries[0] == SaveLine(2, "table", "nat")
+    assert entries[1] == SaveLine(3, "chain", "nat", "PREROUTING", "ACCEPT", (12, 720))
+    assert entries[4] == SaveLine(
+        6,
+        "rule",
+        "nat",
+        "PREROUTING",
+        "-A PREROUTING -p tcp --dport 5001 -j DNAT --to-destination 192.168.0.11",
+    )
+    assert entries[5] == SaveLine(7, "commit", "nat")
+    rule = [e for e in entries if isinstance(e, SaveLine) and e.line_number == 16][0]
+    assert rule.counters == (7, 420)
+    assert rule.value == "-A INPUT -p tcp --sport 1222 -j DROP"
+
+    errors = list(read_iptables_save(["-A INPUT -j DROP", "*filter", ":INPUT"]))
+    assert [e.message for e in errors if isinstance(e, LineError)] == [
+        "line outside of a table",
+        "invalid chain definition",
+        "missing COMMIT at end of input",
+    ]
+
+
+def test_import_iptables_save():
+    system = RuleSystem()
+    errors = system.import_iptables_save_lines(DUMP.splitlines())
+    assert [error.line_number for error in errors] == [8, 15, 18, 19]
+    assert system.get_policy("FILTER", "INPUT") == "DROP"
+    assert system.get_policy("FILTER", "FORWARD") == "ACCEPT"
+    assert [
+        rule.get_str_form() for rule in system.get_rules_in_chain("FILTER", "INPUT")
+    ] == [
+        "iptables -t filter -A INPUT -p tcp --sport 1222 -j DROP",
+        "iptables -t filter -A INPUT -s 10.0.0.0/8 -j ACCEPT",
+    ]
+    assert [
+        rule.get_str_form() for rule in system.get_rules_in_chain("NAT", "PREROUTING")
+    ] == [
+        "iptables -t nat -A PREROUTING -p tcp --dport 5001 -j DNAT --to-destination 192.168.0.11"
+    ]
@@ -0,0 +1,84 @@
+import random
+
+import scapy.all as all
+
+from IPTables_Guide.model.headers import LINKTYPE_ETHERNET, HeaderView
+from IPTables_Guide.model.mutation import *
+from IPTables_Guide.model.predicates import clear_checksums, int_to_ip
+
+
+def random_frame(rng):
+    ip = all.IP(
+        src="10.0.0.{}".format(rng.randint(1, 254)),
+        dst="192.168.{}.{}".format(rng.randint(0, 255), rng.randint(1, 254)),
+        options=[all.IPOption_NOP()] * rng.choice([0, 4]),
+    )
+    payload = bytes(rng.randint(0, 255) for _ in range(rng.randint(0, 40)))
+    layer = rng.choice(
+        [
+            all.TCP(sport=rng.randint(1, 65535), dport=rng.randint(1, 65535)),
+            all.UDP(sport=rng.randint(1, 65535), dport=rng.randint(1, 65535)),
+        ]
+    )
+    frame = all.Ether(bytes(all.Ether() / ip / layer / payload))
+    if rng.random() < 0.2 and frame.haslayer(all.UDP):
+        frame[all.UDP].chksum = 0
+        frame = all.Ether(bytes(frame))
+    return frame
+
+
+def test_patch_matches_recomputed_checksums():
+    rng = random.Random(5)
+    for _ in range(300):
+        frame = random_frame(rng)
+        buffer = bytearray(bytes(frame))
+        patch = HeaderPatch(buffer, 14)
+        assert patch.has_ports
+        expected = all.Ether(bytes(frame))
+        for field, port_field in [("src", "sport"), ("dst", "dport")]:
+            if rng.random() < 0.7:
+                address = rng.randint(0, 0xFFFFFFFF)
+                patch.set_address(field, address)
+                setattr(expected[all.IP], field, int_to_ip(address))
+            if rng.random() < 0.7:
+                port = rng.randint(1, 65535)
+                patch.set_port(port_field, port)
+                setattr(expected[all.IP].payload, port_field, port)
+        clear_checksums(expected)
+        assert bytes(buffer) == bytes(expected), frame.summary()
+
+
+def test_patch_later_fragment():
+    frame = all.Ether() / all.IP(dst="1.2.3.4", frag=10) / (b"x" * 16)
+    buffer = bytearray(bytes(frame))
+    patch = HeaderPatch(buffer, 14)
+    assert not patch.has_ports
+    patch.set_address("dst", 0x05060708)
+    expected = all.Ether(bytes(frame))
+    expected[all.IP].dst = "5.6.7.8"
+    del expected[all.IP].chksum
+    assert bytes(buffer) == bytes(expected)
+
+
+def test_checksum_adjust():
+    # RFC 1624 section 4: a word changing from 0x5555 to 0x3285
+    assert checksum_adjust(0xDD2F, 0x5555, 0x3285) == 0x0000
+    assert checksum_adjust(0x1234, 0xABCD, 0xABCD) == 0x1234
+
+
+def test_header_view_set_endpoints():
+    data = bytes(all.Ether() / all.IP(src="10.0.0.1") / all.TCP(sport=1000))
+    view = HeaderView(data, LINKTYPE_ETHERNET)
+    assert view.set_endpoints((0x01020304, 2000), None)
+    assert view.fields.src == 0x01020304 and view.fields.sport == 2000
+    assert not view.dissected and not view.rewritten
+    assert view.packet[all.IP].src == "1.2.3.4"
+    assert view.packet[all.TCP].sport == 2000
+    # the scapy packet is what targets rewrite from now on
+    assert not view.set_endpoints((0x01020305, 0), None)
+
+    icmp = HeaderView(bytes(all.Ether() / all.IP() / all.ICMP()), LINKTYPE_ETHERNET)
+    assert not icmp.set_endpoints(None, (0x01020304, 80))
+    assert icmp.set_endpoints(None, (0x01020304, 0))
+    arp = HeaderView(bytes(all.Ether() / all.ARP()), LINKTYPE_ETHERNET)
+    assert not arp.set_endpoints(None, (0x01020304, 0))
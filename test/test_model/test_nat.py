@@ -0,0 +1,88 @@
+import scapy.all as all
+
+from IPTables_Guide.model.rule_system import *
+
+
+def packet(src, sport, dst, dport):
+    result = all.Ether() / all.IP(src=src, dst=dst) / all.TCP(sport=sport, dport=dport)
+    result.time = 1
+    return result
+
+
+def ends(packet):
+    return (
+        packet[all.IP].src,
+        packet[all.TCP].sport,
+        packet[all.IP].dst,
+        packet[all.TCP].dport,
+    )
+
+
+def nat_system(*raw_rules):
+    system = RuleSystem()
+    for raw in raw_rules:
+        system.append_rule(
+            "NAT", raw.split(" ")[4], system.create_rule_from_raw_str(raw, "", "")
+        )
+    return system
+
+
+def test_dnat_binding_and_reply():
+    system = nat_system(
+        "iptables -t nat -A PREROUTING -p tcp --dport 80 "
+        "-j DNAT --to-destination 10.0.0.1:8080"
+    )
+    traversal = system.create_traversal()
+    for _ in range(3):
+        result = traversal.run_on_packet(packet("1.1.1.1", 1000, "2.2.2.2", 80))
+        assert ends(result) == ("1.1.1.1", 1000, "10.0.0.1", 8080)
+    # the chain only saw the first packet of the connection
+    assert traversal.statistics[("NAT", "PREROUTING")].packets == 1
+
+    reply = traversal.run_on_packet(packet("10.0.0.1", 8080, "1.1.1.1", 1000))
+    assert ends(reply) == ("2.2.2.2", 80, "1.1.1.1", 1000)
+    assert traversal.statistics[("NAT", "PREROUTING")].packets == 1
+
+
+def test_snat_binding_and_reply():
+    system = nat_system(
+        "iptables -t nat -A POSTROUTING -p tcp -j SNAT --to-source 5.5.5.5:4000"
+    )
+    traversal = system.create_traversal()
+    result = traversal.run_on_packet(packet("10.0.0.7", 1000, "8.8.8.8", 443))
+    assert ends(result) == ("5.5.5.5", 4000, "8.8.8.8", 443)
+    other = traversal.run_on_packet(packet("10.0.0.8", 1000, "8.8.8.8", 443))
+    assert ends(other) == ("5.5.5.5", 4000, "8.8.8.8", 443)
+
+    reply = traversal.run_on_packet(packet("8.8.8.8", 443, "5.5.5.5", 4000))
+    # no port is picked to tell clashing translations apart, the first
+    # connection keeps the reply tuple
+    assert ends(reply)[2:] == ("10.0.0.7", 1000)
+    assert traversal.statistics[("NAT", "POSTROUTING")].packets == 2
+
+
+def test_nat_chain_on_raw_packets(tmp_path):
+    system = nat_system(
+        "iptables -t nat -A PREROUTING -p tcp --dport 80 "
+        "-j DNAT --to-destination 10.0.0.1:8080"
+    )
+    packets = [
+        packet("1.1.1.1", 1000, "2.2.2.2", 80),
+        packet("1.1.1.1", 1000, "2.2.2.2", 80),
+        packet("10.0.0.1", 8080, "1.1.1.1", 1000),
+        packet("1.1.1.1", 1001, "2.2.2.2", 22),
+    ]
+    all.wrpcap(str(tmp_path / "in.pcap"), packets)
+    statistics = system.run_chain_on_raw_packets(
+        str(tmp_path / "in.pcap"), str(tmp_path / "out.pcap"), "NAT", "PREROUTING"
+    )
+    output = all.rdpcap(str(tmp_path / "out.pcap"))
+    assert [ends(p) for p in output] == [
+        ("1.1.1.1", 1000, "10.0.0.1", 8080),
+        ("1.1.1.1", 1000, "10.0.0.1", 8080),
+        # PREROUTING only undoes source nat on replies
+        ("10.0.0.1", 8080, "1.1.1.1", 1000),
+        ("1.1.1.1", 1001, "2.2.2.2", 22),
+    ]
+    assert statistics.packets == 2
+    assert statistics.rule_packets == {0: 1}
@@ -0,0 +1,80 @@
+import os
+import random
+
+import scapy.all as all
+
+from IPTables_Guide.model.evaluation import ChainStatistics
+from IPTables_Guide.model.parallel_evaluation import *
+from IPTables_Guide.model.rule_system import *
+from test.test_model.generators import random_packet, random_rule
+
+
+def random_capture(rng, file_name, count):
+    packets = []
+    for i in range(count):
+        packet = all.Ether() / all.IP(random_packet(rng))
+        packet.time = 1000 + i / 7
+        packets.append(packet)
+    all.wrpcap(file_name, packets)
+
+
+def test_record_ranges_cover_capture(tmp_path):
+    file_name = str(tmp_path / "in.pcap")
+    random_capture(random.Random(4), file_name, 200)
+    shards = record_ranges(file_name, 1000)
+    assert len(shards) > 1
+    for (_, end), (start, _) in zip(shards, shards[1:]):
+        assert end == start
+    sharded = [
+        view.data for shard in shards for view in read_pcap_headers(file_name, *shard)
+    ]
+    assert sharded == [view.data for view in read_pcap_headers(file_name)]
+
+
+def test_parallel_evaluation_keeps_order(tmp_path):
+    rng = random.Random(5)
+    file_name = str(tmp_path / "in.pcap")
+    random_capture(rng, file_name, 500)
+    system = RuleSystem(rule_cache_size=0)
+    for _ in range(100):
+        rule = system.create_rule_from_raw_str(random_rule(rng), "", "")
+        system.append_rule("FILTER", "INPUT", rule)
+    classifier = system.get_classifier("FILTER", "INPUT")
+    for vectorized in [False, True]:
+        results = []
+        for processes in [1, 3]:
+            statistics = ChainStatistics()
+            records = list(
+                evaluate_capture_parallel(
+                    classifier,
+                    file_name,
+                    True,
+                    statistics,
+                    processes,
+                    vectorized,
+                    shard_size=2000,
+                )
+            )
+            results.append((records, statistics))
+        assert results[0] == results[1]
+        assert results[0][1].packets == 500
+
+
+def test_parallel_pcap_operation(tmp_path):
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A FORWARD -p tcp -j DROP", "", ""
+    )
+    system.append_rule(Table("FILTER"), Chain("FORWARD"), rule)
+    statistics = system.run_chain_on_raw_packets(
+        os.path.join("pcaps", "example.pcap"),
+        str(tmp_path / "out.pcap"),
+        Table("FILTER"),
+        Chain("FORWARD"),
+        processes=2,
+    )
+    with open(tmp_path / "out.pcap", "rb") as f_1:
+        with open(os.path.join("pcaps", "expected.pcap"), "rb") as f_2:
+            assert f_1.read() == f_2.read()
+    assert statistics.passed == statistics.policy_packets
+    assert statistics.packets == statistics.passed + statistics.rule_packets[0]
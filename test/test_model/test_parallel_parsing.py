@@ -0,0 +1,80 @@
+from IPTables_Guide.model import parallel_parsing
+from IPTables_Guide.model.rule_system import *
+from IPTables_Guide.model.parallel_parsing import parse_rules
+
+
+def test_parse_rules_in_pool():
+    system = RuleSystem()
+    lines = [
+        (i, raw, "", "")
+        for i, raw in enumerate(
+            [
+                "iptables -t filter -A INPUT -p tcp --sport {} -j DROP".format(port)
+                for port in range(50)
+            ]
+            + ["iptables -t nat -A PREROUTING -p udp --dport 53 foo", ""]
+        )
+    ]
+    serial = list(parse_rules(system._rule_signatures, lines, processes=1))
+    parallel = list(
+        parse_rules(
+            system._rule_signatures, lines, processes=2, chunk_size=7, threshold=1
+        )
+    )
+    assert parallel == serial
+    assert [parsed[0] for parsed in parallel] == list(range(len(lines)))
+    assert parallel[3][1:4] == (
+        "filter",
+        "INPUT",
+        system.create_rule_from_raw_str(lines[3][1], "", "").components,
+    )
+    assert parallel[50][4] == ["foo"]
+
+
+def test_read_from_file_in_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel_parsing, "PARALLEL_THRESHOLD", 8)
+    system = RuleSystem()
+    for port in range(30):
+        rule = system.create_rule_from_raw_str(
+            "iptables -t filter -A INPUT -p tcp --dport {} -j ACCEPT".format(port),
+            "",
+            "",
+        )
+        system.append_rule("FILTER", "INPUT", rule)
+    file_name = tmp_path / "rules.txt"
+    system.write_to_file(file_name)
+    serial = RuleSystem()
+    serial.read_from_file(file_name)
+    parallel = RuleSystem()
+    parallel.read_from_file(file_name, processes=2)
+    assert [
+        rule.components for rule in parallel.get_rules_in_chain("FILTER", "INPUT")
+    ] == [rule.components for rule in serial.get_rules_in_chain("FILTER", "INPUT")]
+    assert len(parallel.get_rules_in_chain("FILTER", "INPUT")) == 30
+
+
+def test_import_iptables_save_in_pool(monkeypatch):
+    lines = [
+        "*nat",
+        ":PREROUTING DROP [12:720]",
+        "-A PREROUTING -p udp -m udp --dport 53 -j DNAT --to-destination 10.0.0.1",
+        "COMMIT",
+        "*filter",
+        ":INPUT DROP [5:300]",
+        ":NOPE ACCEPT [0:0]",
+        "[7:420] -A INPUT -p tcp -m tcp --sport 1222 -j DROP",
+        "-A INPUT -p icmp -j ACCEPT",
+        "-A INPUT -s 10.0.0.0/8 -j ACCEPT",
+        "COMMIT",
+    ]
+    monkeypatch.setattr(parallel_parsing, "PARALLEL_THRESHOLD", 2)
+    serial = RuleSystem()
+    serial_errors = serial.import_iptables_save_lines(lines)
+    parallel = RuleSystem()
+    errors = parallel.import_iptables_save_lines(lines, processes=2)
+    assert errors == serial_errors
+    assert [error.line_number for error in errors] == [7, 9]
+    assert list(parallel.iptables_save_lines()) == list(serial.iptables_save_lines())
+    assert parallel.get_policy("FILTER", "INPUT") == "DROP"
+    assert parallel.get_policy_counters("NAT", "PREROUTING") == (12, 720)
+    assert len(parallel.get_rules_in_chain("FILTER", "INPUT")) == 2
@@ -0,0 +1,66 @@
+import os
+
+import scapy.all as all
+
+from IPTables_Guide.model.pcap_io import *
+
+
+def test_capture_writer_matches_wrpcap(tmp_path):
+    packets = list(read_pcap_headers(os.path.join("pcaps", "example.pcap")))
+    for packet in packets:
+        all.wrpcap(str(tmp_path / "wrpcap.pcap"), packet.packet, append=True)
+    with CaptureWriter(str(tmp_path / "writer.pcap")) as writer:
+        for packet in packets:
+            writer.write(packet.packet)
+    with open(tmp_path / "wrpcap.pcap", "rb") as f_1:
+        with open(tmp_path / "writer.pcap", "rb") as f_2:
+            assert f_1.read() == f_2.read()
+
+
+def test_capture_writer_appends(tmp_path):
+    file_name = str(tmp_path / "out.pcap")
+    with CaptureWriter(file_name):
+        pass
+    assert not os.path.exists(file_name)
+    for sport in [1, 2]:
+        with CaptureWriter(file_name) as writer:
+            writer.write(all.Ether() / all.IP() / all.TCP(sport=sport))
+    packets = all.rdpcap(file_name)
+    assert [packet[all.TCP].sport for packet in packets] == [1, 2]
+
+
+def test_untouched_packets_are_copied(tmp_path):
+    from IPTables_Guide.model.evaluation import evaluate_capture
+    from IPTables_Guide.model.rule_system import RuleSystem
+
+    frames = [
+        all.Ether() / all.IP(dst="1.2.3.4", chksum=0x1234) / all.TCP(dport=80),
+        all.Ether() / all.IP(dst="1.2.3.4") / all.UDP(dport=5000) / b"data",
+        all.Ether() / all.ARP(),
+        all.Ether() / all.IP() / all.TCP() / all.Padding(b"\x00" * 6),
+    ]
+    input_file = str(tmp_path / "in.pcap")
+    all.wrpcap(input_file, frames)
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A FORWARD -p udp -j DNAT --to-destination 10.1.1.1",
+        "",
+        "",
+    )
+    system.append_rule("FILTER", "FORWARD", rule)
+    output_file = str(tmp_path / "out.pcap")
+    system.run_chain_on_raw_packets(input_file, output_file, "FILTER", "FORWARD")
+
+    read = list(read_pcap_headers(input_file))
+    written = list(read_pcap_headers(output_file))
+    assert [packet.data for packet in written[:1] + written[2:]] == [
+        packet.data for packet in read[:1] + read[2:]
+    ]
+    assert written[1].packet[all.IP].dst == "10.1.1.1"
+
+    # nothing dissects what passes untouched
+    views = list(read_pcap_headers(input_file))
+    classifier = system.get_classifier("FILTER", "FORWARD")
+    passed = list(evaluate_capture(classifier, views, True))
+    assert passed[0] is views[0] and not views[0].dissected
+    assert passed[3] is views[3] and not views[3].dissected
@@ -0,0 +1,39 @@
+import ipaddress
+import random
+
+from IPTables_Guide.model.prefix_trie import PrefixTrie
+
+
+def test_lookup_returns_every_containing_prefix():
+    rng = random.Random(0)
+    for _ in range(20):
+        trie = PrefixTrie()
+        networks = []
+        for i in range(rng.randint(1, 50)):
+            length = rng.choice([0, 1, 8, 9, 16, 23, 24, 31, 32])
+            network = ipaddress.ip_network(
+                (rng.getrandbits(32) & 0xFF00FF0F, length), strict=False
+            )
+            networks.append(network)
+            trie.insert(length, int(network.network_address), 1 << i)
+        trie.build()
+        for _ in range(200):
+            address = rng.getrandbits(32) & 0xFF00FF0F | rng.getrandbits(2)
+            expected = sum(
+                1 << i
+                for i, network in enumerate(networks)
+                if ipaddress.ip_address(address) in network
+            )
+            assert trie.lookup(address) == expected
+
+
+def test_nested_prefixes():
+    trie = PrefixTrie()
+    trie.insert(24, int(ipaddress.ip_address("10.0.1.0")), 0b001)
+    trie.insert(8, int(ipaddress.ip_address("10.0.0.0")), 0b010)
+    trie.insert(32, int(ipaddress.ip_address("10.0.1.7")), 0b100)
+    trie.build()
+    assert trie.lookup(int(ipaddress.ip_address("10.0.1.7"))) == 0b111
+    assert trie.lookup(int(ipaddress.ip_address("10.0.1.8"))) == 0b011
+    assert trie.lookup(int(ipaddress.ip_address("10.9.9.9"))) == 0b010
+    assert trie.lookup(int(ipaddress.ip_address("11.0.1.7"))) == 0
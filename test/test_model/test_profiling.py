@@ -0,0 +1,100 @@
+import json
+import os
+import random
+
+import scapy.all as all
+
+from IPTables_Guide.model.profiling import *
+from IPTables_Guide.model.rule_system import *
+from test.test_model.generators import as_bytes, random_packet, random_rule
+
+
+def test_profiled_classifier_decides_like_classifier():
+    rng = random.Random(3)
+    system = RuleSystem(rule_cache_size=0)
+    for _ in range(100):
+        rule = system.create_rule_from_raw_str(random_rule(rng), "", "")
+        system.append_rule("FILTER", "INPUT", rule)
+    classifier = system.get_classifier("FILTER", "INPUT")
+    profiler = Profiler()
+    profiled = ProfiledClassifier(classifier, profiler, "FILTER", "INPUT")
+    decided = 0
+    for _ in range(300):
+        raw = random_packet(rng)
+        rule, result = classifier.decide(all.IP(raw))
+        profiled_rule, profiled_result = profiled.decide(all.IP(raw))
+        assert profiled_rule == rule
+        assert as_bytes(profiled_result) == as_bytes(result)
+        decided += rule is not None
+
+    chain = profiler.chains[("FILTER", "INPUT")]
+    assert chain.calls == 300
+    assert chain.matches == decided
+    for (table, chain_name, index, text), profile in profiler.rules.items():
+        assert text == system.get_rule("FILTER", "INPUT", index).raw_form
+        assert profile.timing.matches <= profile.timing.calls
+        # a condition is only checked if the ones before it were met
+        calls = profile.timing.calls
+        for timing in profile.conditions.values():
+            assert timing.calls <= calls
+            calls = timing.matches
+
+
+def test_profiled_rule_run():
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A INPUT -p tcp --dport 22 -j DROP", "", ""
+    )
+    profiler = Profiler()
+    for dport in [22, 22, 80]:
+        packet = all.IP() / all.TCP(dport=dport)
+        assert rule.run_on_packet(packet, profiler) == rule.run_on_packet(packet)
+    profile = profiler.rules[("FILTER", "INPUT", None, rule.raw_form)]
+    assert (profile.timing.calls, profile.timing.matches) == (3, 2)
+    assert [(t.calls, t.matches) for t in profile.conditions.values()] == [
+        (3, 3),
+        (3, 2),
+    ]
+    assert profiler.components["check_tcp_dport"].calls == 3
+    assert profiler.components["drop_action"].matches == 2
+
+
+def test_profiling_report(tmp_path):
+    system = RuleSystem()
+    for raw in [
+        "iptables -t filter -A FORWARD -s 10.0.0.0/8 -j ACCEPT",
+        "iptables -t filter -A FORWARD -p tcp -j DROP",
+    ]:
+        system.append_rule(
+            "FILTER", "FORWARD", system.create_rule_from_raw_str(raw, "", "")
+        )
+    input_file = os.path.join("pcaps", "example.pcap")
+    expected = system.run_chain_on_raw_packets(
+        input_file, str(tmp_path / "plain.pcap"), "FILTER", "FORWARD"
+    )
+    profiler = Profiler()
+    statistics = system.run_chain_on_raw_packets(
+        input_file,
+        str(tmp_path / "profiled.pcap"),
+        "FILTER",
+        "FORWARD",
+        vectorized=True,
+        processes=2,
+        profiler=profiler,
+    )
+    assert statistics == expected
+    with open(tmp_path / "plain.pcap", "rb") as plain, open(
+        tmp_path / "profiled.pcap", "rb"
+    ) as profiled:
+        assert plain.read() == profiled.read()
+
+    report = json.loads(profiler.to_json())
+    assert report["chains"][0]["calls"] == statistics.packets
+    totals = [entry["total_ms"] for entry in report["rules"]]
+    assert totals == sorted(totals, reverse=True)
+    assert {entry["component"] for entry in report["components"]} >= {
+        "classifier index",
+        "drop_action",
+    }
+    text = profiler.format_report()
+    assert "FILTER FORWARD #1 iptables -t filter -A FORWARD -p tcp -j DROP" in text
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+import scapy.all as all
+
+from IPTables_Guide.model.packets import Packet, PacketManager
+from IPTables_Guide.model.replay import *
+from IPTables_Guide.model.rule_system import RuleSystem
+
+
+def rule_system():
+    system = RuleSystem(rule_cache_size=0)
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A INPUT -p tcp --dport 22 -j DROP", "", ""
+    )
+    system.append_rule("FILTER", "INPUT", rule)
+    return system
+
+
+def capture(count, gap):
+    packets = []
+    for i in range(count):
+        packet = all.Ether() / all.IP() / all.TCP(dport=22 if i % 2 else 80)
+        packet.time = 1000 + i * gap
+        packets.append(packet)
+    return packets
+
+
+def test_replay_keeps_capture_pace():
+    system = rule_system()
+    samples = []
+    driver = ReplayDriver(
+        system, "FILTER", "INPUT", speed=2.0, interval=0.05, on_sample=samples.append
+    )
+    report = asyncio.run(driver.run(capture(6, 0.04)))
+    # 0.2 capture seconds at twice the speed
+    assert report.elapsed >= 0.1
+    assert (report.packets, report.accepted, report.dropped) == (6, 3, 3)
+    assert report.samples == samples
+    assert sum(sample.packets for sample in samples) == 6
+    assert report.kept_up
+    assert system.get_rules_in_chain("FILTER", "INPUT")[0].packets == 3
+
+
+def test_replay_reports_lag(tmp_path):
+    system = rule_system()
+    manager = PacketManager()
+    for packet in capture(50, 0):
+        manager.add_packet(Packet(packet))
+    driver = ReplayDriver(
+        system, "FILTER", "INPUT", speed=None, queue_size=4, lag_limit=-1
+    )
+    report = asyncio.run(driver.run(manager))
+    assert report.packets == 50
+    assert report.max_lag > 0 and not report.kept_up
+    assert report.samples[-1].queue_depth == 0
+
+    all.wrpcap(str(tmp_path / "in.pcap"), capture(10, 0.001))
+    report = system.replay_raw_packets(
+        str(tmp_path / "in.pcap"), str(tmp_path / "out.pcap"), "FILTER", "INPUT", 10
+    )
+    assert report.accepted == 5
+    assert len(all.rdpcap(str(tmp_path / "out.pcap"))) == 5
+
+
+def test_replay_raises_reader_errors():
+    def failing():
+        yield from capture(3, 0)
+        raise ValueError("truncated")
+
+    system = rule_system()
+    driver = ReplayDriver(system, "FILTER", "INPUT", speed=None)
+    with pytest.raises(ValueError):
+        asyncio.run(asyncio.wait_for(driver.run(failing()), 5))
+    assert system.get_rules_in_chain("FILTER", "INPUT")[0].packets == 1
+
+    frames = [bytes(packet) for packet in capture(4, 0)]
+    driver = ReplayDriver(system, "FILTER", "INPUT")
+    with pytest.raises(TypeError):
+        asyncio.run(asyncio.wait_for(driver.run(frames), 5))
+    driver = ReplayDriver(system, "FILTER", "INPUT", speed=None)
+    assert asyncio.run(asyncio.wait_for(driver.run(frames), 5)).accepted == 2
@@ -147,3 +147,46 @@ def test_Rule():
     assert rule.set_value(0, "don't delete me")
     assert rule.components == [{"str_form": "-t ", "value": "don't delete me"}]
     assert not rule.set_value(100, "wont work")
+
+
+class MockKeyedRuleSpec:
+    def __init__(self, first_token):
+        self.first_tokens = [first_token]
+        self.calls = 0
+
+    def find_fit(self, substr):
+        self.calls += 1
+        if substr[0] not in self.first_tokens:
+            return None
+        return ({"str_form": " ".join(substr[:2])}, substr[2:])
+
+
+def test_RuleSpecification_dispatch():
+    source = MockKeyedRuleSpec("-s")
+    jump = MockKeyedRuleSpec("-j")
+    component = RuleSpecification([jump, source])
+    assert component.find_fit(["-s", "1.1.1.1", "-j", "DROP", "x"]) == (
+        [{"str_form": "-s 1.1.1.1"}, {"str_form": "-j DROP"}],
+        ["x"],
+    )
+    assert source.calls == 1
+    assert jump.calls == 1
+
+
+class CountingStartComponent(StartComponent):
+    calls = 0
+
+    def find_fit(self, substr):
+        CountingStartComponent.calls += 1
+        return super().find_fit(substr)
+
+
+def test_SignatureGrammar_shares_prefix():
+    start_strings = {"hi": {"str_form": "hi"}}
+    signatures = [
+        [CountingStartComponent(start_strings), RuleSpecification([MockRuleSpec(0)])],
+        [CountingStartComponent(start_strings), RuleSpecification([MockRuleSpec(1)])],
+    ]
+    rule = Rule("hi there", signatures, "", "")
+    assert CountingStartComponent.calls == 1
+    assert rule.components == [{"str_form": "hi"}, {"test": "value"}]
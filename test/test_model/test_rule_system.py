@@ -1 +1,155 @@
 from IPTables_Guide.model.rule_system import *
+
+
+def test_rule_cache():
+    system = RuleSystem(rule_cache_size=1)
+    raw = "iptables -t filter -A INPUT -p tcp --sport 80 -j DROP"
+    rule = system.create_rule_from_raw_str(raw, "", "")
+    cached = system.create_rule_from_raw_str(raw, "", "")
+    assert system.rule_cache.hits == 1
+    assert system.rule_cache.misses == 1
+    assert cached.components == rule.components
+    assert cached.components is not rule.components
+    assert (cached.table, cached.chain) == ("filter", "INPUT")
+    assert cached.get_str_form() == raw
+
+    cached.set_value(5, 81)
+    assert system.create_rule_from_raw_str(raw, "", "").components[5]["value"] == 80
+
+    system.create_rule_from_raw_str("iptables -t filter -A INPUT", "", "")
+    assert system.rule_cache.evictions == 1
+    assert len(system.rule_cache) == 1
+
+
+def test_incremental_rule_parser():
+    system = RuleSystem(rule_cache_size=0)
+    parser = system.create_rule_parser("", "")
+    raw = "iptables -t nat -A PREROUTING -p udp --dport 53 -j DNAT --to-destination 10.0.0.1"
+    for end in list(range(1, len(raw) + 1)) + [20, len(raw), 9, len(raw)]:
+        text = raw[:end]
+        rule, result = parser.parse(text)
+        fresh = system.create_rule_from_raw_str(text, "", "")
+        assert rule.components == fresh.components
+        assert (rule.table, rule.chain) == (fresh.table, fresh.chain)
+    assert result.diagnostics == []
+    assert result.remaining == []
+
+    rule, result = parser.parse("iptables -t nat -A PREROUTING foo")
+    assert result.remaining == ["foo"]
+    assert result.diagnostics == ["unrecognised element at position 5: foo"]
+
+
+def test_incremental_rule_parser_reuses_options(monkeypatch):
+    calls = []
+
+    def counted(find_fit):
+        def counting_find_fit(self, substr):
+            calls.append(substr[0])
+            return find_fit(self, substr)
+
+        return counting_find_fit
+
+    for parser_class in [SourceParser, DestinationParser, StateParser, JumpParser]:
+        monkeypatch.setattr(parser_class, "find_fit", counted(parser_class.find_fit))
+    system = RuleSystem(rule_cache_size=0)
+    parser = system.create_rule_parser("", "")
+    raw = (
+        "iptables -t filter -A INPUT --state NEW -s 10.0.0.0/8 -d 10.0.0.1 "
+        "-p tcp --dport 80 -j ACCEPT"
+    )
+    parser.parse(raw[: raw.index(" -j")])
+    calls.clear()
+    rule, result = parser.parse(raw)
+    # only the new option is parsed, by the tcp signature
+    assert calls == ["-j"]
+    fresh = system.create_rule_from_raw_str(raw, "", "")
+    assert rule.components == fresh.components
+    assert result.remaining == []
+
+    calls.clear()
+    edited = raw.replace("-d 10.0.0.1", "-d 10.0.0.2")
+    rule, result = parser.parse(edited)
+    # only the changed option, -j looks at the same tokens after it
+    assert calls == ["-d"]
+    fresh = system.create_rule_from_raw_str(edited, "", "")
+    assert rule.components == fresh.components
+
+
+def test_compiled_rule_matcher():
+    system = RuleSystem(rule_cache_size=0)
+    rule = system.create_rule_from_raw_str(
+        "iptables -t nat -A PREROUTING -p udp --dport 53 -s 10.0.0.0/8 "
+        "-j DNAT --to-destination 10.1.1.1:5353",
+        "",
+        "",
+    )
+    packet = all.IP(src="10.2.3.4", dst="10.0.0.1") / all.UDP(sport=7, dport=53)
+    predicate, target = rule.matcher()
+    assert rule.matcher() == (predicate, target)
+    assert predicate(packet)
+    assert not predicate(all.IP(src="11.2.3.4") / all.UDP(dport=53))
+    assert not predicate(all.IP(src="10.2.3.4") / all.TCP(dport=53))
+
+    matched, result = rule.run_on_packet(packet)
+    assert matched and result[all.IP].dst == "10.1.1.1"
+    assert result[all.UDP].dport == 5353
+
+    rule.set_value(5, 54)
+    assert rule.matcher()[0] is not predicate
+    assert not rule.matcher()[0](all.IP(src="10.2.3.4") / all.UDP(dport=53))
+    assert rule.matcher()[0](all.IP(src="10.2.3.4") / all.UDP(dport=54))
+
+
+def test_evaluate_packets():
+    from IPTables_Guide.model.packets import Packet, PacketManager
+
+    system = RuleSystem(rule_cache_size=0)
+    for raw in [
+        "iptables -t filter -A INPUT -p tcp --dport 22 -j DROP",
+        "iptables -t filter -A INPUT -p udp -j ACCEPT",
+        "iptables -t nat -A PREROUTING -p tcp --dport 80 "
+        "-j DNAT --to-destination 10.0.0.1:8080",
+    ]:
+        rule = system.create_rule_from_raw_str(raw, "", "")
+        system.append_rule(rule.table, rule.chain, rule)
+    system.policy("FILTER", "INPUT", "DROP")
+    manager = PacketManager()
+    manager.add_packet(Packet(all.Ether() / all.IP() / all.UDP(dport=53)))
+    packets = [
+        all.Ether() / all.IP() / all.TCP(dport=22),
+        bytes(all.Ether() / all.IP() / all.UDP(dport=53)),
+        all.Ether() / all.IP() / all.TCP(dport=80),
+    ] + list(manager)
+
+    verdicts = system.evaluate_packets(packets, "FILTER", "INPUT")
+    assert system.get_policy_counters("FILTER", "INPUT") == (0, 0)
+    assert [(v.verdict, v.rule_index) for v in verdicts] == [
+        ("DROP", 0),
+        ("ACCEPT", 1),
+        ("DROP", None),
+        ("ACCEPT", 1),
+    ]
+    assert system.get_policy_counters("FILTER", "INPUT")[0] == 1
+
+    batches = list(system.evaluate_batches(manager, "NAT", "PREROUTING", 2))
+    assert [len(batch) for batch in batches] == [1]
+    batches = list(system.evaluate_batches(packets, "NAT", "PREROUTING", 3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    result = batches[0][2]
+    assert result.rule_index == 0
+    assert result.packet[all.IP].dst == "10.0.0.1"
+    assert result.packet[all.TCP].dport == 8080
+    # the packets come back as they were given
+    assert batches[0][1].packet == packets[1]
+    assert batches[1][0].packet is packets[3]
+
+    frame = bytes(all.Ether() / all.IP() / all.TCP(dport=80))
+    (result,) = system.evaluate_packets([frame], "NAT", "PREROUTING")
+    assert isinstance(result.packet, bytes)
+    assert all.Ether(result.packet)[all.TCP].dport == 8080
+    (result,) = system.evaluate_packets([Packet(all.Ether(frame))], "NAT", "PREROUTING")
+    assert result.packet.get_scapy_packet()[all.TCP].dport == 8080
+
+    assert system.run_on_packet(packets[0], "FILTER", "INPUT") is None
+    result = system.run_on_packet(packets[2], "NAT", "PREROUTING")
+    assert result[all.TCP].dport == 8080
@@ -0,0 +1,100 @@
+import scapy.all as all
+
+from IPTables_Guide.model.headers import HeaderView, LINKTYPE_ETHERNET, as_scapy
+from IPTables_Guide.model.rule_system import *
+
+
+def traversal_system():
+    system = RuleSystem()
+    for table, chain, raw in [
+        (
+            "NAT",
+            "PREROUTING",
+            "iptables -t nat -A PREROUTING -p tcp --dport 80 "
+            "-j DNAT --to-destination 10.0.0.1:8080",
+        ),
+        (
+            "FILTER",
+            "INPUT",
+            "iptables -t filter -A INPUT -p tcp --dport 22 -j DROP",
+        ),
+        (
+            "FILTER",
+            "FORWARD",
+            "iptables -t filter -A FORWARD -p tcp --dport 80 -j DROP",
+        ),
+        (
+            "NAT",
+            "POSTROUTING",
+            "iptables -t nat -A POSTROUTING -p udp -j SNAT --to-source 1.2.3.4",
+        ),
+    ]:
+        system.append_rule(table, chain, system.create_rule_from_raw_str(raw, "", ""))
+    return system
+
+
+def view(packet):
+    return HeaderView(bytes(all.Ether() / packet), LINKTYPE_ETHERNET)
+
+
+def test_traversal_follows_hook_order():
+    system = traversal_system()
+    traversal = system.create_traversal(["10.0.0.0/24"])
+
+    # DNAT to a local address, so INPUT decides instead of FORWARD
+    result = traversal.run_on_packet(view(all.IP(dst="8.8.8.8") / all.TCP(dport=80)))
+    assert result is not None
+    result = as_scapy(result)
+    assert result[all.IP].dst == "10.0.0.1"
+    assert result[all.TCP].dport == 8080
+
+    local_ssh = view(all.IP(dst="10.0.0.5") / all.TCP(dport=22))
+    assert traversal.run_on_packet(local_ssh) is None
+    local_telnet = view(all.IP(dst="10.0.0.5") / all.TCP(dport=23))
+    assert traversal.run_on_packet(local_telnet) is local_telnet
+
+    # forwarded packets go through FORWARD and POSTROUTING
+    result = traversal.run_on_packet(view(all.IP(dst="8.8.8.8") / all.UDP(dport=53)))
+    assert as_scapy(result)[all.IP].src == "1.2.3.4"
+    local_udp = view(all.IP(dst="10.0.0.5") / all.UDP())
+    assert traversal.run_on_packet(local_udp) is local_udp
+    assert not local_udp.dissected
+
+
+def test_traversal_statistics_and_policies():
+    system = traversal_system()
+    system.policy("FILTER", "FORWARD", "DROP")
+    traversal = system.create_traversal(["10.0.0.0/24"])
+    assert traversal.run_on_packet(view(all.IP(dst="8.8.8.8") / all.UDP())) is None
+    assert (
+        traversal.run_on_packet(view(all.IP(dst="10.0.0.9") / all.TCP(dport=22)))
+        is None
+    )
+    statistics = traversal.statistics
+    assert statistics[("NAT", "PREROUTING")].packets == 2
+    assert statistics[("FILTER", "FORWARD")].passed == 0
+    assert statistics[("FILTER", "INPUT")].rule_packets == {0: 1}
+    assert statistics[("NAT", "INPUT")].packets == 0
+    assert statistics[("NAT", "POSTROUTING")].packets == 0
+
+
+def test_traversal_on_raw_packets(tmp_path):
+    system = traversal_system()
+    packets = [
+        all.Ether() / all.IP(dst="8.8.8.8") / all.TCP(dport=80),
+        all.Ether() / all.IP(dst="8.8.8.8") / all.TCP(dport=443),
+        all.Ether() / all.IP(dst="8.8.8.8") / all.UDP(dport=53),
+    ]
+    all.wrpcap(str(tmp_path / "in.pcap"), packets)
+    statistics = system.run_traversal_on_raw_packets(
+        str(tmp_path / "in.pcap"), str(tmp_path / "out.pcap")
+    )
+    output = all.rdpcap(str(tmp_path / "out.pcap"))
+    # FORWARD already sees the port PREROUTING rewrote
+    assert [packet[all.IP].dst for packet in output] == [
+        "10.0.0.1",
+        "8.8.8.8",
+        "8.8.8.8",
+    ]
+    assert output[2][all.IP].src == "1.2.3.4"
+    assert statistics[("FILTER", "FORWARD")].rule_packets == {}
@@ -0,0 +1,89 @@
+import os
+import random
+
+import numpy as np
+import scapy.all as all
+
+from IPTables_Guide.model.rule_system import *
+from IPTables_Guide.model.vectorized import *
+from test.test_model.generators import as_bytes, random_packet, random_rule
+
+
+def test_vectorized_chain_matches_classifier():
+    rng = random.Random(1)
+    system = RuleSystem(rule_cache_size=0)
+    for i in range(200):
+        raw = random_rule(rng)
+        # rules without a target only count
+        for raw in [raw.split(" -j ")[0], raw] if i % 4 == 0 else [raw]:
+            rule = system.create_rule_from_raw_str(raw, "", "")
+            assert system.append_rule("FILTER", "INPUT", rule)
+    classifier = system.get_classifier("FILTER", "INPUT")
+    raw_packets = [random_packet(rng) for _ in range(1000)]
+
+    packets = [all.IP(raw) for raw in raw_packets]
+    verdicts = evaluate_chain(classifier, packets)
+    for i, raw in enumerate(raw_packets):
+        matched = []
+        rule, expected = classifier.decide(all.IP(raw), 0, matched)
+        assert verdicts.rule_index[i] == (-1 if rule is None else rule.index)
+        assert verdicts.matched.get(i, []) == matched
+        if expected is None:
+            assert verdicts.verdict[i] == VERDICT_POLICY
+        elif expected == "DROP":
+            assert verdicts.verdict[i] == VERDICT_DROP
+        else:
+            assert verdicts.verdict[i] == VERDICT_ACCEPT
+            assert as_bytes(verdicts.results.get(i, packets[i])) == bytes(expected)
+
+
+def test_extract_columns():
+    columns = extract_columns(
+        [
+            all.IP(src="10.0.0.1", dst="10.0.0.2") / all.TCP(sport=1, dport=2),
+            all.IP(src="10.0.0.3", dst="10.0.0.4") / all.UDP(sport=3, dport=4),
+            all.IP(src="10.0.0.5", dst="10.0.0.6") / all.ICMP(),
+        ]
+    )
+    assert len(columns) == 3
+    assert columns.protocol.tolist() == [6, 17, 0]
+    assert columns.src.tolist() == [0x0A000001, 0x0A000003, 0x0A000005]
+    assert columns.dport.tolist() == [2, 4, -1]
+    assert columns.has_ip.all()
+    assert columns.dst.dtype == np.uint32
+
+
+def test_vectorized_pcap_operation(tmp_path):
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A FORWARD -p tcp -j DROP", "", ""
+    )
+    system.append_rule(Table("FILTER"), Chain("FORWARD"), rule)
+    system.run_chain_on_raw_packets(
+        os.path.join("pcaps", "example.pcap"),
+        str(tmp_path / "out.pcap"),
+        Table("FILTER"),
+        Chain("FORWARD"),
+        vectorized=True,
+    )
+    with open(tmp_path / "out.pcap", "rb") as f_1:
+        with open(os.path.join("pcaps", "expected.pcap"), "rb") as f_2:
+            assert f_1.read() == f_2.read()
+
+
+def test_evaluate_stream_in_chunks():
+    rng = random.Random(3)
+    system = RuleSystem(rule_cache_size=0)
+    for _ in range(50):
+        rule = system.create_rule_from_raw_str(random_rule(rng), "", "")
+        system.append_rule("FILTER", "INPUT", rule)
+    classifier = system.get_classifier("FILTER", "INPUT")
+    packets = [all.IP(random_packet(rng)) for _ in range(300)]
+    verdicts = evaluate_chain(classifier, [packet.copy() for packet in packets])
+    streamed = list(evaluate_stream(classifier, packets, chunk_size=7))
+    assert [packet for packet, _, _, _, _ in streamed] == packets
+    for i, (packet, rule_index, verdict, result, matched) in enumerate(streamed):
+        assert rule_index == verdicts.rule_index[i]
+        assert verdict == verdicts.verdict[i]
+        assert as_bytes(result) == as_bytes(verdicts.results.get(i))
+        assert matched == verdicts.matched.get(i, [])
@@ -0,0 +1,98 @@
+import os
+import random
+
+import scapy.all as all
+
+from IPTables_Guide.model.rule_system import *
+from IPTables_Guide.model.verdict_cache import *
+from test.test_model.generators import as_bytes, random_packet, random_rule
+
+
+def test_cached_classifier_decides_like_classifier():
+    rng = random.Random(4)
+    system = RuleSystem(rule_cache_size=0)
+    for i in range(100):
+        raw = random_rule(rng)
+        # rules without a target only count
+        for raw in [raw.split(" -j ")[0], raw] if i % 4 == 0 else [raw]:
+            rule = system.create_rule_from_raw_str(raw, "", "")
+            system.append_rule("FILTER", "INPUT", rule)
+    classifier = system.get_classifier("FILTER", "INPUT")
+    cached = CachedClassifier(classifier, system.get_verdict_cache("FILTER", "INPUT"))
+    assert cached.cacheable
+    raw_packets = [random_packet(rng) for _ in range(50)]
+    for _ in range(1000):
+        raw = rng.choice(raw_packets)
+        matched, cached_matched = [], []
+        rule, result = classifier.decide(all.IP(raw), 0, matched)
+        cached_rule, cached_result = cached.decide(all.IP(raw), 0, cached_matched)
+        assert cached_rule == rule
+        assert as_bytes(cached_result) == as_bytes(result)
+        assert cached_matched == matched
+    assert cached.hits > cached.misses
+
+
+def test_inspected_fields():
+    system = RuleSystem()
+    for raw in [
+        "iptables -t filter -A INPUT -p tcp --dport 22 -j DROP",
+        "iptables -t filter -A INPUT -d 10.0.0.0/8 --state NEW -j ACCEPT",
+    ]:
+        system.append_rule(
+            "FILTER", "INPUT", system.create_rule_from_raw_str(raw, "", "")
+        )
+        classifier = system.get_classifier("FILTER", "INPUT")
+    assert classifier.inspected_fields() == ("protocol", "dst", "dport", "ct_state")
+    assert system.get_classifier("FILTER", "FORWARD").inspected_fields() == ()
+
+
+def test_verdict_cache_between_runs(tmp_path):
+    system = RuleSystem()
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A FORWARD -p tcp -j DROP", "", ""
+    )
+    system.append_rule("FILTER", "FORWARD", rule)
+    input_file = os.path.join("pcaps", "example.pcap")
+    expected = system.run_chain_on_raw_packets(
+        input_file, str(tmp_path / "plain.pcap"), "FILTER", "FORWARD"
+    )
+    first = system.run_chain_on_raw_packets(
+        input_file,
+        str(tmp_path / "first.pcap"),
+        "FILTER",
+        "FORWARD",
+        cache_verdicts=True,
+    )
+    with open(tmp_path / "plain.pcap", "rb") as plain, open(
+        tmp_path / "first.pcap", "rb"
+    ) as cached:
+        assert plain.read() == cached.read()
+    assert first.rule_packets == expected.rule_packets
+    assert first.cache_hits + first.cache_misses == first.packets
+    # only the protocol is looked at: tcp, udp and neither
+    assert first.cache_misses == 3
+    second = system.run_chain_on_raw_packets(
+        input_file,
+        str(tmp_path / "second.pcap"),
+        "FILTER",
+        "FORWARD",
+        cache_verdicts=True,
+    )
+    assert second.cache_hit_rate == 1.0
+
+    generation = system.generation
+    rule = system.create_rule_from_raw_str(
+        "iptables -t filter -A FORWARD -p udp -j DROP", "", ""
+    )
+    system.insert_rule("FILTER", "FORWARD", rule, 0)
+    assert system.generation > generation
+    assert len(system.get_verdict_cache("FILTER", "FORWARD")) == 0
+    third = system.run_chain_on_raw_packets(
+        input_file,
+        str(tmp_path / "third.pcap"),
+        "FILTER",
+        "FORWARD",
+        cache_verdicts=True,
+    )
+    assert third.cache_misses == 3
+    assert third.rule_packets[1] == expected.rule_packets[0]